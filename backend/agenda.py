@@ -0,0 +1,156 @@
+"""Per-doctor day agenda: every slot of the day in time order, with the patient
+and reason of the appointment that holds it.
+
+Days are cached per ``(doctor_id, date)``. Booking, cancellation, completion
+and rescheduling patch the one affected entry; slot and schedule changes
+rebuild or drop the doctor's cached days. Other workers drop the same days
+through the invalidation bus. The TTL only bounds how long a day can miss a
+change made outside those paths (archiving, manual SQL).
+"""
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+import models
+import schedules
+from config import settings
+from invalidation import cache_bus
+
+
+def _appointments(db: Session, slot_ids):
+    """slot_id -> active (not cancelled) appointment fields."""
+    if not slot_ids:
+        return {}
+    rows = db.query(
+        models.Appointment.slot_id, models.Appointment.id, models.Appointment.status,
+        models.Appointment.reason, models.Appointment.patient_id, models.User.full_name,
+        models.User.phone,
+    ).outerjoin(models.User, models.Appointment.patient_id == models.User.id).filter(
+        models.Appointment.slot_id.in_(slot_ids),
+        models.Appointment.status != models.AppointmentStatus.cancelled,
+    )
+    return {
+        r.slot_id: {
+            "id": r.id,
+            "status": r.status.value,
+            "reason": r.reason,
+            "patient_id": r.patient_id,
+            "patient_name": r.full_name,
+            "patient_phone": r.phone,
+        }
+        for r in rows
+    }
+
+
+def _entry(slot, appointment) -> dict:
+    get = slot.get if isinstance(slot, dict) else lambda k: getattr(slot, k)
+    return {
+        "slot_id": get("id"),
+        "start_time": get("start_time"),
+        "end_time": get("end_time"),
+        "is_booked": get("is_booked"),
+        "appointment": appointment,
+    }
+
+
+def build_day(db: Session, doctor_id: int, day: str):
+    """``{start_time: entry}`` for one doctor and day, straight from the database."""
+    slots = schedules.list_slots(db, doctor_id, day)
+    ids = [s["id"] if isinstance(s, dict) else s.id for s in slots]
+    appts = _appointments(db, [i for i in ids if i is not None])
+    return {e["start_time"]: e for e in (_entry(s, appts.get(i)) for s, i in zip(slots, ids))}
+
+
+class AgendaCache:
+    def __init__(self, ttl: int, max_days: int):
+        self.ttl = ttl
+        self.max_days = max_days
+        self._lock = threading.Lock()
+        self._days = OrderedDict()  # (doctor_id, day) -> (built_at, {start_time: entry})
+        # doctor_id -> count of changes seen; a day built across a change is not stored
+        self._generations = defaultdict(int)
+
+    def day(self, db: Session, doctor_id: int, day: str):
+        key = (doctor_id, day)
+        with self._lock:
+            cached = self._days.get(key)
+            if cached and time.monotonic() - cached[0] < self.ttl:
+                self._days.move_to_end(key)
+                return cached[1]
+            generation = self._generations[doctor_id]
+        entries = build_day(db, doctor_id, day)
+        self._store(key, entries, generation)
+        return entries
+
+    def _changed(self, doctor_id: int) -> int:
+        with self._lock:
+            self._generations[doctor_id] += 1
+            return self._generations[doctor_id]
+
+    def _store(self, key, entries, generation: int):
+        with self._lock:
+            if self._generations[key[0]] != generation:
+                return
+            self._days[key] = (time.monotonic(), entries)
+            self._days.move_to_end(key)
+            while len(self._days) > self.max_days:
+                self._days.popitem(last=False)
+
+    def refresh_slot(self, db: Session, slot: models.Slot):
+        """Re-read the entry for one stored slot (booked, freed, completed...)."""
+        key = (slot.doctor_id, slot.slot_date)
+        cache_bus.publish("agenda", f"{slot.doctor_id}:{slot.slot_date}", local=False)
+        self._changed(slot.doctor_id)
+        with self._lock:
+            cached = self._days.get(key)
+        if not cached:
+            return
+        entry = _entry(slot, _appointments(db, [slot.id]).get(slot.id))
+        with self._lock:
+            # Copy on write: readers may be iterating the old dict
+            if self._days.get(key) is cached:
+                self._days[key] = (cached[0], {**cached[1], slot.start_time: entry})
+
+    def refresh_day(self, db: Session, doctor_id: int, day: str):
+        """Rebuild a cached day after slots were added or removed."""
+        key = (doctor_id, day)
+        cache_bus.publish("agenda", f"{doctor_id}:{day}", local=False)
+        generation = self._changed(doctor_id)
+        with self._lock:
+            cached = key in self._days
+        if cached:
+            self._store(key, build_day(db, doctor_id, day), generation)
+
+    def invalidate_doctor(self, doctor_id: int):
+        cache_bus.publish("agenda", doctor_id, local=False)
+        self.drop(doctor_id)
+
+    def drop(self, doctor_id: int, day: str = None):
+        """Forget cached days in this worker only."""
+        with self._lock:
+            self._generations[doctor_id] += 1
+            for key in [k for k in self._days if k[0] == doctor_id and day in (None, k[1])]:
+                del self._days[key]
+
+
+agenda_cache = AgendaCache(ttl=settings.AGENDA_CACHE_TTL_SECONDS, max_days=settings.AGENDA_CACHE_MAX_DAYS)
+
+
+def _on_invalidate(key: str):
+    doctor_id, _, day = key.partition(":")
+    agenda_cache.drop(int(doctor_id), day or None)
+
+
+cache_bus.subscribe("agenda", _on_invalidate)
+
+
+def get_agenda(db: Session, doctor_id: int, start: str, days: int = 1):
+    """Agenda for ``days`` consecutive days from ``start``, each in time order."""
+    first = datetime.strptime(start, "%Y-%m-%d").date()
+    result = []
+    for offset in range(days):
+        day = (first + timedelta(days=offset)).strftime("%Y-%m-%d")
+        entries = agenda_cache.day(db, doctor_id, day)
+        result.append({"date": day, "slots": [entries[t] for t in sorted(entries)]})
+    return result
@@ -0,0 +1,180 @@
+import logging
+import threading
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import schedules
+from config import settings
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = ("booked", "cancelled", "completed")
+
+
+def _upsert(db: Session, doctor_id: int, day: str, values: dict, **fields):
+    """Apply ``values`` to the doctor's rollup row for ``day``, creating it with ``fields`` if missing."""
+    t = models.DailyRollup
+    q = db.query(t).filter(t.day == day, t.doctor_id == doctor_id)
+    if q.update(values, synchronize_session=False):
+        return
+    spec_id = db.query(models.Doctor.specialization_id).filter(models.Doctor.id == doctor_id).scalar()
+    try:
+        with db.begin_nested():
+            db.add(t(day=day, doctor_id=doctor_id, specialization_id=spec_id, **fields))
+    except IntegrityError:
+        # Row was created concurrently
+        q.update(values, synchronize_session=False)
+
+
+def record(db: Session, slot, **deltas):
+    """Add ``deltas`` (e.g. ``booked=1``) to the rollup row for the slot's doctor and day.
+
+    Runs inside the caller's transaction, so the counters commit or roll back
+    together with the booking change itself.
+    """
+    t = models.DailyRollup
+    _upsert(db, slot.doctor_id, slot.slot_date, {getattr(t, k): getattr(t, k) + v for k, v in deltas.items()}, **deltas)
+
+
+def refresh_offered(db: Session, doctor_id: int, start: str, end: Optional[str] = None):
+    """Recount ``slots_offered`` in the doctor's rollups for ``start``..``end`` (inclusive).
+
+    Called in the caller's transaction whenever the doctor's slots, schedule
+    rules or exceptions change. The range is clipped to the rebuild window
+    behind today and the schedule horizon ahead of it (also the default
+    ``end``); the periodic refresh moves the horizon forward and
+    POST /admin/analytics/rebuild covers the rest.
+    """
+    today = datetime.now().date()
+    start = max(datetime.strptime(start, "%Y-%m-%d").date(), today - timedelta(days=settings.ANALYTICS_REBUILD_DAYS))
+    horizon = today + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)
+    end = min(datetime.strptime(end, "%Y-%m-%d").date(), horizon) if end else horizon
+    if start > end:
+        return
+    db.flush()  # count the caller's pending edits
+    counts = defaultdict(int)
+    for day, _ in schedules.offered_times(db, doctor_id, start, end):
+        counts[day] += 1
+
+    t = models.DailyRollup
+    rows = dict(db.query(t.day, t.id).filter(
+        t.doctor_id == doctor_id, t.day >= start.strftime("%Y-%m-%d"), t.day <= end.strftime("%Y-%m-%d"),
+    ))
+    db.bulk_update_mappings(t, [{"id": id_, "slots_offered": counts.get(day, 0)} for day, id_ in rows.items()])
+    for day, n in counts.items():
+        if day not in rows:
+            _upsert(db, doctor_id, day, {t.slots_offered: n}, slots_offered=n)
+
+
+def offered_slots(db: Session, start: str, end: str) -> dict:
+    """(day, doctor_id) -> slots offered, for ``start``..``end`` (inclusive) up to the schedule horizon."""
+    first = datetime.strptime(start, "%Y-%m-%d").date()
+    last = min(datetime.strptime(end, "%Y-%m-%d").date(), datetime.now().date() + timedelta(days=settings.SCHEDULE_HORIZON_DAYS))
+    doctor_ids = {r[0] for r in db.query(models.ScheduleRule.doctor_id).distinct()}
+    for slot_model in (models.Slot, models.ArchivedSlot):
+        doctor_ids.update(r[0] for r in db.query(slot_model.doctor_id).filter(
+            slot_model.slot_date >= start, slot_model.slot_date <= end,
+        ).distinct())
+    counts = defaultdict(int)
+    for doctor_id in doctor_ids:
+        for day, _ in schedules.offered_times(db, doctor_id, first, last):
+            counts[(day, doctor_id)] += 1
+    return counts
+
+
+def rebuild(db: Session, start: Optional[str] = None, end: Optional[str] = None) -> int:
+    """Recompute the rollups for ``start``..``end`` (inclusive) from the live and archive tables."""
+    today = datetime.now().date()
+    start = start or (today - timedelta(days=settings.ANALYTICS_REBUILD_DAYS)).strftime("%Y-%m-%d")
+    end = end or (today + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)).strftime("%Y-%m-%d")
+
+    stats = defaultdict(lambda: dict.fromkeys(COUNTERS + ("slots_offered",), 0))
+    for appt_model, slot_model in (
+        (models.Appointment, models.Slot),
+        (models.ArchivedAppointment, models.ArchivedSlot),
+    ):
+        rows = db.query(
+            slot_model.slot_date, slot_model.doctor_id, appt_model.status, func.count(appt_model.id)
+        ).join(slot_model, appt_model.slot_id == slot_model.id).filter(
+            slot_model.slot_date >= start, slot_model.slot_date <= end,
+        ).group_by(slot_model.slot_date, slot_model.doctor_id, appt_model.status)
+        for day, doctor_id, status, count in rows:
+            entry = stats[(day, doctor_id)]
+            entry["booked"] += count  # every appointment was booked once
+            if status in (models.AppointmentStatus.cancelled, models.AppointmentStatus.completed):
+                entry[status.value] += count
+
+    for key, count in offered_slots(db, start, end).items():
+        stats[key]["slots_offered"] = count
+
+    specs = dict(db.query(models.Doctor.id, models.Doctor.specialization_id))
+    db.query(models.DailyRollup).filter(
+        models.DailyRollup.day >= start, models.DailyRollup.day <= end,
+    ).delete(synchronize_session=False)
+    db.bulk_insert_mappings(models.DailyRollup, [
+        {"day": day, "doctor_id": doctor_id, "specialization_id": specs.get(doctor_id), **entry}
+        for (day, doctor_id), entry in stats.items()
+    ])
+    db.commit()
+    return len(stats)
+
+
+def refresh_all_offered():
+    """Recount slots offered for every doctor up to the schedule horizon.
+
+    Open-ended schedule rules offer a new day each time the horizon moves
+    forward, which no edit triggers.
+    """
+    db = SessionLocal()
+    try:
+        today = datetime.now().strftime("%Y-%m-%d")
+        for (doctor_id,) in db.query(models.Doctor.id).all():
+            refresh_offered(db, doctor_id, today)
+            db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Slots offered refresh failed: {e}")
+    finally:
+        db.close()
+
+
+def start_offered_scheduler():
+    if settings.ANALYTICS_OFFERED_REFRESH_HOURS <= 0:
+        return
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(settings.ANALYTICS_OFFERED_REFRESH_HOURS * 3600):
+            refresh_all_offered()
+
+    threading.Thread(target=loop, daemon=True, name="analytics-offered").start()
+    return stop
+
+
+def summary(db: Session, start: str, end: str, group_by: str = "doctor"):
+    """Aggregate the rollups in ``start``..``end`` by doctor, specialization or day."""
+    t = models.DailyRollup
+    key = {"doctor": t.doctor_id, "specialization": t.specialization_id, "day": t.day}[group_by]
+    rows = db.query(
+        key,
+        func.sum(t.booked), func.sum(t.cancelled), func.sum(t.completed), func.sum(t.slots_offered),
+    ).filter(t.day >= start, t.day <= end).group_by(key).order_by(key)
+
+    result = []
+    for k, booked, cancelled, completed, offered in rows:
+        booked, cancelled, completed, offered = (int(x or 0) for x in (booked, cancelled, completed, offered))
+        result.append({
+            "key": k,
+            "booked": booked,
+            "cancelled": cancelled,
+            "completed": completed,
+            "slots_offered": offered,
+            "cancellation_rate": round(cancelled / booked, 4) if booked else 0.0,
+            "utilisation": round((booked - cancelled) / offered, 4) if offered else None,
+        })
+    return result
@@ -0,0 +1,82 @@
+"""Lean appointment lists for /appointments/my and /appointments/all.
+
+Rows are read as plain columns (no ORM objects, no nested SlotOut/UserOut)
+and sent back as flat dicts, encoded with orjson when it is installed.
+"""
+from datetime import datetime
+from typing import Optional
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from sqlalchemy.orm import Session, aliased
+import models
+
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+    FastJSONResponse = JSONResponse
+
+FIELDS = (
+    "id", "status", "reason", "prescription_notes", "medications", "created_at",
+    "slot_id", "slot_date", "start_time", "end_time",
+    "doctor_id", "doctor_name", "specialization",
+    "patient_id", "patient_name",
+)
+
+
+def parse_fields(fields: Optional[str]):
+    """``fields=id,status,slot_date`` -> tuple of column names (all of them when empty)."""
+    if not fields:
+        return FIELDS
+    wanted = tuple(f.strip() for f in fields.split(",") if f.strip())
+    unknown = [f for f in wanted if f not in FIELDS]
+    if unknown:
+        raise HTTPException(400, f"Unknown fields: {', '.join(unknown)}. Allowed: {', '.join(FIELDS)}")
+    return wanted or FIELDS
+
+
+def flat_query(db: Session, appt_model, slot_model, patient_id=None, doctor_id=None):
+    patient = aliased(models.User)
+    doctor_user = aliased(models.User)
+    q = db.query(
+        appt_model.id, appt_model.status, appt_model.reason, appt_model.prescription_notes,
+        appt_model.medications, appt_model.created_at, appt_model.slot_id,
+        slot_model.slot_date, slot_model.start_time, slot_model.end_time, slot_model.doctor_id,
+        doctor_user.full_name.label("doctor_name"),
+        models.Specialization.name.label("specialization"),
+        appt_model.patient_id, patient.full_name.label("patient_name"),
+    ).join(slot_model, appt_model.slot_id == slot_model.id).join(
+        models.Doctor, slot_model.doctor_id == models.Doctor.id
+    ).join(doctor_user, models.Doctor.user_id == doctor_user.id).outerjoin(
+        models.Specialization, models.Doctor.specialization_id == models.Specialization.id
+    ).outerjoin(patient, appt_model.patient_id == patient.id)
+    if patient_id is not None:
+        q = q.filter(appt_model.patient_id == patient_id)
+    if doctor_id is not None:
+        q = q.filter(slot_model.doctor_id == doctor_id)
+    return q
+
+
+def list_appointments(db: Session, fields=FIELDS, patient_id: Optional[int] = None, doctor_id: Optional[int] = None):
+    """Live and archived appointments as flat dicts, newest first."""
+    rows = []
+    for appt_model, slot_model in (
+        (models.Appointment, models.Slot),
+        (models.ArchivedAppointment, models.ArchivedSlot),
+    ):
+        rows.extend(flat_query(db, appt_model, slot_model, patient_id, doctor_id).all())
+    rows.sort(key=lambda r: r.created_at or datetime.min, reverse=True)
+    return [to_dict(r, fields) for r in rows]
+
+
+def to_dict(row, fields=FIELDS) -> dict:
+    out = {}
+    for f in fields:
+        value = getattr(row, f)
+        if f == "status":
+            value = value.value if value is not None else None
+        elif f == "created_at":
+            value = value.isoformat() if value is not None else None
+        out[f] = value
+    return out
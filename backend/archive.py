@@ -0,0 +1,132 @@
+"""Moves past appointments and expired slots into the archive tables.
+
+Run on a timer from the app (ARCHIVE_INTERVAL_HOURS) or by hand:
+
+    python archive.py
+"""
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, literal
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, joinedload
+import models
+from config import settings
+from database import SessionLocal, engine
+
+logger = logging.getLogger(__name__)
+
+
+def _copy(db: Session, src, dst, ids, now):
+    src_table, dst_table = src.__table__, dst.__table__
+    cols = [c.name for c in src_table.columns]
+    rows = select(*[src_table.c[c] for c in cols], literal(now)).where(src_table.c.id.in_(ids))
+    db.execute(dst_table.insert().from_select(cols + ["archived_at"], rows))
+
+
+def _delete(db: Session, src, ids):
+    db.execute(src.__table__.delete().where(src.__table__.c.id.in_(ids)))
+
+
+def _is_duplicate(error: IntegrityError) -> bool:
+    """True for a primary/unique key clash, as opposed to e.g. a foreign key failure."""
+    code = getattr(error.orig, "args", [None])[0]
+    message = str(error.orig).lower()
+    return code == 1062 or "unique constraint failed" in message or "duplicate" in message
+
+
+def archive_old_records(db: Session, older_than_days: int = None, batch_size: int = None) -> dict:
+    """Archive slots dated before the horizon together with their appointments.
+
+    Works in batches, committing after each one, so the hot tables are never
+    locked for long.
+    """
+    older_than_days = older_than_days if older_than_days is not None else settings.ARCHIVE_AFTER_DAYS
+    batch_size = batch_size or settings.ARCHIVE_BATCH_SIZE
+    cutoff = (datetime.now() - timedelta(days=older_than_days)).strftime("%Y-%m-%d")
+    now = datetime.utcnow()
+    moved = {"appointments": 0, "slots": 0}
+
+    while True:
+        slot_ids = [r.id for r in db.query(models.Slot.id).filter(
+            models.Slot.slot_date < cutoff
+        ).limit(batch_size)]
+        if not slot_ids:
+            break
+        appt_ids = [r.id for r in db.query(models.Appointment.id).filter(
+            models.Appointment.slot_id.in_(slot_ids)
+        )]
+        # Parents before children on insert, children before parents on delete
+        _copy(db, models.Slot, models.ArchivedSlot, slot_ids, now)
+        if appt_ids:
+            _copy(db, models.Appointment, models.ArchivedAppointment, appt_ids, now)
+            # Waitlist entries keep their status but lose the link to the archived row
+            db.query(models.WaitlistEntry).filter(
+                models.WaitlistEntry.appointment_id.in_(appt_ids)
+            ).update({models.WaitlistEntry.appointment_id: None}, synchronize_session=False)
+            _delete(db, models.Appointment, appt_ids)
+        _delete(db, models.Slot, slot_ids)
+        db.commit()
+        moved["appointments"] += len(appt_ids)
+        moved["slots"] += len(slot_ids)
+
+    # Past schedule exceptions and calendar moves no longer affect anything
+    db.query(models.ScheduleException).filter(
+        models.ScheduleException.exc_date < cutoff
+    ).delete(synchronize_session=False)
+    db.query(models.AppointmentMove).filter(
+        models.AppointmentMove.slot_date < cutoff
+    ).delete(synchronize_session=False)
+    db.commit()
+    return moved
+
+
+def archived_appointments_query(db: Session):
+    return db.query(models.ArchivedAppointment).options(
+        joinedload(models.ArchivedAppointment.slot)
+        .joinedload(models.ArchivedSlot.doctor)
+        .joinedload(models.Doctor.user),
+        joinedload(models.ArchivedAppointment.slot)
+        .joinedload(models.ArchivedSlot.doctor)
+        .joinedload(models.Doctor.specialization),
+        joinedload(models.ArchivedAppointment.patient),
+    )
+
+
+def run_archive_job():
+    db = SessionLocal()
+    try:
+        moved = archive_old_records(db)
+        if moved["appointments"] or moved["slots"]:
+            logger.info(f"Archived {moved['appointments']} appointments and {moved['slots']} slots")
+        return moved
+    except IntegrityError as e:
+        db.rollback()
+        if _is_duplicate(e):
+            logger.info("Archive batch was already moved by another worker")
+        else:
+            logger.error(f"Archive job failed: {e}")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Archive job failed: {e}")
+    finally:
+        db.close()
+
+
+def start_archive_scheduler():
+    if settings.ARCHIVE_INTERVAL_HOURS <= 0:
+        return
+    stop = threading.Event()
+
+    def loop():
+        while not stop.wait(settings.ARCHIVE_INTERVAL_HOURS * 3600):
+            run_archive_job()
+
+    threading.Thread(target=loop, daemon=True, name="archive-job").start()
+    return stop
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    models.Base.metadata.create_all(bind=engine)
+    print(run_archive_job())
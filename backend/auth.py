@@ -2,11 +2,12 @@ from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
 from passlib.context import CryptContext
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordBearer
 from sqlalchemy.orm import Session
 from config import settings
-from database import get_db
+from database import SessionLocal, get_db
+from tracing import span
 import models
 
 pwd_context = CryptContext(schemes=["argon2"], deprecated="auto")
@@ -14,11 +15,13 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
 
 
 def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
+    with span("auth.hash_password"):
+        return pwd_context.hash(password)
 
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return pwd_context.verify(plain, hashed)
+    with span("auth.verify_password"):
+        return pwd_context.verify(plain, hashed)
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
@@ -28,6 +31,33 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
 
 
+def user_id_from_request(request: Request) -> int:
+    """User id from the bearer token without touching the database (0 if missing or invalid)."""
+    auth = request.headers.get("authorization", "")
+    if not auth.lower().startswith("bearer "):
+        return 0
+    try:
+        payload = jwt.decode(auth[7:], settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        return int(payload.get("sub") or 0)
+    except (JWTError, ValueError):
+        return 0
+
+
+def is_admin_request(request: Request) -> bool:
+    """Whether the bearer token belongs to an admin, for middleware that runs before routing.
+
+    Opens its own session; call it from a worker thread.
+    """
+    user_id = user_id_from_request(request)
+    if not user_id:
+        return False
+    db = SessionLocal()
+    try:
+        return db.query(models.User.role).filter(models.User.id == user_id).scalar() == models.UserRole.admin
+    finally:
+        db.close()
+
+
 def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
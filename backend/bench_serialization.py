@@ -0,0 +1,81 @@
+"""Serialization cost of an appointment list, per 10k appointments.
+
+Compares the old nested ``AppointmentOut`` path (pydantic validation +
+jsonable_encoder + json.dumps, as FastAPI does for a response_model) with the
+flat rows returned by appointment_list, encoded with json and with orjson.
+
+    python bench_serialization.py [count]
+"""
+import json
+import sys
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from fastapi.encoders import jsonable_encoder
+import models
+import schemas
+from appointment_list import FIELDS, orjson, to_dict
+
+LeanRow = namedtuple("LeanRow", FIELDS)
+
+
+def make_rows(count: int):
+    """Synthetic appointments as ORM-like objects and as lean column rows."""
+    now = datetime.utcnow()
+    orm, lean = [], []
+    for i in range(count):
+        created = now - timedelta(minutes=i)
+        patient = SimpleNamespace(
+            id=i % 2000, full_name=f"Patient {i % 2000}", username=f"pat{i % 2000}",
+            email=f"pat{i % 2000}@example.com", role="patient", phone="555-0100", is_active=True, created_at=now,
+        )
+        slot = SimpleNamespace(
+            id=i, doctor_id=i % 50, slot_date="2025-06-10", start_time="10:00", end_time="10:30", is_booked=True,
+        )
+        status = models.AppointmentStatus.booked
+        orm.append(SimpleNamespace(
+            id=i, slot_id=i, patient_id=patient.id, reason="Follow-up visit", status=status.value,
+            prescription_notes=None, medications=None, notes=None, created_at=created,
+            slot=slot, patient=patient,
+        ))
+        lean.append(LeanRow(
+            id=i, status=status, reason="Follow-up visit", prescription_notes=None, medications=None,
+            created_at=created, slot_id=i, slot_date=slot.slot_date, start_time=slot.start_time,
+            end_time=slot.end_time, doctor_id=slot.doctor_id, doctor_name=f"Doctor {i % 50}",
+            specialization="Cardiology", patient_id=patient.id, patient_name=patient.full_name,
+        ))
+    return orm, lean
+
+
+def timed(fn, repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, len(body)
+
+
+def main(count: int = 10_000):
+    orm, lean = make_rows(count)
+    cases = {
+        "AppointmentOut + json": lambda: json.dumps(jsonable_encoder(
+            [schemas.AppointmentOut.model_validate(a) for a in orm]
+        )).encode(),
+        "lean dict + json": lambda: json.dumps([to_dict(r) for r in lean]).encode(),
+    }
+    if orjson:
+        cases["lean dict + orjson"] = lambda: orjson.dumps([to_dict(r) for r in lean])
+    else:
+        print("orjson not installed, skipping the orjson case")
+
+    scale = 10_000 / count
+    print(f"{'case':<24}{'ms / 10k':>10}{'KB / 10k':>10}")
+    for name, fn in cases.items():
+        seconds, size = timed(fn)
+        print(f"{name:<24}{seconds * 1000 * scale:>10.1f}{size / 1024 * scale:>10.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10_000)
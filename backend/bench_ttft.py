@@ -0,0 +1,182 @@
+"""Chat time-to-first-token before and after the prompt-prefix/keep-alive changes.
+
+Runs OllamaProvider against a local fake Ollama that behaves like the real
+one where it matters for TTFT:
+
+* loading the model costs LOAD seconds, and the model unloads once it has
+  been idle longer than the request's keep_alive (Ollama's default is 5m)
+* the prompt is cached per model: only the part after the longest common
+  prefix with the previous prompt has to be evaluated (PREFILL per 1k chars)
+
+Time is scaled down: one fake "minute" lasts MINUTE seconds, and the idle
+gap between bursts of questions stands for ~10 idle minutes.
+
+    python bench_ttft.py [bursts]
+"""
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from llm_providers import OllamaProvider
+from rag import SYSTEM_PROMPT, compose_messages
+
+LOAD = 0.5          # seconds to load the model
+PREFILL = 0.02      # seconds per 1000 uncached prompt characters
+TOKEN = 0.005       # seconds per generated token
+MINUTE = 0.05       # one fake minute
+IDLE = 10 * MINUTE  # gap between bursts
+
+BOOK = "If you recommend a doctor or suggest booking an appointment, append the tag [BOOK_NOW] at the end of your response."
+
+
+def _seconds(keep_alive) -> float:
+    if keep_alive in (None, ""):
+        return 5 * MINUTE
+    if isinstance(keep_alive, (int, float)):
+        return float("inf") if keep_alive < 0 else keep_alive * MINUTE / 60
+    value, unit = float(keep_alive[:-1]), keep_alive[-1]
+    if value < 0:
+        return float("inf")
+    return value * {"s": MINUTE / 60, "m": MINUTE, "h": 60 * MINUTE}[unit]
+
+
+class FakeOllama:
+    def __init__(self):
+        self.lock = threading.Lock()  # one request at a time, like OLLAMA_NUM_PARALLEL=1
+        self.reset()
+
+    def reset(self):
+        self.unload_at = 0.0
+        self.cached = ""
+
+    def respond(self, payload):
+        prompt = "".join(f"<{m['role']}>{m['content']}" for m in payload["messages"])
+        with self.lock:
+            now = time.monotonic()
+            if now >= self.unload_at:
+                time.sleep(LOAD)
+                self.cached = ""
+            common = 0
+            for a, b in zip(self.cached, prompt):
+                if a != b:
+                    break
+                common += 1
+            time.sleep(PREFILL * (len(prompt) - common) / 1000)
+            self.cached = prompt
+            tokens = payload.get("options", {}).get("num_predict", 8)
+            for i in range(tokens):
+                time.sleep(TOKEN)
+                yield {"message": {"role": "assistant", "content": f"tok{i} "}, "done": False}
+            self.unload_at = time.monotonic() + _seconds(payload.get("keep_alive"))
+        yield {"message": {"role": "assistant", "content": ""}, "done": True}
+
+
+def serve(fake: FakeOllama):
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            chunks = fake.respond(payload)
+            if not payload.get("stream", True):
+                text = "".join(c["message"]["content"] for c in chunks)
+                self.wfile.write(json.dumps({"message": {"role": "assistant", "content": text}, "done": True}).encode())
+                return
+            for chunk in chunks:
+                self.wfile.write(json.dumps(chunk).encode() + b"\n")
+                self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def catalogue(doctors: int = 60) -> str:
+    text = "Here is the current data for the DoctorBook app:\n\nAvailable Specializations:\n"
+    text += "".join(f"- Specialization {i}: Care for condition group {i}\n" for i in range(12))
+    text += "\nAvailable Doctors:\n"
+    text += "".join(
+        f"- Dr. Doctor {i} (Specialization {i % 12}). Bio: {i + 5} years of clinical practice. Fee: {50 + i}\n"
+        for i in range(doctors)
+    )
+    return text
+
+
+def user_context(name: str) -> str:
+    return (f"--- CURRENT USER CONTEXT ---\nUser: {name} (Role: patient)\nMy Appointments:\n"
+            f"- 2030-01-07 at 09:00 with Dr. Doctor 3 (Status: booked)\n")
+
+
+def legacy_messages(cat: str, name: str, query: str):
+    """The prompt layout before: user name and instruction ahead of the catalogue."""
+    system_prompt = f"""You are a helpful medical assistant for the DoctorBook app.
+        Your goal is to help users find the right doctor and encourage them to book an appointment.
+
+        You are chatting with {name}. Use the provided context to answer questions about their specific appointments or schedule if available.
+
+        Use the following information about available doctors and specializations to answer the user's question.
+        If the user asks about medical advice, give a standard disclaimer that you are an AI, but try to recommend a relevant doctor from the list based on their symptoms if possible.
+
+        {BOOK}
+
+        Keep answers concise and friendly.
+
+        Context:
+        {cat}\n\n{user_context(name)}
+        """
+    return [{"role": "system", "content": system_prompt}, {"role": "user", "content": query}]
+
+
+def new_messages(cat: str, name: str, query: str):
+    return compose_messages(SYSTEM_PROMPT + cat, query, name, BOOK, user_context(name))
+
+
+def ttft(provider, messages) -> float:
+    t0 = time.perf_counter()
+    stream = provider.stream(messages)
+    next(stream)
+    elapsed = time.perf_counter() - t0
+    for _ in stream:
+        pass
+    return elapsed
+
+
+def run(url, fake, layout, keep_alive, warm, bursts):
+    fake.reset()
+    provider = OllamaProvider(url, "fake", keep_alive)
+    cat = catalogue()
+    if warm:
+        provider.warm_up([{"role": "system", "content": SYSTEM_PROMPT + cat}, {"role": "user", "content": "Hello"}])
+    users = [f"Patient {i}" for i in range(4)]
+    first, rest = [], []
+    for burst in range(bursts):
+        for i, name in enumerate(users * 2):
+            (first if i == 0 else rest).append(ttft(provider, layout(cat, name, f"Which doctor for symptom {burst}-{i}?")))
+        time.sleep(IDLE)
+    return first, rest
+
+
+def main(bursts: int):
+    fake = FakeOllama()
+    url = serve(fake)
+    print(f"{bursts} bursts of 8 questions from 4 alternating users, idle gap ~10 fake minutes\n")
+    print(f"{'':40} {'first of burst':>16} {'others median':>14} {'others p95':>11}")
+    for label, layout, keep_alive, warm in (
+        ("before: per-user prefix, default keep", legacy_messages, "", False),
+        ("prefix only", new_messages, "", False),
+        ("after: prefix + keep_alive + warm-up", new_messages, "30m", True),
+    ):
+        first, rest = run(url, fake, layout, keep_alive, warm, bursts)
+        p95 = sorted(rest)[int(len(rest) * 0.95) - 1]
+        print(f"{label:40} {statistics.median(first) * 1000:13.0f} ms "
+              f"{statistics.median(rest) * 1000:11.0f} ms {p95 * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
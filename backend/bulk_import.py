@@ -0,0 +1,236 @@
+"""Bulk import of specializations, users and doctor profiles from CSV or JSONL.
+
+Used by POST /admin/import/{kind} and from the command line:
+
+    python bulk_import.py users staff.csv
+
+Rows are validated in one pass, duplicates are found with set queries,
+passwords are hashed in a process pool and rows are inserted in batches. The
+result lists every rejected row with its (1-based) row number.
+"""
+import csv
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+from pydantic import BaseModel, EmailStr, ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+from auth import hash_password
+from config import settings
+
+KINDS = ("specializations", "users", "doctors")
+
+
+class SpecializationRow(BaseModel):
+    name: str
+    description: Optional[str] = None
+    icon: Optional[str] = None
+
+
+class DoctorFields(BaseModel):
+    specialization: Optional[str] = None  # specialization name
+    bio: Optional[str] = None
+    qualification: Optional[str] = None
+    experience_years: int = 0
+    consultation_fee: int = 0
+
+
+class UserRow(DoctorFields):
+    full_name: str
+    username: str
+    email: EmailStr
+    password: str
+    phone: Optional[str] = None
+    role: models.UserRole = models.UserRole.patient
+
+
+class DoctorRow(DoctorFields):
+    username: str
+    specialization: str
+
+
+ROW_SCHEMAS = {"specializations": SpecializationRow, "users": UserRow, "doctors": DoctorRow}
+
+
+def parse_rows(content: bytes, filename: str = ""):
+    text = content.decode("utf-8-sig")
+    if filename.endswith((".jsonl", ".json", ".ndjson")):
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    # Empty CSV cells mean "not given"
+    return [{k: v for k, v in row.items() if v not in ("", None)} for row in csv.DictReader(io.StringIO(text))]
+
+
+def _existing(db: Session, column, values):
+    found = set()
+    values = list(values)
+    for i in range(0, len(values), 1000):
+        found.update(v for (v,) in db.query(column).filter(column.in_(values[i:i + 1000])))
+    return found
+
+
+def _hash_all(passwords):
+    if len(passwords) < 2 or settings.IMPORT_HASH_WORKERS == 1:
+        return [hash_password(p) for p in passwords]
+    workers = settings.IMPORT_HASH_WORKERS or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+
+def _insert_batches(db: Session, model, rows, report) -> set:
+    """Insert ``(row_no, mapping)`` pairs in batches; a failing batch is retried row by row.
+
+    Returns the row numbers that were inserted.
+    """
+    size = settings.IMPORT_BATCH_SIZE
+    inserted = set()
+    for i in range(0, len(rows), size):
+        batch = rows[i:i + size]
+        try:
+            db.bulk_insert_mappings(model, [m for _, m in batch])
+            db.commit()
+            report["created"] += len(batch)
+            inserted.update(row_no for row_no, _ in batch)
+        except IntegrityError:
+            db.rollback()
+            for row_no, mapping in batch:
+                try:
+                    db.bulk_insert_mappings(model, [mapping])
+                    db.commit()
+                    report["created"] += 1
+                    inserted.add(row_no)
+                except IntegrityError as e:
+                    db.rollback()
+                    report["errors"].append({"row": row_no, "error": f"Conflicts with existing data: {e.orig}"})
+    return inserted
+
+
+def import_rows(db: Session, kind: str, raw_rows: list) -> dict:
+    if kind not in KINDS:
+        raise ValueError(f"Unknown import kind: {kind}")
+    report = {"kind": kind, "total": len(raw_rows), "created": 0, "errors": []}
+
+    # 1. Validate
+    schema = ROW_SCHEMAS[kind]
+    rows = []
+    for row_no, raw in enumerate(raw_rows, start=1):
+        try:
+            rows.append((row_no, schema.model_validate(raw)))
+        except ValidationError as e:
+            msg = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            report["errors"].append({"row": row_no, "error": msg})
+
+    def reject(row_no, error):
+        report["errors"].append({"row": row_no, "error": error})
+
+    # 2. Duplicates within the file and against the database
+    def dedupe(items, key, column, label):
+        existing = _existing(db, column, {key(r) for _, r in items})
+        seen, kept = set(), []
+        for row_no, r in items:
+            k = key(r)
+            if k in existing:
+                reject(row_no, f"{label} already exists")
+            elif k in seen:
+                reject(row_no, f"Duplicate {label.lower()} in file")
+            else:
+                seen.add(k)
+                kept.append((row_no, r))
+        return kept
+
+    spec_ids = dict(db.query(models.Specialization.name, models.Specialization.id))
+
+    def check_specialization(items):
+        kept = []
+        for row_no, r in items:
+            if r.specialization and r.specialization not in spec_ids:
+                reject(row_no, f"Unknown specialization: {r.specialization}")
+            else:
+                kept.append((row_no, r))
+        return kept
+
+    if kind == "specializations":
+        rows = dedupe(rows, lambda r: r.name, models.Specialization.name, "Specialization")
+        _insert_batches(db, models.Specialization, [(n, r.model_dump()) for n, r in rows], report)
+
+    elif kind == "users":
+        rows = dedupe(rows, lambda r: r.username, models.User.username, "Username")
+        rows = dedupe(rows, lambda r: r.email, models.User.email, "Email")
+        rows = check_specialization(rows)
+
+        # 3. Hash in parallel (Argon2 is deliberately slow)
+        hashes = _hash_all([r.password for _, r in rows])
+        user_fields = ("full_name", "username", "email", "phone", "role")
+        inserted = _insert_batches(db, models.User, [
+            (n, {**r.model_dump(include=set(user_fields)), "password": h})
+            for (n, r), h in zip(rows, hashes)
+        ], report)
+
+        # Doctor profiles for rows that named a specialization. Only rows this
+        # import inserted: usernames are unique, so those accounts are ours, while
+        # a row that failed may share its username with someone else's account
+        profiles = [(n, r) for n, r in rows if n in inserted and r.specialization and r.role == models.UserRole.doctor]
+        if profiles:
+            user_ids = dict(db.query(models.User.username, models.User.id).filter(
+                models.User.username.in_([r.username for _, r in profiles])
+            ))
+            doctor_report = {"created": 0, "errors": report["errors"]}
+            _insert_batches(db, models.Doctor, [
+                (n, _doctor_mapping(r, user_ids[r.username], spec_ids))
+                for n, r in profiles if r.username in user_ids
+            ], doctor_report)
+            report["doctor_profiles"] = doctor_report["created"]
+
+    elif kind == "doctors":
+        rows = check_specialization(rows)
+        user_ids = dict(db.query(models.User.username, models.User.id).filter(
+            models.User.username.in_([r.username for _, r in rows])
+        ))
+        with_user = []
+        for row_no, r in rows:
+            if r.username not in user_ids:
+                reject(row_no, f"Unknown user: {r.username}")
+            else:
+                with_user.append((row_no, r))
+        has_profile = _existing(db, models.Doctor.user_id, {user_ids[r.username] for _, r in with_user})
+        kept, seen = [], set()
+        for row_no, r in with_user:
+            uid = user_ids[r.username]
+            if uid in has_profile or uid in seen:
+                reject(row_no, "Doctor profile already exists for this user")
+            else:
+                seen.add(uid)
+                kept.append((row_no, _doctor_mapping(r, uid, spec_ids)))
+        _insert_batches(db, models.Doctor, kept, report)
+
+    report["errors"].sort(key=lambda e: e["row"])
+    return report
+
+
+def _doctor_mapping(r, user_id: int, spec_ids: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "specialization_id": spec_ids[r.specialization],
+        "bio": r.bio,
+        "qualification": r.qualification,
+        "experience_years": r.experience_years,
+        "consultation_fee": r.consultation_fee,
+    }
+
+
+if __name__ == "__main__":
+    from database import SessionLocal
+
+    if len(sys.argv) != 3 or sys.argv[1] not in KINDS:
+        sys.exit(f"Usage: python bulk_import.py {{{'|'.join(KINDS)}}} <file.csv|file.jsonl>")
+    kind, path = sys.argv[1], sys.argv[2]
+    with open(path, "rb") as f:
+        raw = parse_rows(f.read(), path)
+    session = SessionLocal()
+    try:
+        print(json.dumps(import_rows(session, kind, raw), indent=2))
+    finally:
+        session.close()
@@ -0,0 +1,171 @@
+"""Per-user iCalendar feed of appointments.
+
+The feed URL carries an HMAC of the user id and their feed version, so
+calendar apps can poll it without logging in, and bumping the version
+revokes a leaked URL. A full feed has an ETag and answers 304 when nothing
+changed. Sync clients send back the ``X-Sync-Token`` of their last response
+as ``since``. They then get only the appointments created, cancelled,
+completed or moved since then; one moved to another doctor shows up as
+cancelled in the old doctor's feed.
+"""
+import hashlib
+import hmac
+from datetime import datetime
+from types import SimpleNamespace
+from typing import Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import models
+from appointment_list import flat_query
+from config import settings
+
+PRODID = "-//DoctorBook//Appointments//EN"
+
+
+def feed_token(user: models.User) -> str:
+    message = f"ical:{user.id}:{user.calendar_feed_version or 0}"
+    return hmac.new(settings.SECRET_KEY.encode(), message.encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def check_token(user: models.User, token: str) -> bool:
+    return hmac.compare_digest(feed_token(user), token or "")
+
+
+def feed_url(base_url: str, user: models.User) -> str:
+    return f"{base_url.rstrip('/')}/calendar/{user.id}.ics?token={feed_token(user)}"
+
+
+def _changed_at():
+    # Rows from before updated_at existed fall back to their creation time
+    return func.coalesce(models.Appointment.updated_at, models.Appointment.created_at)
+
+
+def _owner(db: Session, user: models.User) -> dict:
+    """``flat_query`` filter for the appointments in this user's calendar."""
+    if user.role == models.UserRole.doctor:
+        doctor_id = db.query(models.Doctor.id).filter(models.Doctor.user_id == user.id).scalar()
+        return {"doctor_id": doctor_id if doctor_id is not None else -1}
+    return {"patient_id": user.id}
+
+
+def etag(db: Session, user: models.User) -> str:
+    """Changes whenever any appointment in the feed is added, changed or archived."""
+    owner = _owner(db, user)
+    q = db.query(func.count(models.Appointment.id), func.max(_changed_at()))
+    if "doctor_id" in owner:
+        q = q.join(models.Slot, models.Appointment.slot_id == models.Slot.id).filter(
+            models.Slot.doctor_id == owner["doctor_id"]
+        )
+    else:
+        q = q.filter(models.Appointment.patient_id == owner["patient_id"])
+    count, last = q.one()
+    tag = f"{user.id}-{count}-{last.isoformat() if last else 0}"
+    if "doctor_id" in owner:
+        m = models.AppointmentMove
+        moves, last_move = db.query(func.count(m.id), func.max(m.moved_at)).filter(m.doctor_id == owner["doctor_id"]).one()
+        tag += f"-{moves}-{last_move.isoformat() if last_move else 0}"
+    return f'"{tag}"'
+
+
+def _moved_away(db: Session, doctor_id: int, since: Optional[datetime] = None):
+    """Cancelled-looking rows for appointments moved from ``doctor_id`` to another doctor."""
+    m = models.AppointmentMove
+    still_here = db.query(models.Appointment.id).join(
+        models.Slot, models.Appointment.slot_id == models.Slot.id
+    ).filter(models.Slot.doctor_id == doctor_id)
+    q = db.query(m, models.User.full_name).outerjoin(
+        models.Appointment, m.appointment_id == models.Appointment.id
+    ).outerjoin(models.User, models.Appointment.patient_id == models.User.id).filter(
+        m.doctor_id == doctor_id, m.appointment_id.notin_(still_here)
+    )
+    if since is not None:
+        q = q.filter(m.moved_at >= since)
+    latest = {}
+    for move, patient_name in q.order_by(m.moved_at):
+        latest[move.appointment_id] = SimpleNamespace(
+            id=move.appointment_id, status=models.AppointmentStatus.cancelled, reason=None,
+            slot_date=move.slot_date, start_time=move.start_time, end_time=move.end_time,
+            patient_name=patient_name, doctor_name=None, specialization=None, changed_at=move.moved_at,
+        )
+    return list(latest.values())
+
+
+def changes(db: Session, user: models.User, since: Optional[datetime] = None):
+    """Appointment rows (with ``changed_at``) in the feed, all of them or those changed since ``since``."""
+    owner = _owner(db, user)
+    changed_at = _changed_at().label("changed_at")
+    q = flat_query(db, models.Appointment, models.Slot, **owner).add_columns(changed_at)
+    if since is not None:
+        # Inclusive: on databases with second precision a change in the same
+        # second as the cursor would otherwise be lost; clients dedupe by UID
+        q = q.filter(_changed_at() >= since)
+    rows = q.all()
+    if "doctor_id" in owner:
+        rows += _moved_away(db, owner["doctor_id"], since)
+    return sorted(rows, key=lambda r: (r.slot_date, r.start_time))
+
+
+def sync_token(rows, since: Optional[datetime] = None) -> str:
+    latest = max((r.changed_at for r in rows if r.changed_at), default=since)
+    return latest.isoformat() if latest else ""
+
+
+def parse_sync_token(token: str) -> datetime:
+    return datetime.fromisoformat(token)
+
+
+def _escape(value) -> str:
+    return (str(value or "").replace("\\", "\\\\").replace(";", "\\;")
+            .replace(",", "\\,").replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _fold(line: str) -> str:
+    """Split content lines longer than 75 octets (RFC 5545 3.1)."""
+    data = line.encode()
+    if len(data) <= 75:
+        return line
+    parts, start = [], 0
+    while start < len(data):
+        end = min(start + (75 if not parts else 74), len(data))
+        while end < len(data) and (data[end] & 0xC0) == 0x80:  # don't split a UTF-8 character
+            end -= 1
+        parts.append(data[start:end].decode())
+        start = end
+    return "\r\n ".join(parts)
+
+
+def _local(slot_date: str, hhmm: str) -> str:
+    return slot_date.replace("-", "") + "T" + hhmm.replace(":", "") + "00"
+
+
+def render(rows, user: models.User) -> str:
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        f"PRODID:{PRODID}",
+        "CALSCALE:GREGORIAN",
+        "METHOD:PUBLISH",
+        "X-WR-CALNAME:DoctorBook appointments",
+    ]
+    as_doctor = user.role == models.UserRole.doctor
+    for r in rows:
+        changed = r.changed_at or datetime.utcnow()
+        summary = f"Appointment: {r.patient_name}" if as_doctor else f"Appointment with Dr. {r.doctor_name}"
+        description = f"Reason: {r.reason}" if r.reason else ""
+        if r.specialization and not as_doctor:
+            description = f"{r.specialization}. {description}".strip()
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:appointment-{r.id}@doctorbook",
+            f"DTSTAMP:{changed:%Y%m%dT%H%M%SZ}",
+            f"LAST-MODIFIED:{changed:%Y%m%dT%H%M%SZ}",
+            f"SEQUENCE:{int((changed - datetime(2020, 1, 1)).total_seconds())}",
+            f"DTSTART:{_local(r.slot_date, r.start_time)}",
+            f"DTEND:{_local(r.slot_date, r.end_time)}",
+            f"SUMMARY:{_escape(summary)}",
+            f"DESCRIPTION:{_escape(description)}",
+            f"STATUS:{'CANCELLED' if r.status == models.AppointmentStatus.cancelled else 'CONFIRMED'}",
+            "END:VEVENT",
+        ]
+    lines.append("END:VCALENDAR")
+    return "\r\n".join(_fold(line) for line in lines) + "\r\n"
@@ -7,6 +7,14 @@ class Settings(BaseSettings):
     DB_NAME: str = "doctor_app"
     DB_USER: str = "root"
     DB_PASSWORD: str = ""
+    # Full SQLAlchemy URL for the primary; overrides the DB_* fields when set
+    DATABASE_URL: str = ""
+
+    # Read replicas for read-only routes, comma-separated SQLAlchemy URLs (empty = primary only)
+    DB_REPLICA_URLS: str = ""
+    DB_REPLICA_CHECK_SECONDS: int = 10
+    # After a user's own write, keep their reads on the primary for this long
+    READ_YOUR_WRITES_SECONDS: int = 5
 
     SECRET_KEY: str = "changeme"
     ALGORITHM: str = "HS256"
@@ -27,6 +35,106 @@ class Settings(BaseSettings):
     OPENAI_API_KEY: Optional[str] = None
     LLM_PROVIDER: str = "ollama" # Default to ollama
 
+    # LLM providers (base URLs can point at local fakes for testing)
+    OLLAMA_URL: str = "http://localhost:11434"
+    OLLAMA_MODEL: str = "gemma3:4b"
+    # Keep the Ollama model loaded this long after each request ("-1" = always; empty = Ollama's 5m)
+    OLLAMA_KEEP_ALIVE: str = "30m"
+    OPENAI_BASE_URL: str = "https://api.openai.com/v1"
+    OPENAI_MODEL: str = "gpt-4o-mini"
+    GOOGLE_BASE_URL: str = "https://generativelanguage.googleapis.com"
+    GOOGLE_MODEL: str = "gemini-1.5-flash"
+    LLM_CONNECT_TIMEOUT: float = 5.0
+    LLM_READ_TIMEOUT: float = 120.0
+    # Load the model and its prompt cache for the shared prompt prefix at startup
+    LLM_WARMUP: bool = True
+    # Start LLM_FALLBACK_PROVIDER too if the first token takes longer than this (0 = off)
+    LLM_FALLBACK_PROVIDER: Optional[str] = None
+    LLM_HEDGE_AFTER_MS: int = 0
+
+    # LLM admission control
+    LLM_MAX_CONCURRENCY: int = 4
+    LLM_MAX_QUEUE: int = 16
+    LLM_QUEUE_TIMEOUT: float = 30.0
+
+    # Chat SSE token batching
+    CHAT_SSE_WINDOW_MS: int = 50
+    CHAT_SSE_MAX_CHARS: int = 256
+
+    # How far ahead open slots are generated from schedule rules
+    SCHEDULE_HORIZON_DAYS: int = 28
+
+    # Archival of past slots/appointments into the *_archive tables
+    ARCHIVE_AFTER_DAYS: int = 180
+    ARCHIVE_BATCH_SIZE: int = 1000
+    ARCHIVE_INTERVAL_HOURS: int = 24  # 0 = only run manually
+
+    # How far back POST /admin/analytics/rebuild recomputes by default
+    ANALYTICS_REBUILD_DAYS: int = 365
+    # How often slots offered are recounted as the schedule horizon moves forward
+    ANALYTICS_OFFERED_REFRESH_HOURS: int = 24  # 0 = only on edits and rebuilds
+
+    # Bulk import (0 workers = one per CPU)
+    IMPORT_HASH_WORKERS: int = 0
+    IMPORT_BATCH_SIZE: int = 500
+
+    # How long Idempotency-Key responses are kept for replay
+    IDEMPOTENCY_TTL_HOURS: int = 24
+    # How long an unfinished request holds its key before a retry may take over
+    IDEMPOTENCY_LEASE_SECONDS: int = 30
+
+    # Token-bucket rate limits (0 = off). Backend "" = per process,
+    # "sqlite:///path/to/file.db" = shared by the workers on one host
+    RATE_LIMIT_LOGIN_PER_MINUTE: int = 10
+    RATE_LIMIT_CHAT_PER_MINUTE: int = 20
+    RATE_LIMIT_BACKEND: str = ""
+
+    # How many notify-only waitlist entries are offered a freed slot at once
+    WAITLIST_OFFER_BATCH: int = 5
+
+    # Reminder emails, minutes before the appointment (empty = off). The
+    # scheduler keeps the next REMINDER_LOOKAHEAD_HOURS of reminders in memory
+    REMINDER_OFFSETS_MINUTES: str = "1440,120"
+    REMINDER_LOOKAHEAD_HOURS: int = 12
+
+    # Local hour at which daily doctor digests go out
+    DIGEST_DAILY_HOUR: int = 7
+
+    # Request tracing: share of requests traced (an admin request sent with
+    # "X-Trace: 1" is always traced), spans kept in memory, optional JSON-lines
+    # file, rotated to TRACE_FILE.1 once it reaches TRACE_FILE_MAX_BYTES
+    TRACE_SAMPLE_RATE: float = 0.01
+    TRACE_MAX_TRACES: int = 500
+    TRACE_FILE: str = ""
+    TRACE_FILE_MAX_BYTES: int = 50_000_000
+
+    # On-demand profiler: stack sampling interval, output directory, how many
+    # profiles to keep, and the longest window an admin may request
+    PROFILE_INTERVAL_MS: float = 5
+    PROFILE_DIR: str = "profiles"
+    PROFILE_MAX_FILES: int = 50
+    PROFILE_MAX_SECONDS: int = 120
+
+    # Per-doctor day agenda cache
+    AGENDA_CACHE_TTL_SECONDS: int = 300
+    AGENDA_CACHE_MAX_DAYS: int = 5000
+
+    # In-memory doctor search index (used when the DB has no full-text support)
+    SEARCH_INDEX_TTL_SECONDS: int = 300
+
+    # Cross-worker pub/sub relay, e.g. "multicast://239.255.42.99:9400" (empty = in-process only)
+    PUBSUB_BROKER_URL: str = ""
+
+    # How cache invalidations reach the other workers: "table" (polled DB
+    # table), "pubsub" (the broker above) or "local" (single worker)
+    CACHE_INVALIDATION_BACKEND: str = "table"
+    CACHE_INVALIDATION_POLL_SECONDS: float = 1.0
+    # Rows are ids that can commit out of order; keep re-reading this far back for late ones
+    CACHE_INVALIDATION_RESCAN_SECONDS: float = 10.0
+
+    # Doctor/specialization catalogue text given to the chat bot
+    CATALOGUE_CACHE_TTL_SECONDS: int = 300
+
     class Config:
         env_file = ".env"
         extra = "forbid"
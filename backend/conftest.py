@@ -0,0 +1,93 @@
+"""Shared fixtures for the API tests.
+
+The app runs against a throwaway SQLite file; settings are set through the
+environment before ``config`` is first imported, so they win over ``.env``.
+"""
+import os
+import tempfile
+import uuid
+from datetime import date, timedelta
+
+_db_dir = tempfile.mkdtemp(prefix="doctorbook-tests-")
+os.environ.update(
+    DATABASE_URL=f"sqlite:///{os.path.join(_db_dir, 'app.db')}",
+    DB_REPLICA_URLS="",
+    SECRET_KEY="test-secret-key-that-is-long-enough",
+    LLM_PROVIDER="ollama",
+    LLM_FALLBACK_PROVIDER="",
+    LLM_WARMUP="false",
+    RATE_LIMIT_BACKEND="",
+    # Nothing listens here, so confirmation emails fail fast in the background
+    SMTP_HOST="127.0.0.1",
+    SMTP_PORT="9",
+)
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def client():
+    from fastapi.testclient import TestClient
+    import main
+
+    with TestClient(main.app) as c:
+        yield c
+
+
+def auth(token: str) -> dict:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def register(client, role: str = "patient") -> dict:
+    """A new user with a unique username; returns the token response."""
+    name = f"{role}-{uuid.uuid4().hex[:8]}"
+    r = client.post("/auth/register", json={
+        "full_name": name.title(), "username": name, "email": f"{name}@example.com",
+        "password": "pw123456", "role": role,
+    })
+    assert r.status_code == 201, r.text
+    return r.json()
+
+
+@pytest.fixture(scope="session")
+def admin(client):
+    import models
+    from database import SessionLocal
+
+    user = register(client)
+    db = SessionLocal()
+    try:
+        db.query(models.User).filter(models.User.id == user["user_id"]).update({"role": models.UserRole.admin})
+        db.commit()
+    finally:
+        db.close()
+    return user
+
+
+@pytest.fixture
+def doctor(client, admin):
+    """A doctor with a 09:00-12:00 rule on every day, as ``(doctor_id, token)``."""
+    user = register(client, "doctor")
+    spec = client.post("/specializations", json={"name": f"Spec {uuid.uuid4().hex[:8]}"},
+                       headers=auth(admin["access_token"]))
+    assert spec.status_code == 201, spec.text
+    r = client.post("/doctors", json={"user_id": user["user_id"], "specialization_id": spec.json()["id"]},
+                    headers=auth(admin["access_token"]))
+    assert r.status_code == 201, r.text
+    doctor_id = r.json()["id"]
+    rule = client.post(f"/doctors/{doctor_id}/schedule", json={
+        "start_time": "09:00", "end_time": "12:00", "slot_duration": 30, "days_of_week": list(range(7)),
+    }, headers=auth(user["access_token"]))
+    assert rule.status_code == 201, rule.text
+    return doctor_id, user["access_token"]
+
+
+@pytest.fixture
+def patient(client):
+    return register(client)
+
+
+@pytest.fixture
+def day():
+    """A date a few days out, inside the schedule horizon."""
+    return (date.today() + timedelta(days=3)).strftime("%Y-%m-%d")
@@ -0,0 +1,119 @@
+"""Doctor notification digests.
+
+Doctors choose how booking emails reach them (``Doctor.notification_mode``):
+immediately, or gathered into one hourly or daily digest. Held-back events
+live in ``doctor_notifications`` until a digest run claims them. A doctor's
+events are marked sent only once their digest went out; if it failed, or the
+run died before finishing, the claim is released for the next run to retry.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta
+from fastapi import BackgroundTasks
+from sqlalchemy import or_
+from sqlalchemy.orm import Session, joinedload
+import models
+from config import settings
+from database import SessionLocal
+from email_utils import send_doctor_digests
+
+logger = logging.getLogger(__name__)
+
+MODES = ("immediate", "hourly", "daily")
+PERIODS = {"hourly": timedelta(hours=1), "daily": timedelta(days=1)}
+
+
+def notify_doctor(db: Session, background_tasks: BackgroundTasks, doctor: models.Doctor, event: dict, send, **kwargs):
+    """Email ``doctor`` now with ``send(**kwargs)``, or hold ``event`` for their digest.
+
+    ``event`` has kind, patient_name, slot_date, start_time and optionally
+    end_time, reason and detail. Call after the booking change is committed.
+    """
+    if (doctor.notification_mode or "immediate") == "immediate":
+        background_tasks.add_task(send, **kwargs)
+        return
+    db.add(models.DoctorNotification(doctor_id=doctor.id, **event))
+    db.commit()
+
+
+def flush(mode: str) -> int:
+    """Send one digest per doctor for the events pending under ``mode``. Returns emails sent."""
+    db = SessionLocal()
+    try:
+        n = models.DoctorNotification
+        # The hourly run also picks up what was left when a doctor switched back to immediate
+        modes = ("hourly", "immediate") if mode == "hourly" else (mode,)
+        doctor_ids = [d for (d,) in db.query(models.Doctor.id).filter(models.Doctor.notification_mode.in_(modes))]
+        if not doctor_ids:
+            return 0
+        now = datetime.utcnow()
+        # A run that crashed between claiming and sending left its rows claimed
+        db.query(n).filter(
+            n.batch != None, n.sent_at == None, n.doctor_id.in_(doctor_ids),
+            or_(n.claimed_at == None, n.claimed_at < now - PERIODS[mode]),
+        ).update({n.batch: None, n.claimed_at: None}, synchronize_session=False)
+        token = uuid.uuid4().hex
+        claimed = db.query(n).filter(n.batch == None, n.doctor_id.in_(doctor_ids)).update(
+            {n.batch: token, n.claimed_at: now}, synchronize_session=False
+        )
+        db.commit()
+        if not claimed:
+            return 0
+
+        events = db.query(n).filter(n.batch == token).order_by(n.doctor_id, n.slot_date, n.start_time).all()
+        doctors = {d.id: d for d in db.query(models.Doctor).options(joinedload(models.Doctor.user)).filter(
+            models.Doctor.id.in_({e.doctor_id for e in events})
+        )}
+        by_doctor = {}
+        for e in events:
+            by_doctor.setdefault(e.doctor_id, []).append(e)
+        period = "the last hour" if mode == "hourly" else "the last day"
+        recipients = [doctor_id for doctor_id in by_doctor if doctor_id in doctors]
+        digests = [
+            {
+                "to_email": doctors[doctor_id].user.email,
+                "doctor_name": doctors[doctor_id].user.full_name,
+                "period": period,
+                "events": [
+                    {"kind": e.kind, "patient_name": e.patient_name, "slot_date": e.slot_date,
+                     "start_time": e.start_time, "end_time": e.end_time, "reason": e.reason, "detail": e.detail}
+                    for e in by_doctor[doctor_id]
+                ],
+            }
+            for doctor_id in recipients
+        ]
+        results = send_doctor_digests(digests)
+        failed = [doctor_id for doctor_id, ok in zip(recipients, results) if not ok]
+
+        batch = db.query(n).filter(n.batch == token)
+        if failed:
+            batch.filter(n.doctor_id.in_(failed)).update({n.batch: None, n.claimed_at: None}, synchronize_session=False)
+            logger.error(f"{len(failed)} {mode} doctor digest(s) failed, their events stay queued")
+        batch.update({n.sent_at: datetime.utcnow()}, synchronize_session=False)
+        db.query(n).filter(n.sent_at < datetime.utcnow() - timedelta(days=7)).delete(synchronize_session=False)
+        db.commit()
+        sent = len(digests) - len(failed)
+        logger.info(f"Sent {sent} {mode} doctor digest(s) covering {len(events)} event(s)")
+        return sent
+    finally:
+        db.close()
+
+
+def start_digest_scheduler():
+    stop = threading.Event()
+
+    def loop():
+        while True:
+            now = datetime.now()
+            next_hour = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+            if stop.wait((next_hour - now).total_seconds()):
+                return
+            for mode in ("hourly", "daily") if next_hour.hour == settings.DIGEST_DAILY_HOUR else ("hourly",):
+                try:
+                    flush(mode)
+                except Exception as e:
+                    logger.error(f"{mode.capitalize()} digest run failed: {e}")
+
+    threading.Thread(target=loop, daemon=True, name="doctor-digests").start()
+    return stop
@@ -1,32 +1,52 @@
 import smtplib
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from jinja2 import Environment
 from config import settings
+from tracing import span
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+def _message(to_email: str, subject: str, html_body: str) -> str:
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
+    msg["To"] = to_email
+    msg.attach(MIMEText(html_body, "html"))
+    return msg.as_string()
+
+
 def send_email(to_email: str, subject: str, html_body: str):
     """Send an HTML email via SMTP."""
-    try:
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = f"{settings.EMAIL_FROM_NAME} <{settings.EMAIL_FROM}>"
-        msg["To"] = to_email
+    send_emails([(to_email, subject, html_body)])
 
-        msg.attach(MIMEText(html_body, "html"))
 
-        with smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
+def send_emails(messages):
+    """Send several ``(to_email, subject, html_body)`` emails over one SMTP session.
+
+    Returns one flag per message, True for those the server accepted.
+    """
+    sent = [False] * len(messages)
+    if not messages:
+        return sent
+    try:
+        with span("smtp.send", messages=len(messages)), smtplib.SMTP(settings.SMTP_HOST, settings.SMTP_PORT) as server:
             server.ehlo()
             server.starttls()
             server.login(settings.SMTP_USER, settings.SMTP_PASSWORD)
-            server.sendmail(settings.EMAIL_FROM, to_email, msg.as_string())
-
-        logger.info(f"Email sent to {to_email}")
+            for i, (to_email, subject, html_body) in enumerate(messages):
+                try:
+                    server.sendmail(settings.EMAIL_FROM, to_email, _message(to_email, subject, html_body))
+                    sent[i] = True
+                    logger.info(f"Email sent to {to_email}")
+                except smtplib.SMTPException as e:
+                    logger.error(f"Failed to send email to {to_email}: {e}")
     except Exception as e:
-        logger.error(f"Failed to send email to {to_email}: {e}")
+        logger.error(f"Failed to send {len(messages)} email(s): {e}")
         # Don't raise — email failure shouldn't block booking
+    return sent
 
 
 def send_booking_confirmation(
@@ -159,6 +179,55 @@ def send_cancellation_email(
     send_email(to_email, subject, html)
 
 
+def send_reschedule_email(
+    to_email: str,
+    recipient_name: str,
+    role: str,
+    other_name: str,
+    old_date: str,
+    old_time: str,
+    new_date: str,
+    new_time: str,
+    new_end_time: str,
+):
+    subject = f"🔁 Appointment Rescheduled – now {new_date} at {new_time}"
+    other_label = "Patient" if role == "doctor" else "Doctor"
+    other_value = other_name if role == "doctor" else f"Dr. {other_name}"
+    html = f"""
+    <div style="font-family: 'Segoe UI', sans-serif; max-width: 600px; margin: 0 auto; background: #f8fafc; padding: 40px 20px;">
+      <div style="background: #fff; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 24px rgba(0,0,0,0.07);">
+        <div style="background: linear-gradient(135deg, #78350f 0%, #f59e0b 100%); padding: 36px 40px;">
+          <h1 style="color: #fff; margin: 0; font-size: 26px; font-weight: 700;">Appointment Rescheduled</h1>
+        </div>
+        <div style="padding: 36px 40px;">
+          <p style="font-size: 16px; color: #374151;">Hi {"Dr. " if role == "doctor" else ""}<strong>{recipient_name}</strong>,</p>
+          <p style="color: #6b7280;">An appointment has been moved to a new time:</p>
+
+          <div style="background: #fffbeb; border: 1px solid #fde68a; border-radius: 12px; padding: 24px; margin: 24px 0;">
+            <table style="width: 100%; border-collapse: collapse;">
+              <tr>
+                <td style="padding: 8px 0; color: #6b7280; font-size: 14px; width: 40%;">{other_label}</td>
+                <td style="padding: 8px 0; color: #111827; font-weight: 600;">{other_value}</td>
+              </tr>
+              <tr>
+                <td style="padding: 8px 0; color: #6b7280; font-size: 14px;">Previously</td>
+                <td style="padding: 8px 0; color: #9ca3af; text-decoration: line-through;">{old_date} at {old_time}</td>
+              </tr>
+              <tr>
+                <td style="padding: 8px 0; color: #6b7280; font-size: 14px;">New time</td>
+                <td style="padding: 8px 0; color: #111827; font-weight: 600;">{new_date}, {new_time} – {new_end_time}</td>
+              </tr>
+            </table>
+          </div>
+
+          <p style="color: #6b7280; font-size: 14px;">— The DoctorBook Team</p>
+        </div>
+      </div>
+    </div>
+    """
+    send_email(to_email, subject, html)
+
+
 def send_prescription_email(
     to_email: str,
     patient_name: str,
@@ -196,3 +265,104 @@ def send_prescription_email(
     </div>
     """
     send_email(to_email, subject, html)
+
+
+def send_reminder_emails(reminders):
+    """Reminder for each upcoming appointment, all over one SMTP session."""
+    messages = []
+    for r in reminders:
+        subject = f"⏰ Reminder: appointment on {r['slot_date']} at {r['start_time']}"
+        html = f"""
+    <div style="font-family: 'Segoe UI', sans-serif; max-width: 600px; margin: 0 auto; background: #f8fafc; padding: 40px 20px;">
+      <div style="background: #fff; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 24px rgba(0,0,0,0.07);">
+        <div style="background: linear-gradient(135deg, #0f4c81 0%, #1a7fbf 100%); padding: 36px 40px;">
+          <h1 style="color: #fff; margin: 0; font-size: 26px; font-weight: 700;">Appointment Reminder</h1>
+        </div>
+        <div style="padding: 36px 40px;">
+          <p style="font-size: 16px; color: #374151;">Hi <strong>{r['patient_name']}</strong>,</p>
+          <p style="color: #6b7280;">This is a reminder of your upcoming appointment:</p>
+          <p style="color: #111827; font-weight: 600;">Dr. {r['doctor_name']} · {r['slot_date']}, {r['start_time']} – {r['end_time']}</p>
+          <p style="color: #6b7280; font-size: 14px;">Please arrive 10 minutes early. If you can't make it, please cancel so another patient can have the slot.</p>
+          <p style="color: #6b7280; font-size: 14px;">— The DoctorBook Team</p>
+        </div>
+      </div>
+    </div>
+    """
+        messages.append((r["to_email"], subject, html))
+    send_emails(messages)
+
+
+def send_waitlist_emails(notices):
+    """One email per waitlisted patient: either their booked slot or an offer to book it."""
+    messages = []
+    for n in notices:
+        if n["assigned"]:
+            subject = f"✅ Waitlist: booked for {n['slot_date']} at {n['start_time']}"
+            title, color = "You're Booked!", "#0f4c81 0%, #1a7fbf 100%"
+            body = "A slot opened up and we booked it for you from the waitlist:"
+            footer = "If you can no longer make it, please cancel from My Appointments so the next patient can have it."
+        else:
+            subject = f"⏰ A slot opened up – {n['slot_date']} at {n['start_time']}"
+            title, color = "A Slot Is Available", "#065f46 0%, #10b981 100%"
+            body = "A slot you were waiting for just became free:"
+            footer = f'Other patients on the waitlist were told too. <a href="{settings.FRONTEND_URL}/doctors">Book it now</a> before it is taken.'
+        html = f"""
+    <div style="font-family: 'Segoe UI', sans-serif; max-width: 600px; margin: 0 auto; background: #f8fafc; padding: 40px 20px;">
+      <div style="background: #fff; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 24px rgba(0,0,0,0.07);">
+        <div style="background: linear-gradient(135deg, {color}); padding: 36px 40px;">
+          <h1 style="color: #fff; margin: 0; font-size: 26px; font-weight: 700;">{title}</h1>
+        </div>
+        <div style="padding: 36px 40px;">
+          <p style="font-size: 16px; color: #374151;">Hi <strong>{n['patient_name']}</strong>,</p>
+          <p style="color: #6b7280;">{body}</p>
+          <p style="color: #111827; font-weight: 600;">Dr. {n['doctor_name']} · {n['slot_date']}, {n['start_time']} – {n['end_time']}</p>
+          <p style="color: #6b7280; font-size: 14px;">{footer}</p>
+          <p style="color: #6b7280; font-size: 14px;">— The DoctorBook Team</p>
+        </div>
+      </div>
+    </div>
+    """
+        messages.append((n["to_email"], subject, html))
+    send_emails(messages)
+
+
+_digest_env = Environment(autoescape=True, trim_blocks=True, lstrip_blocks=True)
+DIGEST_TEMPLATE = _digest_env.from_string("""
+    <div style="font-family: 'Segoe UI', sans-serif; max-width: 600px; margin: 0 auto; background: #f8fafc; padding: 40px 20px;">
+      <div style="background: #fff; border-radius: 16px; overflow: hidden; box-shadow: 0 4px 24px rgba(0,0,0,0.07);">
+        <div style="background: linear-gradient(135deg, #064e3b 0%, #10b981 100%); padding: 36px 40px;">
+          <h1 style="color: #fff; margin: 0; font-size: 26px; font-weight: 700;">Your Appointment Digest</h1>
+          <p style="color: rgba(255,255,255,0.8); margin: 8px 0 0;">{{ events|length }} update{{ "s" if events|length != 1 }} from {{ period }}</p>
+        </div>
+        <div style="padding: 36px 40px;">
+          <p style="font-size: 16px; color: #374151;">Hi Dr. <strong>{{ doctor_name }}</strong>,</p>
+          <table style="width: 100%; border-collapse: collapse; font-size: 14px;">
+            {% for e in events %}
+            <tr style="border-bottom: 1px solid #e5e7eb;">
+              <td style="padding: 10px 0; width: 30%; color: {{ colors[e.kind] }}; font-weight: 600;">{{ labels[e.kind] }}</td>
+              <td style="padding: 10px 0; color: #111827;">
+                <strong>{{ e.patient_name }}</strong> · {{ e.slot_date }} {{ e.start_time }}{% if e.end_time %} – {{ e.end_time }}{% endif %}
+                {% if e.detail %}<div style="color: #6b7280;">{{ e.detail }}</div>{% endif %}
+                {% if e.reason %}<div style="color: #6b7280;">Reason: {{ e.reason }}</div>{% endif %}
+              </td>
+            </tr>
+            {% endfor %}
+          </table>
+          <p style="color: #6b7280; font-size: 14px; margin-top: 24px;">— The DoctorBook Team</p>
+        </div>
+      </div>
+    </div>
+""")
+DIGEST_LABELS = {"booked": "New booking", "cancelled": "Cancelled", "rescheduled": "Rescheduled"}
+DIGEST_COLORS = {"booked": "#0369a1", "cancelled": "#b91c1c", "rescheduled": "#b45309"}
+
+
+def send_doctor_digests(digests):
+    """One digest email per doctor, all over one SMTP session. Returns a sent flag per digest."""
+    messages = []
+    for d in digests:
+        count = len(d["events"])
+        subject = f"📋 {count} appointment update{'s' if count != 1 else ''} from {d['period']}"
+        html = DIGEST_TEMPLATE.render(labels=DIGEST_LABELS, colors=DIGEST_COLORS, **d)
+        messages.append((d["to_email"], subject, html))
+    return send_emails(messages)
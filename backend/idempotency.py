@@ -0,0 +1,143 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response
+from sqlalchemy.exc import IntegrityError
+import models
+from auth import user_id_from_request
+from config import settings
+from database import SessionLocal
+
+HEADER = "Idempotency-Key"
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+# Streaming responses can't be replayed, and login/register responses carry
+# access tokens that must not sit in the table
+EXCLUDED_PREFIXES = ("/chat", "/auth")
+PURGE_INTERVAL_SECONDS = 600
+
+_last_purge = 0.0
+
+
+def _request_hash(request: Request, body: bytes) -> str:
+    h = hashlib.sha256()
+    for part in (request.method, request.url.path, request.url.query):
+        h.update(part.encode())
+        h.update(b"\0")
+    h.update(body)
+    return h.hexdigest()
+
+
+def _claim(user_id: int, key: str, request_hash: str):
+    """Return the existing record for the key, or None after reserving it for this request.
+
+    The reservation is a short lease: if the request dies without finishing,
+    a retry can claim the key again once the lease runs out.
+    """
+    global _last_purge
+    db = SessionLocal()
+    try:
+        now = datetime.utcnow()
+        if time.monotonic() - _last_purge > PURGE_INTERVAL_SECONDS:
+            _last_purge = time.monotonic()
+            db.query(models.IdempotencyRecord).filter(
+                models.IdempotencyRecord.expires_at < now
+            ).delete(synchronize_session=False)
+            db.commit()
+
+        record = db.query(models.IdempotencyRecord).filter(
+            models.IdempotencyRecord.user_id == user_id,
+            models.IdempotencyRecord.key == key,
+        ).first()
+        if record and record.expires_at < now:
+            db.delete(record)
+            db.commit()
+            record = None
+        if record:
+            db.expunge(record)
+            return record
+
+        db.add(models.IdempotencyRecord(
+            user_id=user_id,
+            key=key,
+            request_hash=request_hash,
+            expires_at=now + timedelta(seconds=settings.IDEMPOTENCY_LEASE_SECONDS),
+        ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent retry reserved it first
+            db.rollback()
+            return db.query(models.IdempotencyRecord).filter(
+                models.IdempotencyRecord.user_id == user_id,
+                models.IdempotencyRecord.key == key,
+            ).first()
+        return None
+    finally:
+        db.close()
+
+
+def _finish(user_id: int, key: str, status_code: int, content_type: str, body: bytes):
+    db = SessionLocal()
+    try:
+        q = db.query(models.IdempotencyRecord).filter(
+            models.IdempotencyRecord.user_id == user_id,
+            models.IdempotencyRecord.key == key,
+        )
+        if status_code >= 500:
+            # Let the client retry server errors for real
+            q.delete(synchronize_session=False)
+        else:
+            q.update({
+                models.IdempotencyRecord.status_code: status_code,
+                models.IdempotencyRecord.content_type: content_type,
+                models.IdempotencyRecord.response_body: body.decode("utf-8", "replace"),
+                models.IdempotencyRecord.expires_at: datetime.utcnow() + timedelta(hours=settings.IDEMPOTENCY_TTL_HOURS),
+            }, synchronize_session=False)
+        db.commit()
+    finally:
+        db.close()
+
+
+async def idempotency_middleware(request: Request, call_next):
+    """Replay the stored response when a mutating request is retried with the same Idempotency-Key."""
+    key = request.headers.get(HEADER)
+    if not key or request.method not in MUTATING_METHODS or request.url.path.startswith(EXCLUDED_PREFIXES):
+        return await call_next(request)
+    if len(key) > 100:
+        return JSONResponse({"detail": f"{HEADER} must be at most 100 characters"}, status_code=400)
+
+    body = await request.body()
+    user_id = user_id_from_request(request)
+    request_hash = _request_hash(request, body)
+    record = await run_in_threadpool(_claim, user_id, key, request_hash)
+    if record:
+        if record.request_hash != request_hash:
+            return JSONResponse({"detail": f"{HEADER} was already used for a different request"}, status_code=422)
+        if record.status_code is None:
+            retry_after = max(1, int((record.expires_at - datetime.utcnow()).total_seconds()) + 1)
+            return JSONResponse(
+                {"detail": "A request with this Idempotency-Key is still in progress"},
+                status_code=409,
+                headers={"Retry-After": str(retry_after)},
+            )
+        return Response(
+            content=record.response_body or b"",
+            status_code=record.status_code,
+            media_type=record.content_type,
+            headers={"Idempotent-Replayed": "true"},
+        )
+
+    try:
+        response = await call_next(request)
+    except Exception:
+        await run_in_threadpool(_finish, user_id, key, 500, "", b"")
+        raise
+    chunks = [chunk async for chunk in response.body_iterator]
+    content = b"".join(chunks)
+    await run_in_threadpool(
+        _finish, user_id, key, response.status_code, response.headers.get("content-type", ""), content
+    )
+    headers = {k: v for k, v in response.headers.items() if k.lower() != "content-length"}
+    return Response(content=content, status_code=response.status_code, headers=headers)
@@ -0,0 +1,201 @@
+"""Cross-worker cache invalidation.
+
+Writers call ``cache_bus.publish(topic, key)`` after committing. Caches
+register with ``cache_bus.subscribe(topic, handler)``, and the handler gets
+the key, or None for everything under the topic. Handlers in the publishing
+worker run straight away. The backend carries the message to other workers:
+
+* ``table``: rows in ``cache_invalidations``, polled by every worker each
+  CACHE_INVALIDATION_POLL_SECONDS; works wherever workers share the database.
+  Rows are written in batches by a sender thread, off the request path
+* ``pubsub``: the PUBSUB_BROKER_URL relay that slot events already use
+* ``local``: a single worker, nothing leaves the process
+
+Topics: ``doctors`` (doctor/specialization catalogue), ``agenda`` (key
+``"<doctor_id>"`` or ``"<doctor_id>:<date>"``).
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from sqlalchemy import func
+import models
+from config import settings
+from database import SessionLocal
+from pubsub import bus
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    def __init__(self, backend=None):
+        self.origin = uuid.uuid4().hex
+        self.backend = backend
+        self._handlers = defaultdict(list)
+
+    def subscribe(self, topic: str, handler):
+        self._handlers[topic].append(handler)
+
+    def deliver(self, topic: str, key):
+        for handler in self._handlers.get(topic, ()):
+            try:
+                handler(key)
+            except Exception as e:
+                logger.error(f"Cache invalidation handler for {topic} failed: {e}")
+
+    def publish(self, topic: str, key=None, local: bool = True):
+        """Invalidate ``key`` under ``topic`` everywhere. ``local=False`` skips this worker's
+        handlers, for caches that already updated themselves."""
+        key = None if key is None else str(key)
+        if local:
+            self.deliver(topic, key)
+        if self.backend:
+            try:
+                self.backend.send(self.origin, topic, key)
+            except Exception as e:
+                logger.error(f"Cache invalidation send failed ({topic}): {e}")
+
+    def start(self):
+        if self.backend:
+            self.backend.start(self)
+
+
+class TableBackend:
+    """Invalidations as rows in the shared database.
+
+    Each worker polls the rows above a floor id. Ids are handed out at insert
+    but become visible at commit, so a lower id can appear after a higher
+    one: rows stay above the floor (and are re-read, skipping those already
+    delivered) until everything below them has had ``rescan`` seconds to
+    commit.
+    """
+
+    def __init__(self, interval: float, rescan: float, retention_seconds: int = 3600):
+        self.interval = interval
+        self.rescan = rescan
+        self.retention = timedelta(seconds=retention_seconds)
+        self._floor = 0
+        self._seen = {}  # id above the floor -> monotonic time it was first read
+        self._pruned_at = 0.0
+        self._thread = None
+        self._outbox = []
+        self._outbox_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._sender = None
+
+    def send(self, origin: str, topic: str, key):
+        if self._sender is None:
+            # Not started (scripts, tests): write straight away
+            self._write([(origin, topic, key)])
+            return
+        with self._outbox_lock:
+            self._outbox.append((origin, topic, key))
+        self._wake.set()
+
+    def _write(self, messages):
+        db = SessionLocal()
+        try:
+            db.add_all([models.CacheInvalidation(origin=o, topic=t, key=k) for o, t, k in messages])
+            db.commit()
+        finally:
+            db.close()
+
+    def _send_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            with self._outbox_lock:
+                batch, self._outbox = self._outbox, []
+            if not batch:
+                continue
+            try:
+                # A burst of bookings on one day repeats the same key
+                self._write(list(dict.fromkeys(batch)))
+            except Exception as e:
+                logger.error(f"Cache invalidation send failed ({len(batch)} message(s)): {e}")
+
+    def _poll(self, bus_: InvalidationBus):
+        c = models.CacheInvalidation
+        db = SessionLocal()
+        try:
+            rows = db.query(c.id, c.topic, c.key, c.origin).filter(c.id > self._floor).order_by(c.id).all()
+            if time.monotonic() - self._pruned_at > self.retention.total_seconds():
+                db.query(c).filter(c.created_at < datetime.utcnow() - self.retention).delete(synchronize_session=False)
+                db.commit()
+                self._pruned_at = time.monotonic()
+        finally:
+            db.close()
+        now = time.monotonic()
+        for row in rows:
+            if row.id in self._seen:
+                continue
+            self._seen[row.id] = now
+            if row.origin != bus_.origin:
+                bus_.deliver(row.topic, row.key)
+        # Raise the floor past rows read long enough ago that no gap below them can still fill
+        pending = [i for i, t in self._seen.items() if now - t < self.rescan]
+        limit = min(pending) if pending else float("inf")
+        settled = [i for i in self._seen if i < limit]
+        if settled:
+            self._floor = max(settled)
+            for i in settled:
+                del self._seen[i]
+
+    def start(self, bus_: InvalidationBus):
+        if self._thread:
+            return
+        db = SessionLocal()
+        try:
+            self._floor = db.query(func.max(models.CacheInvalidation.id)).scalar() or 0
+        finally:
+            db.close()
+        self._pruned_at = time.monotonic()
+
+        def loop():
+            while True:
+                time.sleep(self.interval)
+                try:
+                    self._poll(bus_)
+                except Exception as e:
+                    logger.error(f"Cache invalidation poll failed: {e}")
+
+        self._thread = threading.Thread(target=loop, daemon=True, name="cache-invalidation")
+        self._thread.start()
+        self._sender = threading.Thread(target=self._send_loop, daemon=True, name="cache-invalidation-send")
+        self._sender.start()
+
+
+class PubSubBackend:
+    """Invalidations over the pub/sub broker relay (no database writes)."""
+
+    CHANNEL = "cache:invalidate"
+
+    def __init__(self, pubsub):
+        if not pubsub.broker:
+            raise ValueError("CACHE_INVALIDATION_BACKEND=pubsub needs PUBSUB_BROKER_URL")
+        self.pubsub = pubsub
+
+    def send(self, origin: str, topic: str, key):
+        self.pubsub.broker.send(self.CHANNEL, {"o": origin, "t": topic, "k": key})
+
+    def start(self, bus_: InvalidationBus):
+        def receive(message):
+            if message.get("o") != bus_.origin:
+                bus_.deliver(message["t"], message.get("k"))
+
+        self.pubsub.listen(self.CHANNEL, receive)
+
+
+def backend_from_setting(name: str):
+    if name in ("", "local"):
+        return None
+    if name == "table":
+        return TableBackend(settings.CACHE_INVALIDATION_POLL_SECONDS, settings.CACHE_INVALIDATION_RESCAN_SECONDS)
+    if name == "pubsub":
+        return PubSubBackend(bus)
+    raise ValueError(f"Unsupported cache invalidation backend: {name}")
+
+
+cache_bus = InvalidationBus(backend_from_setting(settings.CACHE_INVALIDATION_BACKEND))
@@ -0,0 +1,334 @@
+import json
+import queue
+import socket
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+import requests
+from requests.adapters import HTTPAdapter
+from config import settings
+
+
+def _shutdown(response):
+    # close() alone does not wake a thread blocked reading the socket
+    sock = getattr(getattr(response.raw, "connection", None), "sock", None)
+    if sock is None:
+        # http.client hands the socket to the response when the connection won't be reused
+        fp = getattr(getattr(response.raw, "_fp", None), "fp", None)
+        sock = getattr(getattr(fp, "raw", None), "_sock", None)
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+
+class StreamAbort(threading.Event):
+    """Stops a provider stream from another thread.
+
+    Setting it shuts down the HTTP responses the stream has open, so a read
+    waiting on the model returns at once instead of after the next token.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._lock = threading.Lock()
+        self._responses = set()
+        self._children = []
+
+    def set(self):
+        super().set()
+        with self._lock:
+            responses = list(self._responses)
+            children, self._children = self._children, []
+        for response in responses:
+            _shutdown(response)
+        for child in children:
+            child.set()
+
+    def child(self) -> "StreamAbort":
+        """A new abort that can be set on its own, and is also set with this one."""
+        child = StreamAbort()
+        with self._lock:
+            if not self.is_set():
+                self._children.append(child)
+                return child
+        child.set()
+        return child
+
+    @contextmanager
+    def watch(self, response):
+        with self._lock:
+            self._responses.add(response)
+        try:
+            if self.is_set():
+                _shutdown(response)
+            yield response
+        finally:
+            with self._lock:
+                self._responses.discard(response)
+
+
+class LLMProvider(ABC):
+    """Chat completion backend. ``messages`` use the OpenAI/Ollama role format.
+
+    Subclasses implement ``stream``; ``chat`` and ``warm_up`` have defaults.
+    """
+
+    name = "base"
+
+    def __init__(self, model: str, timeout=None, pool_size: int = 10):
+        self.model = model
+        self.timeout = timeout or (settings.LLM_CONNECT_TIMEOUT, settings.LLM_READ_TIMEOUT)
+        # One pooled session per provider keeps connections warm between requests
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    @property
+    def cache_id(self) -> str:
+        return f"{self.name}:{self.model}"
+
+    def chat(self, messages: list) -> str:
+        return "".join(self.stream(messages))
+
+    @abstractmethod
+    def stream(self, messages: list, abort: StreamAbort = None):
+        """Yield the reply as text chunks. Setting ``abort`` ends the stream early."""
+
+    @contextmanager
+    def _post_stream(self, url: str, abort: StreamAbort = None, **kwargs):
+        with self.session.post(url, stream=True, timeout=self.timeout, **kwargs) as response:
+            response.raise_for_status()
+            if abort is None:
+                yield response
+            else:
+                with abort.watch(response):
+                    yield response
+
+    def warm_up(self, messages: list):
+        """Get the model ready to answer ``messages`` quickly. Hosted APIs need nothing."""
+
+
+def _sse_data(response):
+    for line in response.iter_lines():
+        if line and line.startswith(b"data:"):
+            yield line[5:].strip()
+
+
+class OllamaProvider(LLMProvider):
+    name = "ollama"
+
+    def __init__(self, base_url: str, model: str, keep_alive: str = "", **kwargs):
+        super().__init__(model, **kwargs)
+        self.url = f"{base_url.rstrip('/')}/api/chat"
+        # How long Ollama keeps the model loaded after a request ("30m", "-1" = forever)
+        self.keep_alive = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+
+    def _payload(self, messages, stream: bool) -> dict:
+        payload = {"model": self.model, "messages": messages, "stream": stream}
+        if self.keep_alive != "":
+            payload["keep_alive"] = self.keep_alive
+        return payload
+
+    def chat(self, messages):
+        response = self.session.post(self.url, json=self._payload(messages, False), timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()['message']['content']
+
+    def warm_up(self, messages):
+        # Loads the model and evaluates the prompt, leaving it in the prompt cache
+        payload = {**self._payload(messages, False), "options": {"num_predict": 1}}
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+
+    def stream(self, messages, abort=None):
+        with self._post_stream(self.url, abort, json=self._payload(messages, True)) as response:
+            for line in response.iter_lines():
+                if line:
+                    content = json.loads(line).get('message', {}).get('content')
+                    if content:
+                        yield content
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+
+    def __init__(self, base_url: str, model: str, api_key: str, **kwargs):
+        super().__init__(model, **kwargs)
+        self.url = f"{base_url.rstrip('/')}/chat/completions"
+        self.session.headers["Authorization"] = f"Bearer {api_key}"
+
+    def chat(self, messages):
+        payload = {"model": self.model, "messages": messages}
+        response = self.session.post(self.url, json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"]
+
+    def stream(self, messages, abort=None):
+        payload = {"model": self.model, "messages": messages, "stream": True}
+        with self._post_stream(self.url, abort, json=payload) as response:
+            for data in _sse_data(response):
+                if data == b"[DONE]":
+                    break
+                choices = json.loads(data).get("choices") or []
+                content = choices[0].get("delta", {}).get("content") if choices else None
+                if content:
+                    yield content
+
+
+class GeminiProvider(LLMProvider):
+    name = "gemini"
+
+    def __init__(self, base_url: str, model: str, api_key: str, **kwargs):
+        super().__init__(model, **kwargs)
+        self.base = f"{base_url.rstrip('/')}/v1beta/models/{model}"
+        self.session.headers["x-goog-api-key"] = api_key or ""
+
+    def _payload(self, messages):
+        system = "\n".join(m["content"] for m in messages if m["role"] == "system")
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [{"text": m["content"]}]}
+            for m in messages if m["role"] != "system"
+        ]
+        payload = {"contents": contents}
+        if system:
+            payload["systemInstruction"] = {"parts": [{"text": system}]}
+        return payload
+
+    @staticmethod
+    def _text(body):
+        candidates = body.get("candidates") or []
+        if not candidates:
+            return ""
+        parts = candidates[0].get("content", {}).get("parts") or []
+        return "".join(p.get("text", "") for p in parts)
+
+    def chat(self, messages):
+        response = self.session.post(f"{self.base}:generateContent", json=self._payload(messages), timeout=self.timeout)
+        response.raise_for_status()
+        return self._text(response.json())
+
+    def stream(self, messages, abort=None):
+        url = f"{self.base}:streamGenerateContent"
+        with self._post_stream(url, abort, params={"alt": "sse"}, json=self._payload(messages)) as response:
+            for data in _sse_data(response):
+                text = self._text(json.loads(data))
+                if text:
+                    yield text
+
+
+class HedgedProvider(LLMProvider):
+    """Streams from ``primary`` and, if no token has arrived after
+    ``hedge_after`` seconds, also starts ``fallback``. Whichever produces the
+    first token wins; the other's HTTP response is closed at once.
+    """
+
+    name = "hedged"
+
+    def __init__(self, primary: LLMProvider, fallback: LLMProvider, hedge_after: float):
+        # The wrapped providers make the requests; this one's session stays unused
+        super().__init__(f"{primary.cache_id}|{fallback.cache_id}", timeout=primary.timeout, pool_size=1)
+        self.primary = primary
+        self.fallback = fallback
+        self.hedge_after = hedge_after
+
+    def warm_up(self, messages):
+        self.primary.warm_up(messages)
+        self.fallback.warm_up(messages)
+
+    def _pump(self, idx, provider, messages, events, abort):
+        gen = provider.stream(messages, abort)
+        try:
+            for chunk in gen:
+                if abort.is_set():
+                    return
+                events.put((idx, "chunk", chunk))
+            events.put((idx, "done", None))
+        except Exception as e:
+            events.put((idx, "error", e))
+        finally:
+            gen.close()
+
+    def stream(self, messages, abort=None):
+        events = queue.Queue()
+        providers = [self.primary, self.fallback]
+        # One per side, so the loser can be stopped alone
+        aborts = [abort.child() if abort else StreamAbort() for _ in providers]
+        running = set()
+
+        def start(idx):
+            running.add(idx)
+            threading.Thread(
+                target=self._pump, args=(idx, providers[idx], messages, events, aborts[idx]), daemon=True
+            ).start()
+
+        start(0)
+        winner = None
+        last_error = None
+        try:
+            while True:
+                try:
+                    timeout = self.hedge_after if winner is None and 1 not in running else None
+                    idx, kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    start(1)
+                    continue
+
+                if winner is not None and idx != winner:
+                    continue
+                if kind == "error":
+                    last_error = value
+                    running.discard(idx)
+                    if winner is None and 1 not in running and idx == 0:
+                        # Primary failed before producing anything: go straight to the fallback
+                        start(1)
+                        continue
+                    if winner is None and running:
+                        continue
+                    raise last_error
+                if kind == "done":
+                    if winner is None:
+                        running.discard(idx)
+                        if running:
+                            continue
+                    return
+                if winner is None:
+                    winner = idx
+                    aborts[1 - idx].set()
+                yield value
+        finally:
+            for side in aborts:
+                side.set()
+
+
+def build_provider(name: str) -> LLMProvider:
+    name = (name or "ollama").lower()
+    if name == "ollama":
+        return OllamaProvider(settings.OLLAMA_URL, settings.OLLAMA_MODEL, settings.OLLAMA_KEEP_ALIVE)
+    if name == "openai":
+        return OpenAIProvider(settings.OPENAI_BASE_URL, settings.OPENAI_MODEL, settings.OPENAI_API_KEY or "")
+    if name in ("gemini", "google"):
+        return GeminiProvider(settings.GOOGLE_BASE_URL, settings.GOOGLE_MODEL, settings.GOOGLE_API_KEY or "")
+    raise ValueError(f"Unknown LLM provider: {name} (use ollama, openai or gemini)")
+
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def get_provider() -> LLMProvider:
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                provider = build_provider(settings.LLM_PROVIDER)
+                if settings.LLM_FALLBACK_PROVIDER and settings.LLM_HEDGE_AFTER_MS > 0:
+                    provider = HedgedProvider(
+                        provider,
+                        build_provider(settings.LLM_FALLBACK_PROVIDER),
+                        settings.LLM_HEDGE_AFTER_MS / 1000,
+                    )
+                _provider = provider
+    return _provider
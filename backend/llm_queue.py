@@ -0,0 +1,152 @@
+import heapq
+import itertools
+import threading
+import time
+import weakref
+from collections import deque
+from config import settings
+
+# Lower number = served first
+PRIORITY_PATIENT = 0
+PRIORITY_STAFF = 1
+
+
+class QueueFull(Exception):
+    pass
+
+
+class QueueTimeout(Exception):
+    pass
+
+
+def priority_for(user) -> int:
+    # Chat requires a login, so every caller is either a patient or staff
+    if user.role == "patient":
+        return PRIORITY_PATIENT
+    return PRIORITY_STAFF
+
+
+class Ticket:
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Caps concurrent LLM generations and queues the rest by priority.
+
+    Waiters beyond ``max_queue`` are rejected immediately with ``QueueFull``;
+    waiters that are not admitted within ``timeout`` seconds get ``QueueTimeout``.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._active = 0
+        self._waiting = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._admitted = 0
+        self._rejected = 0
+        self._timed_out = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits = deque(maxlen=500)
+
+    def acquire(self, priority: int = PRIORITY_STAFF) -> Ticket:
+        start = time.monotonic()
+        with self._cond:
+            if not self._waiting and self._active < self.max_concurrency:
+                self._active += 1
+                self._record_wait(0.0)
+                return Ticket(self)
+            if len(self._waiting) >= self.max_queue:
+                self._rejected += 1
+                raise QueueFull()
+
+            entry = (priority, next(self._seq))
+            heapq.heappush(self._waiting, entry)
+            deadline = start + self.timeout
+            while not (self._waiting[0] == entry and self._active < self.max_concurrency):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiting.remove(entry)
+                    heapq.heapify(self._waiting)
+                    self._timed_out += 1
+                    self._cond.notify_all()
+                    raise QueueTimeout()
+                self._cond.wait(remaining)
+
+            heapq.heappop(self._waiting)
+            self._active += 1
+            self._record_wait(time.monotonic() - start)
+            self._cond.notify_all()
+            return Ticket(self)
+
+    def _release(self):
+        with self._cond:
+            self._active -= 1
+            self._cond.notify_all()
+
+    def _record_wait(self, waited: float):
+        self._admitted += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+        self._recent_waits.append(waited)
+
+    def retry_after(self) -> int:
+        # Rough guess: one queue's worth of generations ahead of the caller
+        return max(1, int(self.timeout / 2))
+
+    def metrics(self) -> dict:
+        with self._cond:
+            recent = sorted(self._recent_waits)
+            p50 = recent[len(recent) // 2] if recent else 0.0
+            p95 = recent[min(len(recent) - 1, int(len(recent) * 0.95))] if recent else 0.0
+            return {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "active": self._active,
+                "queue_depth": len(self._waiting),
+                "admitted": self._admitted,
+                "rejected": self._rejected,
+                "timed_out": self._timed_out,
+                "wait_avg_ms": round(self._wait_total / self._admitted * 1000, 2) if self._admitted else 0.0,
+                "wait_p50_ms": round(p50 * 1000, 2),
+                "wait_p95_ms": round(p95 * 1000, 2),
+                "wait_max_ms": round(self._wait_max * 1000, 2),
+            }
+
+
+def release_when_done(stream, ticket: Ticket):
+    """Wrap a generator so ``ticket`` is released once it finishes or is dropped."""
+    def wrapper():
+        try:
+            yield from stream
+        finally:
+            ticket.release()
+
+    gen = wrapper()
+    # A response that is cancelled before it starts iterating never runs the
+    # finally block, so also release when the generator is garbage collected.
+    weakref.finalize(gen, ticket.release)
+    return gen
+
+
+llm_admission = AdmissionController(
+    max_concurrency=settings.LLM_MAX_CONCURRENCY,
+    max_queue=settings.LLM_MAX_QUEUE,
+    timeout=settings.LLM_QUEUE_TIMEOUT,
+)
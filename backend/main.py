@@ -1,16 +1,40 @@
-from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Depends, HTTPException, status, BackgroundTasks, Request, Query, UploadFile, File
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
 from sqlalchemy.orm import Session, joinedload
 from sqlalchemy import text
 from datetime import timedelta, datetime
 from typing import List, Optional
 import threading
+import csv
 
 from database import get_db, engine
+from replicas import get_read_db, read_your_writes_middleware, replicas
 import models
 import schemas
 import rag
+import sse
+import slot_events
+import schedules
+import waitlist
+import reminders
+import digest
+import tracing
+import profiler
+import archive
+import appointment_list
+import calendar_feed
+from appointment_list import FastJSONResponse
+import search
+import analytics
+from agenda import agenda_cache, get_agenda
+import bulk_import
+import idempotency
+import ratelimit
+from pubsub import bus
+from invalidation import cache_bus
+from llm_queue import llm_admission, priority_for, QueueFull, QueueTimeout
+from llm_providers import StreamAbort, get_provider
 from auth import (
     hash_password, verify_password, create_access_token,
     get_current_user, require_role
@@ -19,7 +43,9 @@ from email_utils import (
     send_booking_confirmation,
     send_doctor_notification,
     send_cancellation_email,
+    send_reschedule_email,
     send_prescription_email,
+    send_waitlist_emails,
 )
 from config import settings
 
@@ -38,9 +64,113 @@ def run_migrations():
             except Exception as e:
                 print(f"Migration failed: {e}")
 
+        try:
+            connection.execute(text("SELECT notification_mode FROM doctors LIMIT 1"))
+        except Exception:
+            connection.rollback()
+            print("Migrating DB: Adding notification_mode to doctors table...")
+            try:
+                connection.execute(text("ALTER TABLE doctors ADD COLUMN notification_mode VARCHAR(10) DEFAULT 'immediate'"))
+                connection.commit()
+            except Exception as e:
+                print(f"Migration failed: {e}")
+
+        try:
+            connection.execute(text("SELECT calendar_feed_version FROM users LIMIT 1"))
+        except Exception:
+            connection.rollback()
+            print("Migrating DB: Adding calendar_feed_version to users table...")
+            try:
+                connection.execute(text("ALTER TABLE users ADD COLUMN calendar_feed_version INTEGER DEFAULT 0"))
+                connection.commit()
+            except Exception as e:
+                print(f"Migration failed: {e}")
+
+        try:
+            connection.execute(text("SELECT claimed_at FROM doctor_notifications LIMIT 1"))
+        except Exception:
+            connection.rollback()
+            print("Migrating DB: Adding claimed_at to doctor_notifications table...")
+            try:
+                connection.execute(text("ALTER TABLE doctor_notifications ADD COLUMN claimed_at DATETIME"))
+                connection.commit()
+            except Exception as e:
+                print(f"Migration failed: {e}")
+
+        for table in ("appointments", "appointments_archive"):
+            try:
+                connection.execute(text(f"SELECT updated_at FROM {table} LIMIT 1"))
+            except Exception:
+                connection.rollback()
+                print(f"Migrating DB: Adding updated_at to {table} table...")
+                try:
+                    connection.execute(text(f"ALTER TABLE {table} ADD COLUMN updated_at DATETIME"))
+                    if table == "appointments":
+                        connection.execute(text("CREATE INDEX ix_appointments_updated_at ON appointments (updated_at)"))
+                    connection.commit()
+                except Exception as e:
+                    print(f"Migration failed: {e}")
+
+        # Needed so concurrently booked schedule slots can't be stored twice
+        try:
+            connection.execute(text(
+                "CREATE UNIQUE INDEX uq_slot_doctor_time ON slots (doctor_id, slot_date, start_time)"
+            ))
+            connection.commit()
+        except Exception:
+            connection.rollback()  # already exists
+
+        # appointments.slot_id used to be UNIQUE, which stopped freed slots
+        # from being booked again. Keep a plain index for the foreign key.
+        if engine.dialect.name == "mysql":
+            for ddl in (
+                "CREATE INDEX ix_appointments_slot_id ON appointments (slot_id)",
+                "ALTER TABLE appointments DROP INDEX slot_id",
+            ):
+                try:
+                    connection.execute(text(ddl))
+                    connection.commit()
+                except Exception:
+                    connection.rollback()  # already done
+
+        # Full-text indexes for /doctors/search (MySQL only; other databases
+        # use the in-memory index in search.py)
+        if engine.dialect.name == "mysql":
+            for ddl in (
+                "ALTER TABLE users ADD FULLTEXT INDEX ft_users_full_name (full_name)",
+                "ALTER TABLE doctors ADD FULLTEXT INDEX ft_doctors_bio_qualification (bio, qualification)",
+                "ALTER TABLE specializations ADD FULLTEXT INDEX ft_specializations_name (name)",
+            ):
+                try:
+                    connection.execute(text(ddl))
+                    connection.commit()
+                except Exception:
+                    connection.rollback()  # already exists
+
 run_migrations()
 
 app = FastAPI(title="DoctorBook API", version="1.0.0")
+# Lets a profiled request sample only the thread running its handler
+app.router.route_class = profiler.ProfiledRoute
+
+
+@app.on_event("startup")
+def start_background_services():
+    # Fail at startup on an unknown LLM_PROVIDER, not on the first chat request
+    get_provider()
+    bus.start()
+    cache_bus.start()
+    archive.start_archive_scheduler()
+    replicas.start()
+    reminders.scheduler.start()
+    digest.start_digest_scheduler()
+    analytics.start_offered_scheduler()
+    if settings.LLM_WARMUP:
+        threading.Thread(target=rag.warm_up, daemon=True, name="llm-warm-up").start()
+
+
+app.middleware("http")(idempotency.idempotency_middleware)
+app.middleware("http")(read_your_writes_middleware)
 
 app.add_middleware(
     CORSMiddleware,
@@ -48,8 +178,16 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[tracing.REQUEST_ID_HEADER, "X-Profile-Name", "X-Sync-Token"],
 )
 
+app.add_middleware(profiler.ProfilingMiddleware)
+
+# Outermost, so the trace covers the other middleware too
+app.middleware("http")(tracing.tracing_middleware)
+for traced_engine in [engine, *replicas.engines]:
+    tracing.instrument_engine(traced_engine)
+
 
 # ──────────────────────────────────────────────────────────────────────────────
 # AUTH
@@ -84,7 +222,15 @@ def register(data: schemas.RegisterRequest, db: Session = Depends(get_db)):
 
 
 @app.post("/auth/login", response_model=schemas.TokenResponse)
-def login(data: schemas.LoginRequest, db: Session = Depends(get_db)):
+def login(data: schemas.LoginRequest, request: Request, db: Session = Depends(get_db)):
+    # Each attempt costs an Argon2 verify, so throttle per IP and per account.
+    # The account bucket is per client too, so nobody else can drain it and
+    # lock the owner out.
+    ip = ratelimit.client_ip(request)
+    ratelimit.enforce(
+        "login", settings.RATE_LIMIT_LOGIN_PER_MINUTE,
+        f"ip:{ip}", f"user:{data.username}:ip:{ip}",
+    )
     user = db.query(models.User).filter(models.User.username == data.username).first()
     if not user or not verify_password(data.password, user.password):
         raise HTTPException(401, "Invalid credentials")
@@ -124,6 +270,7 @@ def create_specialization(
     db.add(spec)
     db.commit()
     db.refresh(spec)
+    cache_bus.publish("doctors")
     return spec
 
 
@@ -138,6 +285,7 @@ def delete_specialization(
         raise HTTPException(404, "Not found")
     db.delete(spec)
     db.commit()
+    cache_bus.publish("doctors")
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -147,7 +295,7 @@ def delete_specialization(
 @app.get("/doctors", response_model=List[schemas.DoctorOut])
 def list_doctors(
     specialization_id: Optional[int] = None,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
     q = db.query(models.Doctor).options(
         joinedload(models.Doctor.user),
@@ -158,6 +306,29 @@ def list_doctors(
     return q.all()
 
 
+@app.get("/doctors/search", response_model=schemas.DoctorSearchResult)
+def search_doctors(
+    q: Optional[str] = None,
+    specialization_id: Optional[int] = None,
+    min_fee: Optional[int] = None,
+    max_fee: Optional[int] = None,
+    min_experience: Optional[int] = None,
+    page: int = Query(1, ge=1),
+    page_size: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db),
+):
+    total, doctors = search.search_doctors(
+        db, q,
+        specialization_id=specialization_id,
+        min_fee=min_fee,
+        max_fee=max_fee,
+        min_experience=min_experience,
+        page=page,
+        page_size=page_size,
+    )
+    return schemas.DoctorSearchResult(total=total, page=page, page_size=page_size, results=doctors)
+
+
 @app.get("/doctors/{doctor_id}", response_model=schemas.DoctorOut)
 def get_doctor(doctor_id: int, db: Session = Depends(get_db)):
     doctor = db.query(models.Doctor).options(
@@ -181,6 +352,7 @@ def create_doctor(
     db.add(doctor)
     db.commit()
     db.refresh(doctor)
+    cache_bus.publish("doctors")
     return db.query(models.Doctor).options(
         joinedload(models.Doctor.user),
         joinedload(models.Doctor.specialization),
@@ -201,9 +373,34 @@ def update_doctor(
         setattr(doctor, k, v)
     db.commit()
     db.refresh(doctor)
+    cache_bus.publish("doctors")
     return doctor
 
 
+@app.get("/doctors/{doctor_id}/notifications", response_model=schemas.NotificationSettings)
+def get_notification_settings(
+    doctor_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    doctor = get_own_doctor(db, doctor_id, current_user)
+    return {"mode": doctor.notification_mode or "immediate"}
+
+
+@app.put("/doctors/{doctor_id}/notifications", response_model=schemas.NotificationSettings)
+def update_notification_settings(
+    doctor_id: int,
+    data: schemas.NotificationSettings,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Choose immediate booking emails or an hourly/daily digest."""
+    doctor = get_own_doctor(db, doctor_id, current_user)
+    doctor.notification_mode = data.mode
+    db.commit()
+    return {"mode": doctor.notification_mode}
+
+
 # ──────────────────────────────────────────────────────────────────────────────
 # SLOTS
 # ──────────────────────────────────────────────────────────────────────────────
@@ -222,14 +419,26 @@ def get_slots(
     doctor_id: int,
     date: Optional[str] = None,
     available_only: bool = False,
-    db: Session = Depends(get_db),
+    db: Session = Depends(get_read_db),
 ):
-    q = db.query(models.Slot).filter(models.Slot.doctor_id == doctor_id)
-    if date:
-        q = q.filter(models.Slot.slot_date == date)
-    if available_only:
-        q = q.filter(models.Slot.is_booked == False)
-    return q.order_by(models.Slot.slot_date, models.Slot.start_time).all()
+    return schedules.list_slots(db, doctor_id, date, available_only)
+
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+@app.get("/doctors/{doctor_id}/slots/events")
+def doctor_slot_events(doctor_id: int, request: Request):
+    """Server-Sent Events stream of slot changes for one doctor."""
+    stream = slot_events.slot_event_stream(request, [slot_events.doctor_channel(doctor_id)])
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/specializations/{spec_id}/slots/events")
+def specialization_slot_events(spec_id: int, request: Request):
+    """Server-Sent Events stream of slot changes for every doctor in a specialization."""
+    stream = slot_events.slot_event_stream(request, [slot_events.specialization_channel(spec_id)])
+    return StreamingResponse(stream, media_type="text/event-stream", headers=SSE_HEADERS)
 
 
 @app.post("/doctors/{doctor_id}/slots", response_model=schemas.SlotOut, status_code=201)
@@ -245,6 +454,8 @@ def create_slot(
         raise HTTPException(404, "Doctor not found")
     if current_user.role != "admin" and doctor.user_id != current_user.id:
         raise HTTPException(403, "Cannot add slots for another doctor")
+    check_date(data.slot_date)
+    check_time(data.start_time)
 
     end_time = calc_end_time(data.start_time)
 
@@ -264,8 +475,11 @@ def create_slot(
         end_time=end_time,
     )
     db.add(slot)
+    analytics.refresh_offered(db, doctor_id, data.slot_date, data.slot_date)
     db.commit()
     db.refresh(slot)
+    slot_events.publish_slot_change(db, slot, "created")
+    agenda_cache.refresh_day(db, doctor_id, slot.slot_date)
     return slot
 
 
@@ -341,7 +555,12 @@ def create_slots_bulk(
             curr_dt += timedelta(minutes=data.slot_duration)
         current_date += timedelta(days=1)
 
+    if created_count:
+        analytics.refresh_offered(db, doctor_id, start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d"))
     db.commit()
+    if created_count:
+        slot_events.publish_slots_refresh(db, doctor_id)
+        agenda_cache.invalidate_doctor(doctor_id)
     return {"message": f"Created {created_count} slots"}
 
 
@@ -363,7 +582,20 @@ def clear_future_slots(
         models.Slot.is_booked == False,
         models.Slot.slot_date >= today
     ).delete(synchronize_session=False)
+    # Stop generating open slots from the doctor's schedule rules too
+    yesterday = (datetime.now() - timedelta(days=1)).strftime("%Y-%m-%d")
+    db.query(models.ScheduleRule).filter(
+        models.ScheduleRule.doctor_id == doctor_id,
+        models.ScheduleRule.valid_from >= today,
+    ).delete(synchronize_session=False)
+    db.query(models.ScheduleRule).filter(
+        models.ScheduleRule.doctor_id == doctor_id,
+        (models.ScheduleRule.valid_until == None) | (models.ScheduleRule.valid_until >= today),
+    ).update({models.ScheduleRule.valid_until: yesterday}, synchronize_session=False)
+    analytics.refresh_offered(db, doctor_id, today)
     db.commit()
+    slot_events.publish_slots_refresh(db, doctor_id)
+    agenda_cache.invalidate_doctor(doctor_id)
 
 
 @app.delete("/doctors/{doctor_id}/slots/{slot_id}", status_code=204)
@@ -386,8 +618,254 @@ def delete_slot(
     if current_user.role != "admin" and doctor.user_id != current_user.id:
         raise HTTPException(403, "Forbidden")
 
+    snapshot = schemas.SlotOut.model_validate(slot)
     db.delete(slot)
+    analytics.refresh_offered(db, doctor_id, snapshot.slot_date, snapshot.slot_date)
+    db.commit()
+    slot_events.publish_slot_change(db, snapshot, "deleted")
+    agenda_cache.refresh_day(db, doctor_id, snapshot.slot_date)
+
+
+@app.get("/doctors/{doctor_id}/agenda", response_model=List[schemas.AgendaDay])
+def doctor_agenda(
+    doctor_id: int,
+    date: Optional[str] = None,
+    days: int = Query(1, ge=1, le=7),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """The doctor's slots and appointments for a day (or up to a week), in time order."""
+    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
+    if not doctor:
+        raise HTTPException(404, "Doctor not found")
+    if current_user.role != "admin" and doctor.user_id != current_user.id:
+        raise HTTPException(403, "Forbidden")
+    check_date(date)
+    return get_agenda(db, doctor_id, date or datetime.now().strftime("%Y-%m-%d"), days)
+
+
+# ──────────────────────────────────────────────────────────────────────────────
+# SCHEDULE RULES
+# ──────────────────────────────────────────────────────────────────────────────
+
+def get_own_doctor(db: Session, doctor_id: int, current_user: models.User) -> models.Doctor:
+    doctor = db.query(models.Doctor).filter(models.Doctor.id == doctor_id).first()
+    if not doctor:
+        raise HTTPException(404, "Doctor not found")
+    if current_user.role != "admin" and doctor.user_id != current_user.id:
+        raise HTTPException(403, "Cannot change another doctor's settings")
+    return doctor
+
+
+def _check_format(value: Optional[str], fmt: str):
+    # Dates and times are stored and compared as text, so only the zero-padded
+    # form is accepted ("9:00" would sort after "10:00")
+    if value is not None:
+        try:
+            valid = datetime.strptime(value, fmt).strftime(fmt) == value
+        except ValueError:
+            valid = False
+        if not valid:
+            raise HTTPException(400, "Invalid date or time format")
+
+
+def check_time(value: Optional[str]):
+    _check_format(value, "%H:%M")
+
+
+def check_date(value: Optional[str]):
+    _check_format(value, "%Y-%m-%d")
+
+
+def check_not_past(slot_date: str):
+    if slot_date < datetime.now().strftime("%Y-%m-%d"):
+        raise HTTPException(400, "Cannot book a slot in the past")
+
+
+@app.get("/doctors/{doctor_id}/schedule", response_model=List[schemas.ScheduleRuleOut])
+def list_schedule_rules(doctor_id: int, db: Session = Depends(get_db)):
+    return db.query(models.ScheduleRule).filter(
+        models.ScheduleRule.doctor_id == doctor_id
+    ).order_by(models.ScheduleRule.valid_from).all()
+
+
+@app.post("/doctors/{doctor_id}/schedule", response_model=schemas.ScheduleRuleOut, status_code=201)
+def create_schedule_rule(
+    doctor_id: int,
+    data: schemas.ScheduleRuleCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    get_own_doctor(db, doctor_id, current_user)
+    for t in (data.start_time, data.end_time, data.lunch_start, data.lunch_end):
+        check_time(t)
+    check_date(data.valid_from)
+    check_date(data.valid_until)
+    if data.start_time >= data.end_time:
+        raise HTTPException(400, "Start time must be before end time")
+    if data.slot_duration <= 0:
+        raise HTTPException(400, "Slot duration must be positive")
+    if not data.days_of_week or any(d < 0 or d > 6 for d in data.days_of_week):
+        raise HTTPException(400, "Days of week must be between 0 (Mon) and 6 (Sun)")
+
+    valid_from = data.valid_from or datetime.now().strftime("%Y-%m-%d")
+    if data.valid_until and data.valid_until < valid_from:
+        raise HTTPException(400, "Start date must be before end date")
+
+    rule = models.ScheduleRule(
+        doctor_id=doctor_id,
+        days_of_week=schedules.format_days(data.days_of_week),
+        start_time=data.start_time,
+        end_time=data.end_time,
+        slot_duration=data.slot_duration,
+        lunch_start=data.lunch_start,
+        lunch_end=data.lunch_end,
+        valid_from=valid_from,
+        valid_until=data.valid_until,
+    )
+    db.add(rule)
+    analytics.refresh_offered(db, doctor_id, rule.valid_from, rule.valid_until)
+    db.commit()
+    db.refresh(rule)
+    slot_events.publish_slots_refresh(db, doctor_id)
+    agenda_cache.invalidate_doctor(doctor_id)
+    return rule
+
+
+@app.delete("/doctors/{doctor_id}/schedule/{rule_id}", status_code=204)
+def delete_schedule_rule(
+    doctor_id: int,
+    rule_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    get_own_doctor(db, doctor_id, current_user)
+    rule = db.query(models.ScheduleRule).filter(
+        models.ScheduleRule.id == rule_id,
+        models.ScheduleRule.doctor_id == doctor_id,
+    ).first()
+    if not rule:
+        raise HTTPException(404, "Schedule rule not found")
+    # Already booked slots are stored rows and are not affected
+    db.delete(rule)
+    analytics.refresh_offered(db, doctor_id, rule.valid_from, rule.valid_until)
+    db.commit()
+    slot_events.publish_slots_refresh(db, doctor_id)
+    agenda_cache.invalidate_doctor(doctor_id)
+
+
+@app.get("/doctors/{doctor_id}/schedule/exceptions", response_model=List[schemas.ScheduleExceptionOut])
+def list_schedule_exceptions(doctor_id: int, db: Session = Depends(get_db)):
+    today = datetime.now().strftime("%Y-%m-%d")
+    return db.query(models.ScheduleException).filter(
+        models.ScheduleException.doctor_id == doctor_id,
+        models.ScheduleException.exc_date >= today,
+    ).order_by(models.ScheduleException.exc_date, models.ScheduleException.start_time).all()
+
+
+@app.post("/doctors/{doctor_id}/schedule/exceptions", response_model=schemas.ScheduleExceptionOut, status_code=201)
+def create_schedule_exception(
+    doctor_id: int,
+    data: schemas.ScheduleExceptionCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    get_own_doctor(db, doctor_id, current_user)
+    check_date(data.exc_date)
+    check_time(data.start_time)
+    check_time(data.end_time)
+    if (data.start_time is None) != (data.end_time is None):
+        raise HTTPException(400, "Give both start and end time, or neither for a whole day")
+    if data.start_time and data.start_time >= data.end_time:
+        raise HTTPException(400, "Start time must be before end time")
+
+    exc = models.ScheduleException(doctor_id=doctor_id, **data.model_dump())
+    db.add(exc)
+    analytics.refresh_offered(db, doctor_id, exc.exc_date, exc.exc_date)
+    db.commit()
+    db.refresh(exc)
+    slot_events.publish_slots_refresh(db, doctor_id)
+    agenda_cache.invalidate_doctor(doctor_id)
+    return exc
+
+
+@app.delete("/doctors/{doctor_id}/schedule/exceptions/{exception_id}", status_code=204)
+def delete_schedule_exception(
+    doctor_id: int,
+    exception_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    get_own_doctor(db, doctor_id, current_user)
+    exc = db.query(models.ScheduleException).filter(
+        models.ScheduleException.id == exception_id,
+        models.ScheduleException.doctor_id == doctor_id,
+    ).first()
+    if not exc:
+        raise HTTPException(404, "Schedule exception not found")
+    db.delete(exc)
+    analytics.refresh_offered(db, doctor_id, exc.exc_date, exc.exc_date)
+    db.commit()
+    slot_events.publish_slots_refresh(db, doctor_id)
+    agenda_cache.invalidate_doctor(doctor_id)
+
+
+def run_slot_range(db: Session, data: schemas.SlotRangeAction, doctor_ids: Optional[List[int]]):
+    check_date(data.date_from)
+    check_date(data.date_to)
+    check_time(data.start_time)
+    check_time(data.end_time)
+    if (data.start_time is None) != (data.end_time is None):
+        raise HTTPException(400, "Give both start and end time, or neither for whole days")
+    if data.start_time and data.start_time >= data.end_time:
+        raise HTTPException(400, "Start time must be before end time")
+    date_from = datetime.strptime(data.date_from, "%Y-%m-%d").date()
+    date_to = datetime.strptime(data.date_to, "%Y-%m-%d").date()
+    if date_from > date_to:
+        raise HTTPException(400, "Start date must be before end date")
+    if (date_to - date_from).days >= schedules.MAX_RANGE_DAYS:
+        raise HTTPException(400, f"Ranges are limited to {schedules.MAX_RANGE_DAYS} days")
+
+    affected = schedules.apply_range(
+        db, data.action, doctor_ids, date_from, date_to, data.start_time, data.end_time, data.reason
+    )
+    conflicts = schedules.range_conflicts(db, doctor_ids, date_from, date_to, data.start_time, data.end_time)
+    if doctor_ids is None:
+        doctor_ids = [d for (d,) in db.query(models.Doctor.id)]
+    if affected:
+        for doctor_id in doctor_ids:
+            analytics.refresh_offered(db, doctor_id, data.date_from, data.date_to)
     db.commit()
+    if affected:
+        for doctor_id in doctor_ids:
+            slot_events.publish_slots_refresh(db, doctor_id)
+            agenda_cache.invalidate_doctor(doctor_id)
+    return {"affected": affected, "conflicts": conflicts}
+
+
+@app.post("/doctors/{doctor_id}/slots/range", response_model=schemas.SlotRangeResult)
+def doctor_slot_range(
+    doctor_id: int,
+    data: schemas.SlotRangeAction,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Block, unblock or delete a doctor's open slots over a date (and time) range, e.g. for leave.
+
+    Booked appointments in the range are kept and returned as conflicts.
+    """
+    get_own_doctor(db, doctor_id, current_user)
+    return run_slot_range(db, data, [doctor_id])
+
+
+@app.post("/admin/slots/range", response_model=schemas.SlotRangeResult)
+def clinic_slot_range(
+    data: schemas.SlotRangeAction,
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_role("admin")),
+):
+    """Same as the per-doctor range operation, for every doctor (public holidays, closures)."""
+    return run_slot_range(db, data, None)
 
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -401,21 +879,36 @@ def book_appointment(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(require_role("patient")),
 ):
-    slot = db.query(models.Slot).filter(models.Slot.id == data.slot_id).first()
+    if data.slot_id:
+        slot = db.query(models.Slot).filter(models.Slot.id == data.slot_id).with_for_update().first()
+    elif data.doctor_id and data.slot_date and data.start_time:
+        check_date(data.slot_date)
+        check_time(data.start_time)
+        check_not_past(data.slot_date)
+        # Open slot from a schedule rule: store the row only now that it is booked
+        slot = schedules.materialize_slot(db, data.doctor_id, data.slot_date, data.start_time)
+    else:
+        raise HTTPException(400, "Provide slot_id or doctor_id, slot_date and start_time")
     if not slot:
         raise HTTPException(404, "Slot not found")
+    check_not_past(slot.slot_date)
     if slot.is_booked:
         raise HTTPException(409, "Slot is already booked")
+    if schedules.is_blocked(db, slot):
+        raise HTTPException(409, "Slot is blocked")
 
     # Mark slot as booked
     slot.is_booked = True
+    analytics.record(db, slot, booked=1)
 
     appointment = models.Appointment(
-        slot_id=data.slot_id,
+        slot_id=slot.id,
         patient_id=current_user.id,
         reason=data.reason,
     )
     db.add(appointment)
+    db.flush()
+    waitlist.fulfil(db, current_user.id, slot, appointment.id)
     db.commit()
     db.refresh(appointment)
 
@@ -432,6 +925,9 @@ def book_appointment(
 
     doctor_user = appt.slot.doctor.user
     spec = appt.slot.doctor.specialization
+    slot_events.publish_slot_change(db, appt.slot, "booked")
+    agenda_cache.refresh_slot(db, appt.slot)
+    reminders.scheduler.schedule(appt.id, appt.slot.slot_date, appt.slot.start_time)
 
     # Send emails in background
     background_tasks.add_task(
@@ -445,7 +941,10 @@ def book_appointment(
         end_time=appt.slot.end_time,
         reason=data.reason or "",
     )
-    background_tasks.add_task(
+    digest.notify_doctor(
+        db, background_tasks, appt.slot.doctor,
+        dict(kind="booked", patient_name=current_user.full_name, slot_date=appt.slot.slot_date,
+             start_time=appt.slot.start_time, end_time=appt.slot.end_time, reason=data.reason),
         send_doctor_notification,
         doctor_email=doctor_user.email,
         doctor_name=doctor_user.full_name,
@@ -460,30 +959,58 @@ def book_appointment(
     return appt
 
 
-@app.get("/appointments/my", response_model=List[schemas.AppointmentOut])
+# Rows are flat dicts already (possibly trimmed by ``fields``), so they skip
+# response_model validation; the schema is only documented
+@app.get(
+    "/appointments/my", response_class=FastJSONResponse,
+    responses={200: {"model": List[schemas.AppointmentListItem]}},
+)
 def my_appointments(
-    db: Session = Depends(get_db),
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db),
     current_user: models.User = Depends(get_current_user),
 ):
-    q = db.query(models.Appointment).options(
-        joinedload(models.Appointment.slot)
-        .joinedload(models.Slot.doctor)
-        .joinedload(models.Doctor.user),
-        joinedload(models.Appointment.slot)
-        .joinedload(models.Slot.doctor)
-        .joinedload(models.Doctor.specialization),
-        joinedload(models.Appointment.patient),
-    )
+    """Flat appointment rows, newest first. ``fields=id,status,...`` returns only those keys."""
+    wanted = appointment_list.parse_fields(fields)
     if current_user.role == "patient":
-        q = q.filter(models.Appointment.patient_id == current_user.id)
+        rows = appointment_list.list_appointments(db, wanted, patient_id=current_user.id)
     elif current_user.role == "doctor":
         doctor = db.query(models.Doctor).filter(models.Doctor.user_id == current_user.id).first()
         if not doctor:
-            return []
-        q = q.join(models.Slot).filter(models.Slot.doctor_id == doctor.id)
+            return FastJSONResponse([])
+        rows = appointment_list.list_appointments(db, wanted, doctor_id=doctor.id)
     else:
-        pass  # admin sees all
-    return q.order_by(models.Appointment.created_at.desc()).all()
+        rows = appointment_list.list_appointments(db, wanted)  # admin sees all
+    return FastJSONResponse(rows)
+
+
+def notify_waitlist(background_tasks: BackgroundTasks, db: Session, slot: models.Slot, assigned, offers):
+    """Queue the emails for a freed slot that went to the waitlist."""
+    notices = waitlist.notices(db, slot, assigned, offers)
+    if notices:
+        background_tasks.add_task(send_waitlist_emails, notices)
+    if assigned:
+        reminders.scheduler.schedule(assigned.id, slot.slot_date, slot.start_time)
+        doctor = db.query(models.Doctor).options(joinedload(models.Doctor.user)).filter(
+            models.Doctor.id == slot.doctor_id
+        ).first()
+        doctor_user = doctor.user
+        patient = db.query(models.User).filter(models.User.id == assigned.patient_id).first()
+        digest.notify_doctor(
+            db, background_tasks, doctor,
+            dict(kind="booked", patient_name=patient.full_name, slot_date=slot.slot_date,
+                 start_time=slot.start_time, end_time=slot.end_time, reason=assigned.reason,
+                 detail="Booked from the waitlist"),
+            send_doctor_notification,
+            doctor_email=doctor_user.email,
+            doctor_name=doctor_user.full_name,
+            patient_name=patient.full_name,
+            patient_phone=patient.phone or "",
+            slot_date=slot.slot_date,
+            start_time=slot.start_time,
+            end_time=slot.end_time,
+            reason=assigned.reason or "",
+        )
 
 
 @app.put("/appointments/{appointment_id}/cancel", response_model=schemas.AppointmentOut)
@@ -512,8 +1039,14 @@ def cancel_appointment(
 
     appt.status = models.AppointmentStatus.cancelled
     appt.slot.is_booked = False
+    analytics.record(db, appt.slot, cancelled=1)
+    assigned, offers = waitlist.match_freed_slot(db, appt.slot, exclude_patient_id=appt.patient_id)
     db.commit()
     db.refresh(appt)
+    slot_events.publish_slot_change(db, appt.slot, "booked" if assigned else "freed")
+    agenda_cache.refresh_slot(db, appt.slot)
+    reminders.scheduler.cancel(appt.id)
+    notify_waitlist(background_tasks, db, appt.slot, assigned, offers)
 
     # Notify both parties
     doctor_user = appt.slot.doctor.user
@@ -525,7 +1058,10 @@ def cancel_appointment(
         slot_date=appt.slot.slot_date,
         start_time=appt.slot.start_time,
     )
-    background_tasks.add_task(
+    digest.notify_doctor(
+        db, background_tasks, appt.slot.doctor,
+        dict(kind="cancelled", patient_name=appt.patient.full_name,
+             slot_date=appt.slot.slot_date, start_time=appt.slot.start_time, end_time=appt.slot.end_time),
         send_cancellation_email,
         to_email=doctor_user.email,
         recipient_name=doctor_user.full_name,
@@ -537,6 +1073,121 @@ def cancel_appointment(
     return appt
 
 
+@app.put("/appointments/{appointment_id}/reschedule", response_model=schemas.AppointmentOut)
+def reschedule_appointment(
+    appointment_id: int,
+    data: schemas.AppointmentReschedule,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Move a booked appointment to another slot in a single transaction."""
+    appt = db.query(models.Appointment).filter(
+        models.Appointment.id == appointment_id
+    ).with_for_update().first()
+    if not appt:
+        raise HTTPException(404, "Appointment not found")
+    if current_user.role == "patient" and appt.patient_id != current_user.id:
+        raise HTTPException(403, "Forbidden")
+    if current_user.role == "doctor":
+        own = db.query(models.Doctor.id).filter(models.Doctor.user_id == current_user.id).scalar()
+        if appt.slot.doctor_id != own:
+            raise HTTPException(403, "Forbidden")
+    if appt.status != models.AppointmentStatus.booked:
+        raise HTTPException(400, "Only booked appointments can be rescheduled")
+
+    if data.slot_id:
+        new_slot_id = data.slot_id
+    elif data.doctor_id and data.slot_date and data.start_time:
+        check_date(data.slot_date)
+        check_time(data.start_time)
+        check_not_past(data.slot_date)
+        # Store a rule-generated slot first, unlocked; it is locked with the old one below
+        new_slot = schedules.materialize_slot(db, data.doctor_id, data.slot_date, data.start_time, lock=False)
+        if not new_slot:
+            raise HTTPException(404, "Slot not found")
+        new_slot_id = new_slot.id
+    else:
+        raise HTTPException(400, "Provide slot_id or doctor_id, slot_date and start_time")
+    if new_slot_id == appt.slot_id:
+        raise HTTPException(400, "Appointment is already in this slot")
+
+    # Lock both slots in id order so two concurrent swaps can't deadlock
+    locked = {s.id: s for s in db.query(models.Slot).filter(
+        models.Slot.id.in_([appt.slot_id, new_slot_id])
+    ).order_by(models.Slot.id).with_for_update().populate_existing()}
+    old_slot, new_slot = locked[appt.slot_id], locked.get(new_slot_id)
+    if not new_slot:
+        raise HTTPException(404, "Slot not found")
+    check_not_past(new_slot.slot_date)
+    if new_slot.is_booked:
+        raise HTTPException(409, "Slot is already booked")
+    if schedules.is_blocked(db, new_slot):
+        raise HTTPException(409, "Slot is blocked")
+
+    old_date, old_time, old_doctor_id = old_slot.slot_date, old_slot.start_time, old_slot.doctor_id
+    if new_slot.doctor_id != old_doctor_id:
+        # The old doctor's calendar feed no longer sees the appointment otherwise
+        db.add(models.AppointmentMove(
+            appointment_id=appt.id, doctor_id=old_doctor_id,
+            slot_date=old_slot.slot_date, start_time=old_slot.start_time, end_time=old_slot.end_time,
+        ))
+    old_slot.is_booked = False
+    new_slot.is_booked = True
+    appt.slot_id = new_slot.id
+    analytics.record(db, old_slot, booked=-1)
+    analytics.record(db, new_slot, booked=1)
+    assigned, offers = waitlist.match_freed_slot(db, old_slot, exclude_patient_id=appt.patient_id)
+    reminders.forget_sent(db, appt.id)
+    db.commit()
+
+    appt = db.query(models.Appointment).options(
+        joinedload(models.Appointment.slot)
+        .joinedload(models.Slot.doctor)
+        .joinedload(models.Doctor.user),
+        joinedload(models.Appointment.patient),
+    ).filter(models.Appointment.id == appointment_id).first()
+    slot_events.publish_slot_change(db, old_slot, "booked" if assigned else "freed")
+    slot_events.publish_slot_change(db, appt.slot, "booked")
+    agenda_cache.refresh_slot(db, old_slot)
+    agenda_cache.refresh_slot(db, appt.slot)
+    reminders.scheduler.schedule(appt.id, appt.slot.slot_date, appt.slot.start_time)
+    notify_waitlist(background_tasks, db, old_slot, assigned, offers)
+
+    # One combined notice per party instead of a cancellation plus a booking
+    doctor_user = appt.slot.doctor.user
+    notice = dict(
+        old_date=old_date, old_time=old_time,
+        new_date=appt.slot.slot_date, new_time=appt.slot.start_time, new_end_time=appt.slot.end_time,
+    )
+    background_tasks.add_task(
+        send_reschedule_email,
+        to_email=appt.patient.email,
+        recipient_name=appt.patient.full_name,
+        role="patient",
+        other_name=doctor_user.full_name,
+        **notice,
+    )
+    doctor_ids = {old_doctor_id, appt.slot.doctor_id}
+    doctors = db.query(models.Doctor).options(joinedload(models.Doctor.user)).filter(models.Doctor.id.in_(doctor_ids)).all()
+    patient_name = appt.patient.full_name
+    for doctor in doctors:
+        digest.notify_doctor(
+            db, background_tasks, doctor,
+            dict(kind="rescheduled", patient_name=patient_name, slot_date=notice["new_date"],
+                 start_time=notice["new_time"], end_time=notice["new_end_time"],
+                 detail=f"Moved from {old_date} at {old_time}"),
+            send_reschedule_email,
+            to_email=doctor.user.email,
+            recipient_name=doctor.user.full_name,
+            role="doctor",
+            other_name=patient_name,
+            **notice,
+        )
+
+    return appt
+
+
 @app.put("/appointments/{appointment_id}/complete", response_model=schemas.AppointmentOut)
 def complete_appointment(
     appointment_id: int,
@@ -563,9 +1214,11 @@ def complete_appointment(
     appt.status = models.AppointmentStatus.completed
     appt.prescription_notes = data.prescription_notes
     appt.medications = data.medications
+    analytics.record(db, appt.slot, completed=1)
     
     db.commit()
     db.refresh(appt)
+    agenda_cache.refresh_slot(db, appt.slot)
 
     # Send prescription email to patient
     background_tasks.add_task(
@@ -581,45 +1234,300 @@ def complete_appointment(
     return appt
 
 
-@app.get("/appointments/all", response_model=List[schemas.AppointmentOut])
+# ─── CALENDAR FEED ────────────────────────────────────────────────────────────
+
+@app.get("/calendar/feed")
+def calendar_feed_url(request: Request, current_user: models.User = Depends(get_current_user)):
+    """Private iCalendar URL for the current user's appointments, to subscribe to in a calendar app."""
+    return {"url": calendar_feed.feed_url(str(request.base_url), current_user)}
+
+
+@app.post("/calendar/feed/reset")
+def reset_calendar_feed(
+    request: Request,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    """Revoke the current feed URL (e.g. after it leaked) and return a new one."""
+    current_user.calendar_feed_version = (current_user.calendar_feed_version or 0) + 1
+    db.commit()
+    return {"url": calendar_feed.feed_url(str(request.base_url), current_user)}
+
+
+@app.get("/calendar/{user_id}.ics")
+def calendar_feed_ics(
+    user_id: int,
+    request: Request,
+    token: str,
+    since: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """The feed itself. ``since`` (a previous X-Sync-Token) returns only what changed after it."""
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    # Same answer for unknown users, so the feed can't be used to probe ids
+    if not user or not calendar_feed.check_token(user, token):
+        raise HTTPException(403, "Invalid calendar token")
+    headers = {"Cache-Control": "private, no-cache"}
+
+    if since:
+        try:
+            cursor = calendar_feed.parse_sync_token(since)
+        except ValueError:
+            raise HTTPException(400, "Invalid sync token")
+        rows = calendar_feed.changes(db, user, cursor)
+        headers["X-Sync-Token"] = calendar_feed.sync_token(rows, cursor)
+    else:
+        etag = calendar_feed.etag(db, user)
+        headers["ETag"] = etag
+        if request.headers.get("If-None-Match") == etag:
+            return Response(status_code=304, headers=headers)
+        rows = calendar_feed.changes(db, user)
+        headers["X-Sync-Token"] = calendar_feed.sync_token(rows)
+    return Response(calendar_feed.render(rows, user), media_type="text/calendar; charset=utf-8", headers=headers)
+
+
+# ─── WAITLIST ─────────────────────────────────────────────────────────────────
+
+@app.post("/waitlist", response_model=schemas.WaitlistOut, status_code=201)
+def join_waitlist(
+    data: schemas.WaitlistCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(require_role("patient")),
+):
+    """Wait for any slot of a doctor between two dates; a cancellation books or offers it."""
+    check_date(data.date_from)
+    check_date(data.date_to)
+    if data.date_from > data.date_to:
+        raise HTTPException(400, "Start date must be before end date")
+    if data.date_to < datetime.now().strftime("%Y-%m-%d"):
+        raise HTTPException(400, "Date range is in the past")
+    if not db.query(models.Doctor.id).filter(models.Doctor.id == data.doctor_id).first():
+        raise HTTPException(404, "Doctor not found")
+    entry = models.WaitlistEntry(patient_id=current_user.id, **data.model_dump())
+    db.add(entry)
+    db.commit()
+    db.refresh(entry)
+    return entry
+
+
+@app.get("/waitlist/my", response_model=List[schemas.WaitlistOut])
+def my_waitlist(
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    return db.query(models.WaitlistEntry).filter(
+        models.WaitlistEntry.patient_id == current_user.id
+    ).order_by(models.WaitlistEntry.created_at.desc()).all()
+
+
+@app.delete("/waitlist/{entry_id}", status_code=204)
+def leave_waitlist(
+    entry_id: int,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user),
+):
+    entry = db.query(models.WaitlistEntry).filter(models.WaitlistEntry.id == entry_id).first()
+    if not entry:
+        raise HTTPException(404, "Waitlist entry not found")
+    if current_user.role != "admin" and entry.patient_id != current_user.id:
+        raise HTTPException(403, "Forbidden")
+    if entry.status == models.WaitlistStatus.waiting:
+        entry.status = models.WaitlistStatus.cancelled
+        db.commit()
+
+
+@app.get(
+    "/appointments/all", response_class=FastJSONResponse,
+    responses={200: {"model": List[schemas.AppointmentListItem]}},
+)
 def all_appointments(
+    fields: Optional[str] = None,
     db: Session = Depends(get_db),
     _: models.User = Depends(require_role("admin")),
 ):
-    return db.query(models.Appointment).options(
-        joinedload(models.Appointment.slot)
-        .joinedload(models.Slot.doctor)
-        .joinedload(models.Doctor.user),
-        joinedload(models.Appointment.slot)
-        .joinedload(models.Slot.doctor)
-        .joinedload(models.Doctor.specialization),
-        joinedload(models.Appointment.patient),
-    ).order_by(models.Appointment.created_at.desc()).all()
+    wanted = appointment_list.parse_fields(fields)
+    return FastJSONResponse(appointment_list.list_appointments(db, wanted))
+
+
+@app.post("/admin/archive")
+def run_archive(
+    older_than_days: Optional[int] = None,
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_role("admin")),
+):
+    return archive.archive_old_records(db, older_than_days)
+
+
+@app.get("/admin/traces")
+def list_traces(
+    limit: int = Query(50, ge=1, le=500),
+    _: models.User = Depends(require_role("admin")),
+):
+    """Most recent traced requests handled by this worker."""
+    return tracing.exporter.recent(limit)
+
+
+@app.get("/admin/traces/{trace_id}")
+def get_trace(trace_id: str, _: models.User = Depends(require_role("admin"))):
+    """All spans of one request, by its X-Request-ID."""
+    spans = tracing.exporter.get(trace_id)
+    if not spans:
+        raise HTTPException(404, "Trace not found")
+    return {"trace_id": trace_id, "spans": spans}
+
+
+@app.post("/admin/profile")
+def start_profile(data: schemas.ProfileRequest, _: models.User = Depends(require_role("admin"))):
+    """Profile a time window of this worker, or arm the next requests to a path."""
+    if data.seconds is not None:
+        if not 0 < data.seconds <= settings.PROFILE_MAX_SECONDS:
+            raise HTTPException(400, f"seconds must be between 0 and {settings.PROFILE_MAX_SECONDS}")
+        if not profiler.start_window(data.seconds):
+            raise HTTPException(409, "A profile is already running")
+        return {"message": f"Profiling this worker for {data.seconds:g}s"}
+    if not 0 <= data.requests <= 100:
+        raise HTTPException(400, "requests must be between 0 and 100")
+    profiler.arm(data.path, data.requests)
+    return {"message": f"Profiling the next {data.requests} request(s) to {data.path}"}
+
+
+@app.get("/admin/profiles")
+def list_profiles(_: models.User = Depends(require_role("admin"))):
+    return profiler.list_profiles()
+
+
+@app.get("/admin/profiles/{name}")
+def download_profile(name: str, _: models.User = Depends(require_role("admin"))):
+    path = profiler.profile_path(name)
+    if not path:
+        raise HTTPException(404, "Profile not found")
+    return FileResponse(path, filename=name, media_type="application/octet-stream")
+
+
+# ─── ANALYTICS ────────────────────────────────────────────────────────────────
+
+@app.get("/admin/analytics")
+def get_analytics(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    group_by: str = Query("doctor", pattern="^(doctor|specialization|day)$"),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_role("admin")),
+):
+    """Booking, cancellation and utilisation figures from the daily rollups."""
+    today = datetime.now().date()
+    start = start or (today - timedelta(days=30)).strftime("%Y-%m-%d")
+    end = end or today.strftime("%Y-%m-%d")
+    check_date(start)
+    check_date(end)
+    return {"start": start, "end": end, "group_by": group_by, "rows": analytics.summary(db, start, end, group_by)}
+
+
+@app.post("/admin/analytics/rebuild")
+def rebuild_analytics(
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_role("admin")),
+):
+    return {"message": f"Rebuilt {analytics.rebuild(db, start, end)} rollup rows"}
 
 
 # ─── CHAT BOT ─────────────────────────────────────────────────────────────────
 
+def chat_user(request: Request, current_user: models.User = Depends(get_current_user)):
+    ratelimit.enforce(
+        "chat", settings.RATE_LIMIT_CHAT_PER_MINUTE,
+        f"user:{current_user.id}", f"ip:{ratelimit.client_ip(request)}",
+    )
+    return current_user
+
+
+def admit_llm_request(user: models.User):
+    try:
+        return llm_admission.acquire(priority_for(user))
+    except QueueFull:
+        raise HTTPException(
+            503, "Assistant is busy, please retry shortly",
+            headers={"Retry-After": str(llm_admission.retry_after())},
+        )
+    except QueueTimeout:
+        raise HTTPException(
+            503, "Timed out waiting for the assistant",
+            headers={"Retry-After": str(llm_admission.retry_after())},
+        )
+
+
 @app.post("/chat", response_model=schemas.ChatResponse)
 def chat_with_bot(
     data: schemas.ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(chat_user),
 ):
-    response_text = rag.ask_bot(data.message, db, current_user)
+    with admit_llm_request(current_user):
+        response_text = rag.ask_bot(data.message, db, current_user)
     return schemas.ChatResponse(response=response_text)
 
 @app.post("/chat/stream")
 def chat_with_bot_stream(
     data: schemas.ChatRequest,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(chat_user),
 ):
-    return StreamingResponse(rag.ask_bot_stream(data.message, db, current_user), media_type="text/plain")
+    stream = rag.ask_bot_stream(data.message, db, current_user, admit=lambda: admit_llm_request(current_user))
+    return StreamingResponse(stream, media_type="text/plain")
+
+
+@app.post("/chat/sse")
+def chat_with_bot_sse(
+    data: schemas.ChatRequest,
+    request: Request,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(chat_user),
+):
+    # Set when the client goes away, to stop the model right away
+    abort = StreamAbort()
+    stream = rag.ask_bot_stream(
+        data.message, db, current_user,
+        admit=lambda: admit_llm_request(current_user), fallback=False, abort=abort,
+    )
+    events = sse.chat_events(
+        request, stream,
+        window=settings.CHAT_SSE_WINDOW_MS / 1000,
+        max_chars=settings.CHAT_SSE_MAX_CHARS,
+        abort=abort,
+    )
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+
+@app.get("/chat/metrics")
+def chat_metrics(_: models.User = Depends(require_role("admin"))):
+    return llm_admission.metrics()
 
 # ──────────────────────────────────────────────────────────────────────────────
 # USERS (admin)
 # ──────────────────────────────────────────────────────────────────────────────
 
+@app.post("/admin/import/{kind}")
+def import_records(
+    kind: str,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    _: models.User = Depends(require_role("admin")),
+):
+    """Bulk-create specializations, users or doctor profiles from a CSV or JSONL file."""
+    if kind not in bulk_import.KINDS:
+        raise HTTPException(404, "Unknown import kind")
+    try:
+        rows = bulk_import.parse_rows(file.file.read(), file.filename or "")
+    except (ValueError, csv.Error) as e:
+        raise HTTPException(400, f"Could not parse file: {e}")
+    report = bulk_import.import_rows(db, kind, rows)
+    if report["created"]:
+        cache_bus.publish("doctors")
+    return report
+
+
 @app.get("/users", response_model=List[schemas.UserOut])
 def list_users(
     db: Session = Depends(get_db),
@@ -1,6 +1,6 @@
 from sqlalchemy import (
     Column, Integer, String, DateTime, ForeignKey,
-    Boolean, Text, Enum
+    Boolean, Text, Enum, UniqueConstraint, Index
 )
 from sqlalchemy.orm import relationship
 from database import Base
@@ -20,6 +20,12 @@ class AppointmentStatus(str, enum.Enum):
     completed = "completed"
 
 
+class WaitlistStatus(str, enum.Enum):
+    waiting = "waiting"
+    fulfilled = "fulfilled"
+    cancelled = "cancelled"
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -31,6 +37,8 @@ class User(Base):
     role = Column(Enum(UserRole), default=UserRole.patient)
     phone = Column(String(20), nullable=True)
     is_active = Column(Boolean, default=True)
+    # Part of the calendar feed token; bumping it revokes the old feed URL
+    calendar_feed_version = Column(Integer, default=0)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     doctor_profile = relationship("Doctor", back_populates="user", uselist=False)
@@ -59,15 +67,21 @@ class Doctor(Base):
     experience_years = Column(Integer, default=0)
     consultation_fee = Column(Integer, default=0)  # in cents or smallest unit
     is_available = Column(Boolean, default=True)
+    # How booking/cancellation emails reach the doctor: immediate, hourly or daily digest
+    notification_mode = Column(String(10), default="immediate")
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     user = relationship("User", back_populates="doctor_profile")
     specialization = relationship("Specialization", back_populates="doctors")
     slots = relationship("Slot", back_populates="doctor")
+    schedule_rules = relationship("ScheduleRule", back_populates="doctor")
 
 
 class Slot(Base):
     __tablename__ = "slots"
+    __table_args__ = (
+        UniqueConstraint("doctor_id", "slot_date", "start_time", name="uq_slot_doctor_time"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     doctor_id = Column(Integer, ForeignKey("doctors.id"))
@@ -78,14 +92,47 @@ class Slot(Base):
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
     doctor = relationship("Doctor", back_populates="slots")
-    appointment = relationship("Appointment", back_populates="slot", uselist=False)
+    # A slot freed by a cancellation can be booked again, so it may have several
+    appointments = relationship("Appointment", back_populates="slot")
+
+
+class ScheduleRule(Base):
+    """Weekly availability; open slots are computed from it on read and only
+    stored as ``Slot`` rows once booked."""
+    __tablename__ = "schedule_rules"
+
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
+    days_of_week = Column(String(20))      # "0,1,2,3,4"  (0=Mon, 6=Sun)
+    start_time = Column(String(10))        # "09:00"
+    end_time = Column(String(10))          # "17:00"
+    slot_duration = Column(Integer, default=30)
+    lunch_start = Column(String(10), nullable=True)
+    lunch_end = Column(String(10), nullable=True)
+    valid_from = Column(String(20))        # "2025-06-10"
+    valid_until = Column(String(20), nullable=True)  # open-ended when null
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    doctor = relationship("Doctor", back_populates="schedule_rules")
+
+
+class ScheduleException(Base):
+    __tablename__ = "schedule_exceptions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
+    exc_date = Column(String(20), index=True)
+    start_time = Column(String(10), nullable=True)  # whole day when null
+    end_time = Column(String(10), nullable=True)
+    reason = Column(String(255), nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
 
 
 class Appointment(Base):
     __tablename__ = "appointments"
 
     id = Column(Integer, primary_key=True, index=True)
-    slot_id = Column(Integer, ForeignKey("slots.id"), unique=True)
+    slot_id = Column(Integer, ForeignKey("slots.id"), index=True)
     patient_id = Column(Integer, ForeignKey("users.id"))
     reason = Column(Text, nullable=True)
     status = Column(Enum(AppointmentStatus), default=AppointmentStatus.booked)
@@ -93,6 +140,169 @@ class Appointment(Base):
     medications = Column(Text, nullable=True)
     notes = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # Change cursor for the calendar feed: set on booking, cancel, complete, reschedule
+    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow, index=True)
 
-    slot = relationship("Slot", back_populates="appointment")
+    slot = relationship("Slot", back_populates="appointments")
     patient = relationship("User", back_populates="appointments", foreign_keys=[patient_id])
+
+
+class AppointmentMove(Base):
+    """An appointment rescheduled to another doctor, so the old doctor's
+    calendar feed can show it as cancelled."""
+    __tablename__ = "appointment_moves"
+
+    id = Column(Integer, primary_key=True)
+    appointment_id = Column(Integer, index=True)  # no FK: the appointment may move to the archive
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)  # the doctor it moved away from
+    slot_date = Column(String(20))
+    start_time = Column(String(10))
+    end_time = Column(String(10))
+    moved_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+# ─── Waitlist ─────────────────────────────────────────────────────────────────
+
+class WaitlistEntry(Base):
+    """A patient waiting for any slot of a doctor between two dates (inclusive)."""
+    __tablename__ = "waitlist"
+    __table_args__ = (
+        # Matching a freed slot: doctor + waiting + date range, oldest first
+        Index("ix_waitlist_match", "doctor_id", "status", "date_from", "date_to"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    patient_id = Column(Integer, ForeignKey("users.id"), index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"))
+    date_from = Column(String(20))
+    date_to = Column(String(20))
+    auto_book = Column(Boolean, default=True)  # False = only notify when a slot frees up
+    status = Column(Enum(WaitlistStatus), default=WaitlistStatus.waiting)
+    appointment_id = Column(Integer, ForeignKey("appointments.id"), nullable=True)
+    last_offered_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    patient = relationship("User", foreign_keys=[patient_id])
+    doctor = relationship("Doctor")
+
+
+# ─── Doctor digests ───────────────────────────────────────────────────────────
+
+class DoctorNotification(Base):
+    """A booking event held back for the doctor's next digest email."""
+    __tablename__ = "doctor_notifications"
+
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
+    kind = Column(String(20))  # booked, cancelled, rescheduled
+    patient_name = Column(String(150))
+    slot_date = Column(String(20))
+    start_time = Column(String(10))
+    end_time = Column(String(10), nullable=True)
+    reason = Column(Text, nullable=True)
+    detail = Column(String(255), nullable=True)
+    batch = Column(String(32), nullable=True, index=True)  # set when a digest run claims the row
+    claimed_at = Column(DateTime, nullable=True)
+    sent_at = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
+# ─── Reminders ────────────────────────────────────────────────────────────────
+
+class ReminderSent(Base):
+    """A reminder that was sent (claimed), so restarts and other workers skip it."""
+    __tablename__ = "reminders_sent"
+    __table_args__ = (
+        UniqueConstraint("appointment_id", "offset_minutes", name="uq_reminder_appt_offset"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    appointment_id = Column(Integer)  # no FK: the appointment may move to the archive
+    offset_minutes = Column(Integer)
+    sent_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
+
+
+# ─── Idempotency ──────────────────────────────────────────────────────────────
+
+class IdempotencyRecord(Base):
+    """Stored response for an Idempotency-Key; ``status_code`` is null while in progress."""
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_user_key"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, default=0)  # 0 for anonymous requests
+    key = Column(String(100))
+    request_hash = Column(String(64))
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String(100), nullable=True)
+    response_body = Column(Text, nullable=True)
+    expires_at = Column(DateTime, index=True)  # end of the in-progress lease, then of the replay window
+
+
+# ─── Analytics ────────────────────────────────────────────────────────────────
+
+class DailyRollup(Base):
+    """Per doctor, per day (the appointment's slot date) booking counters."""
+    __tablename__ = "daily_rollups"
+    __table_args__ = (
+        UniqueConstraint("day", "doctor_id", name="uq_rollup_day_doctor"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    day = Column(String(20), index=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
+    specialization_id = Column(Integer, ForeignKey("specializations.id"), nullable=True, index=True)
+    booked = Column(Integer, default=0)
+    cancelled = Column(Integer, default=0)
+    completed = Column(Integer, default=0)
+    slots_offered = Column(Integer, default=0)  # recounted on slot, rule and exception edits
+
+
+# ─── Archive (cold storage for past slots and appointments) ───────────────────
+
+class ArchivedSlot(Base):
+    __tablename__ = "slots_archive"
+
+    id = Column(Integer, primary_key=True)
+    doctor_id = Column(Integer, ForeignKey("doctors.id"), index=True)
+    slot_date = Column(String(20), index=True)
+    start_time = Column(String(10))
+    end_time = Column(String(10))
+    is_booked = Column(Boolean, default=False)
+    created_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    doctor = relationship("Doctor")
+    appointments = relationship("ArchivedAppointment", back_populates="slot")
+
+
+class ArchivedAppointment(Base):
+    __tablename__ = "appointments_archive"
+
+    id = Column(Integer, primary_key=True)
+    slot_id = Column(Integer, ForeignKey("slots_archive.id"), index=True)
+    patient_id = Column(Integer, ForeignKey("users.id"), index=True)
+    reason = Column(Text, nullable=True)
+    status = Column(Enum(AppointmentStatus), default=AppointmentStatus.booked)
+    prescription_notes = Column(Text, nullable=True)
+    medications = Column(Text, nullable=True)
+    notes = Column(Text, nullable=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    archived_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+    slot = relationship("ArchivedSlot", back_populates="appointments")
+    patient = relationship("User", foreign_keys=[patient_id])
+
+
+class CacheInvalidation(Base):
+    """Cache invalidations for other workers to pick up (see invalidation.py)."""
+    __tablename__ = "cache_invalidations"
+
+    id = Column(Integer, primary_key=True)
+    topic = Column(String(50))
+    key = Column(String(100), nullable=True)  # null = everything under the topic
+    origin = Column(String(32))
+    created_at = Column(DateTime, default=datetime.datetime.utcnow, index=True)
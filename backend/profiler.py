@@ -0,0 +1,259 @@
+"""On-demand sampling profiler for live requests.
+
+Profiling is switched on per request by an admin (``X-Profile: 1``), armed for
+the next N requests to a path, or run over the whole process for a time
+window (POST /admin/profile). A sampler thread reads the interpreter's stacks
+every PROFILE_INTERVAL_MS. Each profile is written twice into PROFILE_DIR:
+
+* ``<name>.folded``: collapsed stacks, for flamegraph.pl or speedscope
+* ``<name>.prof``: pstats-compatible, for ``python -m pstats`` or snakeviz
+
+A request profile only samples the threads that ran that request's handler,
+as recorded by ``ProfiledRoute``. When nothing is armed, the middleware costs
+one header lookup per request.
+"""
+import functools
+import inspect
+import logging
+import marshal
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Optional
+from fastapi import Request
+from fastapi.routing import APIRoute
+from starlette.concurrency import run_in_threadpool
+from starlette.datastructures import MutableHeaders
+from auth import is_admin_request
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Profile"
+MAX_DEPTH = 128
+
+_busy = threading.Lock()  # one profile at a time
+_armed = {"path": None, "remaining": 0}
+_armed_lock = threading.Lock()
+# Thread ids that ran the profiled request's handler; None when not profiling
+_handler_threads: ContextVar[Optional[set]] = ContextVar("profiler_handler_threads", default=None)
+
+
+class Sampler:
+    """Collects stack samples from every thread (or only the ids in ``threads``) until stopped."""
+
+    def __init__(self, interval: float, threads: Optional[set] = None):
+        self.interval = interval
+        self.threads = threads
+        self.samples = Counter()  # root-first tuple of (filename, firstlineno, funcname) -> count
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="profiler")
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own or (self.threads is not None and tid not in self.threads):
+                    continue
+                stack = []
+                while frame is not None and len(stack) < MAX_DEPTH:
+                    code = frame.f_code
+                    stack.append((code.co_filename, code.co_firstlineno, code.co_name))
+                    frame = frame.f_back
+                self.samples[tuple(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        return self.samples
+
+
+def _folded(samples) -> str:
+    return "".join(
+        ";".join(f"{func} ({os.path.basename(path)}:{line})" for path, line, func in stack) + f" {count}\n"
+        for stack, count in samples.items()
+    )
+
+
+def _pstats(samples, interval: float) -> dict:
+    """Turn samples into the ``{func: (cc, nc, tt, ct, callers)}`` dict pstats loads."""
+    stats = {}
+    for stack, count in samples.items():
+        seconds = count * interval
+        seen = set()
+        for i, func in enumerate(stack):
+            cc, nc, tt, ct, callers = stats.get(func, (0, 0, 0.0, 0.0, {}))
+            if func not in seen:  # recursion: count inclusive time once
+                ct += seconds
+                nc += count
+                cc += count
+                seen.add(func)
+            if i == len(stack) - 1:
+                tt += seconds
+            if i > 0:
+                c = callers.get(stack[i - 1], (0, 0, 0.0, 0.0))
+                callers[stack[i - 1]] = (c[0] + count, c[1] + count, c[2] + (seconds if i == len(stack) - 1 else 0.0), c[3] + seconds)
+            stats[func] = (cc, nc, tt, ct, callers)
+    return stats
+
+
+def save(samples, label: str) -> Optional[str]:
+    """Write the profile files, prune old ones, return the file stem."""
+    if not samples:
+        return None
+    os.makedirs(settings.PROFILE_DIR, exist_ok=True)
+    stem = f"{datetime.now():%Y%m%d-%H%M%S-%f}-{re.sub(r'[^A-Za-z0-9]+', '_', label).strip('_')[:60]}"
+    base = os.path.join(settings.PROFILE_DIR, stem)
+    with open(base + ".folded", "w") as f:
+        f.write(_folded(samples))
+    with open(base + ".prof", "wb") as f:
+        marshal.dump(_pstats(samples, settings.PROFILE_INTERVAL_MS / 1000), f)
+    _prune()
+    return stem
+
+
+def _prune():
+    stems = sorted({os.path.splitext(n)[0] for n in os.listdir(settings.PROFILE_DIR) if n.endswith((".folded", ".prof"))})
+    for stem in stems[:max(0, len(stems) - settings.PROFILE_MAX_FILES)]:
+        for ext in (".folded", ".prof"):
+            try:
+                os.remove(os.path.join(settings.PROFILE_DIR, stem + ext))
+            except OSError:
+                pass
+
+
+def list_profiles():
+    if not os.path.isdir(settings.PROFILE_DIR):
+        return []
+    names = sorted(os.listdir(settings.PROFILE_DIR), reverse=True)
+    return [
+        {"name": n, "bytes": os.path.getsize(os.path.join(settings.PROFILE_DIR, n))}
+        for n in names if n.endswith((".folded", ".prof"))
+    ]
+
+
+def profile_path(name: str) -> Optional[str]:
+    if os.path.basename(name) != name or not name.endswith((".folded", ".prof")):
+        return None
+    path = os.path.join(settings.PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# ── Triggers ──
+
+def arm(path_prefix: str, requests: int):
+    """Profile the next ``requests`` requests whose path starts with ``path_prefix`` (0 disarms)."""
+    with _armed_lock:
+        _armed["path"], _armed["remaining"] = path_prefix, requests
+
+
+def start_window(seconds: float) -> bool:
+    """Sample the whole process for the next ``seconds``. False if another profile is running."""
+    if not _busy.acquire(blocking=False):
+        return False
+    sampler = Sampler(settings.PROFILE_INTERVAL_MS / 1000).start()
+
+    def finish():
+        try:
+            time.sleep(seconds)
+            save(sampler.stop(), f"window-{seconds:g}s")
+        except Exception as e:
+            logger.error(f"Profiling window failed: {e}")
+        finally:
+            _busy.release()
+
+    threading.Thread(target=finish, daemon=True, name="profiler-window").start()
+    return True
+
+
+def _take_armed(path: str) -> bool:
+    if not _armed["remaining"]:
+        return False
+    with _armed_lock:
+        if _armed["remaining"] and path.startswith(_armed["path"] or "/"):
+            _armed["remaining"] -= 1
+            return True
+    return False
+
+
+class ProfiledRoute(APIRoute):
+    """Route that records which thread runs its handler while a request is profiled.
+
+    Sync handlers run on a threadpool thread picked per call, so this is the
+    only place the profiled request's thread is known.
+    """
+
+    def get_route_handler(self):
+        call = self.dependant.call
+        if inspect.iscoroutinefunction(call):
+            @functools.wraps(call)
+            async def marked(*args, **kwargs):
+                _mark_thread()
+                return await call(*args, **kwargs)
+        else:
+            @functools.wraps(call)
+            def marked(*args, **kwargs):
+                _mark_thread()
+                return call(*args, **kwargs)
+        self.dependant.call = marked
+        return super().get_route_handler()
+
+
+def _mark_thread():
+    threads = _handler_threads.get()
+    if threads is not None:
+        threads.add(threading.get_ident())
+
+
+class ProfilingMiddleware:
+    """Pure ASGI middleware, so unprofiled requests skip the BaseHTTPMiddleware overhead."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        request = Request(scope)
+        path = request.url.path
+        wanted = _take_armed(path) or (request.headers.get(HEADER) == "1" and await run_in_threadpool(is_admin_request, request))
+        if not wanted or not _busy.acquire(blocking=False):
+            return await self.app(scope, receive, send)
+
+        threads = set()
+        token = _handler_threads.set(threads)
+        sampler = Sampler(settings.PROFILE_INTERVAL_MS / 1000, threads).start()
+        stopped = False
+
+        def stop():
+            nonlocal stopped
+            if not stopped:
+                stopped = True
+                samples = sampler.stop()
+                _busy.release()
+                return samples
+
+        async def send_profiled(message):
+            # The profile ends when the response starts, so its name can go in a header
+            if message["type"] == "http.response.start" and not stopped:
+                samples = await run_in_threadpool(stop)
+                stem = await run_in_threadpool(save, samples, f"{request.method}-{path}")
+                if stem:
+                    MutableHeaders(scope=message)["X-Profile-Name"] = stem
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_profiled)
+        finally:
+            _handler_threads.reset(token)
+            if not stopped:
+                await run_in_threadpool(stop)
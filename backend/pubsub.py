@@ -0,0 +1,152 @@
+import asyncio
+import json
+import logging
+import socket
+import struct
+import threading
+import uuid
+from collections import defaultdict
+from urllib.parse import urlparse
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, bus, channels, loop, maxsize: int = 100):
+        self.bus = bus
+        self.channels = set(channels)
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def _put(self, channel, message):
+        if self.queue.full():
+            # Slow consumer: drop the oldest event rather than block publishers
+            self.queue.get_nowait()
+        self.queue.put_nowait((channel, message))
+
+    async def get(self, timeout: float = None):
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+    def close(self):
+        self.bus.unsubscribe(self)
+
+
+class PubSub:
+    """In-process publish/subscribe for asyncio consumers.
+
+    Publishers may run on any thread (sync routes run in the threadpool).
+    When a broker is attached, messages are also relayed to the other workers
+    on the host and their messages are delivered locally.
+    """
+
+    def __init__(self, broker=None):
+        self._lock = threading.Lock()
+        self._subs = defaultdict(set)
+        self._listeners = defaultdict(list)  # channel -> [callback(message)], run on the delivering thread
+        self.broker = broker
+
+    def subscribe(self, channels) -> Subscription:
+        sub = Subscription(self, channels, asyncio.get_running_loop())
+        with self._lock:
+            for channel in sub.channels:
+                self._subs[channel].add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            for channel in sub.channels:
+                subs = self._subs.get(channel)
+                if subs:
+                    subs.discard(sub)
+                    if not subs:
+                        del self._subs[channel]
+
+    def listen(self, channel: str, callback):
+        """Call ``callback(message)`` synchronously for every message on ``channel``."""
+        with self._lock:
+            self._listeners[channel].append(callback)
+
+    def deliver(self, channel: str, message: dict):
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+            listeners = list(self._listeners.get(channel, ()))
+        for callback in listeners:
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Pub/sub listener on {channel} failed: {e}")
+        for sub in subs:
+            try:
+                sub.loop.call_soon_threadsafe(sub._put, channel, message)
+            except RuntimeError:
+                # Subscriber's event loop is gone
+                self.unsubscribe(sub)
+
+    def publish(self, channel: str, message: dict):
+        self.deliver(channel, message)
+        if self.broker:
+            self.broker.send(channel, message)
+
+    def start(self):
+        if self.broker:
+            self.broker.start(self)
+
+
+class MulticastBroker:
+    """Relays messages between workers on one host over UDP multicast.
+
+    Needs no extra service: every worker joins the same group and ignores
+    the copies of its own messages.
+    """
+
+    def __init__(self, group: str, port: int):
+        self.group = group
+        self.port = port
+        self.origin = uuid.uuid4().hex
+        self._send_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self._send_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 1)
+        self._thread = None
+
+    def send(self, channel: str, message: dict):
+        packet = json.dumps({"o": self.origin, "c": channel, "m": message}).encode()
+        try:
+            self._send_sock.sendto(packet, (self.group, self.port))
+        except OSError as e:
+            logger.error(f"Pub/sub broker send failed: {e}")
+
+    def start(self, bus: PubSub):
+        if self._thread:
+            return
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if hasattr(socket, "SO_REUSEPORT"):
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        sock.bind(("", self.port))
+        mreq = struct.pack("4s4s", socket.inet_aton(self.group), socket.inet_aton("0.0.0.0"))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        self._thread = threading.Thread(target=self._listen, args=(sock, bus), daemon=True)
+        self._thread.start()
+
+    def _listen(self, sock, bus: PubSub):
+        while True:
+            try:
+                data, _ = sock.recvfrom(65535)
+                packet = json.loads(data)
+            except (OSError, ValueError) as e:
+                logger.error(f"Pub/sub broker receive failed: {e}")
+                continue
+            if packet.get("o") != self.origin:
+                bus.deliver(packet["c"], packet["m"])
+
+
+def broker_from_url(url: str):
+    if not url:
+        return None
+    parsed = urlparse(url)
+    if parsed.scheme == "multicast":
+        return MulticastBroker(parsed.hostname, parsed.port or 9400)
+    raise ValueError(f"Unsupported pub/sub broker: {url}")
+
+
+bus = PubSub(broker_from_url(settings.PUBSUB_BROKER_URL))
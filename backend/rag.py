@@ -1,10 +1,44 @@
-import requests
-import json
+import hashlib
+import re
+import time
 from sqlalchemy.orm import Session, joinedload
 import models
 from config import settings
+from database import SessionLocal
+from invalidation import cache_bus
+from singleflight import SingleFlight
+from llm_providers import StreamAbort, get_provider
+from llm_queue import release_when_done
+from tracing import span, traced_stream
 
-def get_context(db: Session, user: models.User = None):
+# Queries that mention the user's own data need the personal context, so they
+# are never shared between users.
+PERSONAL_QUERY = re.compile(r"\b(my|mine|appointments?|schedule|booked|bookings?|prescriptions?)\b", re.IGNORECASE)
+
+chat_flights = SingleFlight()
+
+_catalogue = {"text": None, "built_at": 0.0, "version": 0}
+
+
+def get_catalogue_context(db: Session):
+    """Doctor and specialization catalogue, cached until a catalogue write or the TTL."""
+    text, built_at, version = _catalogue["text"], _catalogue["built_at"], _catalogue["version"]
+    if text is not None and time.monotonic() - built_at < settings.CATALOGUE_CACHE_TTL_SECONDS:
+        return text
+    text = _build_catalogue_context(db)
+    if _catalogue["version"] == version:  # not invalidated while building
+        _catalogue.update(text=text, built_at=time.monotonic())
+    return text
+
+
+def _invalidate_catalogue(key):
+    _catalogue.update(text=None, version=_catalogue["version"] + 1)
+
+
+cache_bus.subscribe("doctors", _invalidate_catalogue)
+
+
+def _build_catalogue_context(db: Session):
     # Fetch doctors with their specialization and user details
     doctors = db.query(models.Doctor).options(
         joinedload(models.Doctor.user),
@@ -22,9 +56,16 @@ def get_context(db: Session, user: models.User = None):
     context_text += "\nAvailable Doctors:\n"
     for d in doctors:
         context_text += f"- Dr. {d.user.full_name} ({d.specialization.name}). Bio: {d.bio}. Fee: {d.consultation_fee}\n"
-        
+
+    return context_text
+
+
+def get_user_context(db: Session, user: models.User = None):
+    """The current user's own data, for the per-user part of the prompt."""
+    context_text = ""
+
     if user:
-        context_text += f"\n\n--- CURRENT USER CONTEXT ---\n"
+        context_text += f"--- CURRENT USER CONTEXT ---\n"
         context_text += f"User: {user.full_name} (Role: {user.role})\n"
         
         if user.role == "patient":
@@ -51,94 +92,145 @@ def get_context(db: Session, user: models.User = None):
 
     return context_text
 
-def ask_bot(query: str, db: Session, user: models.User = None):
-    # Ollama settings
-    OLLAMA_URL = "http://localhost:11434/api/chat"
-    # You can change this to "gemma3:4b", "qwen2:7b", etc. based on your 'ollama list'
-    MODEL = "gemma3:4b" 
-    
-    db_context = get_context(db, user)
-    
+FALLBACK_REPLY = "Sorry, I'm having trouble connecting to the assistant service. Please try again shortly."
+
+
+def is_personal_query(query: str) -> bool:
+    return bool(PERSONAL_QUERY.search(query))
+
+
+def flight_key(model: str, system_prompt: str, query: str) -> str:
+    normalized = " ".join(query.lower().split())
+    return hashlib.sha256(f"{model}\0{system_prompt}\0{normalized}".encode()).hexdigest()
+
+
+# The shared head of every prompt. Nothing user-specific goes here, so the
+# system message is byte-identical across users (until the catalogue changes)
+# and the model can reuse its prompt cache for it.
+SYSTEM_PROMPT = """You are a helpful medical assistant for the DoctorBook app.
+Your goal is to help users find the right doctor and encourage them to book an appointment.
+
+Use the following information about available doctors and specializations to answer the user's question.
+If the user asks about medical advice, give a standard disclaimer that you are an AI, but try to recommend a relevant doctor from the list based on their symptoms if possible.
+
+Keep answers concise and friendly.
+
+Context:
+"""
+
+
+def stable_prefix(db: Session) -> str:
+    return SYSTEM_PROMPT + get_catalogue_context(db)
+
+
+def compose_messages(prefix: str, query: str, audience: str, instruction: str, user_context: str = ""):
+    """Shared prefix first, then the per-user part, then the question."""
+    session = (
+        f"You are chatting with {audience}. Use the provided context to answer questions "
+        f"about their specific appointments or schedule if available.\n\n{instruction}"
+    )
+    if user_context:
+        session += f"\n\n{user_context}"
+    return [
+        {"role": "system", "content": prefix},
+        {"role": "system", "content": session},
+        {"role": "user", "content": query},
+    ]
+
+
+def build_messages(query: str, db: Session, user: models.User = None, shared: bool = False):
+    """Build the chat messages. ``shared`` prompts carry no personal data."""
+    with span("rag.context", shared=shared):
+        prefix = stable_prefix(db)
+        user_context = "" if shared else get_user_context(db, user)
+
     instruction = "If you recommend a doctor or suggest booking an appointment, append the tag [BOOK_NOW] at the end of your response."
     if user and user.role in ["doctor", "admin"]:
         instruction = "Do not suggest booking an appointment as this user is a staff member. Focus on answering their query."
 
-    system_prompt = f"""You are a helpful medical assistant for the DoctorBook app.
-        Your goal is to help users find the right doctor and encourage them to book an appointment.
-        
-        You are chatting with {user.full_name if user else 'a guest'}. Use the provided context to answer questions about their specific appointments or schedule if available.
-        
-        Use the following information about available doctors and specializations to answer the user's question.
-        If the user asks about medical advice, give a standard disclaimer that you are an AI, but try to recommend a relevant doctor from the list based on their symptoms if possible.
-        
-        {instruction}
-        
-        Keep answers concise and friendly.
-        
-        Context:
-        {db_context}
-        """
+    if shared:
+        audience = "a DoctorBook user"
+    else:
+        audience = user.full_name if user else 'a guest'
+
+    return compose_messages(prefix, query, audience, instruction, user_context)
 
+
+def warm_up():
+    """Load the model and prime its prompt cache with the shared prefix before the first chat."""
+    db = SessionLocal()
+    try:
+        messages = [{"role": "system", "content": stable_prefix(db)}, {"role": "user", "content": "Hello"}]
+    finally:
+        db.close()
+    provider = get_provider()
+    t0 = time.perf_counter()
     try:
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            "stream": False
-        }
-        response = requests.post(OLLAMA_URL, json=payload)
-        response.raise_for_status()
-        return response.json()['message']['content']
+        with span("llm.warm_up", provider=provider.cache_id):
+            provider.warm_up(messages)
+        print(f"LLM warm-up of {provider.cache_id} took {time.perf_counter() - t0:.1f}s")
     except Exception as e:
-        print(f"Ollama Error: {e}")
-        return "Sorry, I'm having trouble connecting to the local Ollama service. Please ensure Ollama is running."
-
-def ask_bot_stream(query: str, db: Session, user: models.User = None):
-    # Ollama settings
-    OLLAMA_URL = "http://localhost:11434/api/chat"
-    # You can change this to "gemma3:4b", "qwen2:7b", etc. based on your 'ollama list'
-    MODEL = "gemma3:4b" 
-    
-    db_context = get_context(db, user)
-    
-    instruction = "If you recommend a doctor or suggest booking an appointment, append the tag [BOOK_NOW] at the end of your response."
-    if user and user.role in ["doctor", "admin"]:
-        instruction = "Do not suggest booking an appointment as this user is a staff member. Focus on answering their query."
+        print(f"LLM warm-up failed: {e}")
 
-    system_prompt = f"""You are a helpful medical assistant for the DoctorBook app.
-        Your goal is to help users find the right doctor and encourage them to book an appointment.
-        
-        You are chatting with {user.full_name if user else 'a guest'}. Use the provided context to answer questions about their specific appointments or schedule if available.
-        
-        Use the following information about available doctors and specializations to answer the user's question.
-        If the user asks about medical advice, give a standard disclaimer that you are an AI, but try to recommend a relevant doctor from the list based on their symptoms if possible.
-        
-        {instruction}
-        
-        Keep answers concise and friendly.
-        
-        Context:
-        {db_context}
-        """
 
+def ask_bot(query: str, db: Session, user: models.User = None):
+    messages = build_messages(query, db, user)
+    provider = get_provider()
     try:
-        payload = {
-            "model": MODEL,
-            "messages": [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": query}
-            ],
-            "stream": True
-        }
-        with requests.post(OLLAMA_URL, json=payload, stream=True) as response:
-            response.raise_for_status()
-            for line in response.iter_lines():
-                if line:
-                    body = json.loads(line)
-                    if 'message' in body and 'content' in body['message']:
-                        yield body['message']['content']
+        with span("llm.chat", provider=provider.cache_id):
+            return provider.chat(messages)
     except Exception as e:
-        print(f"Ollama Error: {e}")
-        yield "Sorry, I'm having trouble connecting to the local Ollama service. Please ensure Ollama is running."
+        print(f"LLM Error: {e}")
+        return FALLBACK_REPLY
+
+
+def _llm_stream(provider, messages, abort=None):
+    try:
+        yield from provider.stream(messages, abort)
+    except Exception as e:
+        if not (abort and abort.is_set()):
+            print(f"LLM Error: {e}")
+        raise
+
+
+def _with_fallback(stream):
+    try:
+        yield from stream
+    except Exception:
+        yield FALLBACK_REPLY
+
+
+def ask_bot_stream(
+    query: str, db: Session, user: models.User = None, admit=None, fallback: bool = True, abort: StreamAbort = None,
+):
+    """Return a generator of reply chunks.
+
+    ``admit`` is called before a new generation starts and returns a ticket
+    that is released when the generation ends. A question that joins an
+    identical generation already in flight does not call it, so followers
+    never wait in the LLM queue.
+
+    With ``fallback`` a failed generation ends with ``FALLBACK_REPLY`` as
+    text; without it the error is raised to the caller.
+
+    Setting ``abort`` ends the stream at once. A generation of its own is
+    stopped with it; a shared one is stopped when its last reader leaves.
+    """
+    provider = get_provider()
+    # Generic questions only need the catalogue, so identical ones arriving
+    # together can share a single generation.
+    shared = not is_personal_query(query)
+    messages = build_messages(query, db, user, shared)
+
+    def generate(stop):
+        stream = _llm_stream(provider, messages, stop)
+        return release_when_done(stream, admit()) if admit else stream
+
+    if shared:
+        key = flight_key(provider.cache_id, "\0".join(m["content"] for m in messages[:-1]), query)
+        upstream_abort = StreamAbort()
+        flight = chat_flights.open(key, lambda: generate(upstream_abort), cancelled=abort, abort=upstream_abort.set)
+        stream = traced_stream("llm.stream", flight, provider=provider.cache_id, shared=True)
+    else:
+        stream = traced_stream("llm.stream", generate(abort), provider=provider.cache_id)
+    return _with_fallback(stream) if fallback else stream
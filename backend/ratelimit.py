@@ -0,0 +1,134 @@
+import math
+import sqlite3
+import threading
+import time
+from fastapi import HTTPException, Request
+from config import settings
+
+EVICT_INTERVAL_SECONDS = 60
+
+
+def _spend(buckets, rate: float):
+    """Take a token from every refilled bucket (``[tokens, ...]``) if each has one."""
+    empty = [b[0] for b in buckets if b[0] < 1]
+    if empty:
+        return False, 0, (1 - min(empty)) / rate
+    for b in buckets:
+        b[0] -= 1
+    return True, int(min((b[0] for b in buckets), default=0)), 0.0
+
+
+class MemoryBuckets:
+    """Token buckets for one process: a ``[tokens, last_refill]`` pair per key."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._last_evict = time.monotonic()
+
+    def take(self, keys, capacity: float, rate: float):
+        """Spend one token from each bucket, or none unless all have one.
+
+        Returns ``(allowed, remaining, retry_after_seconds)``.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_evict > EVICT_INTERVAL_SECONDS:
+                self._evict(now)
+            buckets = []
+            for key in keys:
+                bucket = self._buckets.get(key)
+                if bucket is None:
+                    bucket = self._buckets[key] = [capacity, now, capacity, rate]
+                bucket[0] = min(capacity, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                buckets.append(bucket)
+            return _spend(buckets, rate)
+
+    def _evict(self, now: float):
+        # A bucket that has refilled completely is the same as no bucket
+        self._last_evict = now
+        idle = [k for k, (tokens, last, capacity, rate) in self._buckets.items()
+                if tokens + (now - last) * rate >= capacity]
+        for k in idle:
+            del self._buckets[k]
+
+
+class SqliteBuckets:
+    """Token buckets in a SQLite file shared by every worker on the host."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_evict = 0.0
+        with self._conn() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL, updated REAL)")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+        return conn
+
+    def take(self, keys, capacity: float, rate: float):
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if now - self._last_evict > EVICT_INTERVAL_SECONDS:
+                self._last_evict = now
+                conn.execute("DELETE FROM buckets WHERE updated < ?", (now - 3600,))
+            buckets = []
+            for key in keys:
+                row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                buckets.append([capacity if row is None else min(capacity, row[0] + (now - row[1]) * rate)])
+            result = _spend(buckets, rate)
+            conn.executemany(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                [(key, bucket[0], now) for key, bucket in zip(keys, buckets)],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return result
+
+
+def _store_from_url(url: str):
+    if not url:
+        return MemoryBuckets()
+    if url.startswith("sqlite:///"):
+        return SqliteBuckets(url[len("sqlite:///"):])
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+
+store = _store_from_url(settings.RATE_LIMIT_BACKEND)
+
+
+def enforce(route: str, per_minute: int, *identities):
+    """Spend a token for each identity (user id, IP, username...) on ``route``.
+
+    Raises 429 with Retry-After if any of the buckets is empty, without
+    spending from the others.
+    """
+    if per_minute <= 0:
+        return
+    keys = [f"{route}:{identity}" for identity in identities if identity is not None]
+    if keys:
+        allowed, _, retry_after = store.take(keys, per_minute, per_minute / 60)
+        if not allowed:
+            raise HTTPException(
+                429, "Too many requests, please slow down",
+                headers={
+                    "Retry-After": str(max(1, math.ceil(retry_after))),
+                    "RateLimit-Limit": str(per_minute),
+                    "RateLimit-Remaining": "0",
+                },
+            )
+
+
+def client_ip(request: Request) -> str:
+    return request.client.host if request.client else "unknown"
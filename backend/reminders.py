@@ -0,0 +1,218 @@
+"""Appointment reminder emails, sent REMINDER_OFFSETS_MINUTES before each visit.
+
+Upcoming reminders sit in an in-process heap ordered by fire time. The worker
+thread sleeps until the earliest one is due, so each wake-up costs
+O(due reminders) rather than a scan of the appointments table. Bookings push
+reminders as they happen. Cancellations and reschedules are handled lazily:
+a popped entry is dropped when it no longer matches the live schedule.
+
+Every sent reminder is claimed in ``reminders_sent`` before the email goes
+out. After a restart those are skipped, and when several workers hold the
+same reminder only one of them sends it.
+"""
+import heapq
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+import models
+from config import settings
+from database import SessionLocal
+from email_utils import send_reminder_emails
+
+logger = logging.getLogger(__name__)
+
+
+def _offsets():
+    return sorted({int(m) for m in settings.REMINDER_OFFSETS_MINUTES.split(",") if m.strip()}, reverse=True)
+
+
+def _starts_at(slot_date: str, start_time: str) -> datetime:
+    return datetime.strptime(f"{slot_date} {start_time}", "%Y-%m-%d %H:%M")
+
+
+class ReminderScheduler:
+    def __init__(self, offsets, lookahead_hours: int):
+        self.offsets = offsets
+        self.lookahead = timedelta(hours=lookahead_hours)
+        self._heap = []      # (fire_at, appointment_id, offset_minutes)
+        self._live = {}      # (appointment_id, offset_minutes) -> fire_at still wanted
+        self._cond = threading.Condition()
+        self._loaded_until = None
+        self._started = False
+
+    # ── queue updates (called from the request handlers) ──
+
+    def schedule(self, appointment_id: int, slot_date: str, start_time: str):
+        """Queue the reminders for a booked (or rescheduled) appointment."""
+        if not self._started:
+            return
+        starts = _starts_at(slot_date, start_time)
+        now = datetime.now()
+        with self._cond:
+            for offset in self.offsets:
+                fire_at = starts - timedelta(minutes=offset)
+                self._live.pop((appointment_id, offset), None)  # drop the old time after a reschedule
+                # Too late for this one (the booking email covers it), or
+                # beyond the loaded window (the next load picks it up)
+                if fire_at <= now or fire_at > self._loaded_until:
+                    continue
+                self._live[(appointment_id, offset)] = fire_at
+                heapq.heappush(self._heap, (fire_at, appointment_id, offset))
+            self._cond.notify()
+
+    def cancel(self, appointment_id: int):
+        with self._cond:
+            for offset in self.offsets:
+                self._live.pop((appointment_id, offset), None)
+
+    # ── worker ──
+
+    def _load_window(self):
+        """Queue every booked appointment starting in the next lookahead window."""
+        now = datetime.now()
+        until = now + self.lookahead
+        horizon = until + timedelta(minutes=max(self.offsets))
+        db = SessionLocal()
+        try:
+            rows = db.query(models.Appointment.id, models.Slot.slot_date, models.Slot.start_time).join(
+                models.Slot, models.Appointment.slot_id == models.Slot.id
+            ).filter(
+                models.Appointment.status == models.AppointmentStatus.booked,
+                models.Slot.slot_date >= now.strftime("%Y-%m-%d"),
+                models.Slot.slot_date <= horizon.strftime("%Y-%m-%d"),
+            ).all()
+            sent = set(db.query(models.ReminderSent.appointment_id, models.ReminderSent.offset_minutes).filter(
+                models.ReminderSent.appointment_id.in_([r.id for r in rows])
+            )) if rows else set()
+            db.query(models.ReminderSent).filter(
+                models.ReminderSent.sent_at < datetime.utcnow() - timedelta(days=30)
+            ).delete(synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+
+        with self._cond:
+            for appt_id, slot_date, start_time in rows:
+                starts = _starts_at(slot_date, start_time)
+                if starts <= now:
+                    continue
+                for i, offset in enumerate(self.offsets):
+                    fire_at = starts - timedelta(minutes=offset)
+                    key = (appt_id, offset)
+                    if fire_at > until or key in sent or self._live.get(key) == fire_at:
+                        continue
+                    # After downtime only the latest overdue reminder is still worth sending
+                    later = self.offsets[i + 1:]
+                    if fire_at <= now and later and starts - timedelta(minutes=later[0]) <= now:
+                        continue
+                    self._live[key] = fire_at
+                    heapq.heappush(self._heap, (fire_at, appt_id, offset))
+            self._loaded_until = until
+            self._cond.notify()
+        logger.info(f"Reminder window loaded until {until:%Y-%m-%d %H:%M}, {len(self._heap)} queued")
+
+    def _pop_due(self):
+        """Block until reminders are due (or the window needs reloading); return them."""
+        with self._cond:
+            while True:
+                now = datetime.now()
+                reload_at = self._loaded_until - self.lookahead / 2
+                if now >= reload_at:
+                    return None
+                if self._heap and self._heap[0][0] <= now:
+                    due = []
+                    while self._heap and self._heap[0][0] <= now:
+                        fire_at, appt_id, offset = heapq.heappop(self._heap)
+                        if self._live.get((appt_id, offset)) == fire_at:
+                            del self._live[(appt_id, offset)]
+                            due.append((appt_id, offset))
+                    if due:
+                        return due
+                    continue
+                next_at = min(self._heap[0][0], reload_at) if self._heap else reload_at
+                self._cond.wait(timeout=max(0.0, (next_at - now).total_seconds()))
+
+    def _claim(self, db, due):
+        """Insert the sent markers; return the reminders this worker won."""
+        try:
+            db.bulk_insert_mappings(models.ReminderSent, [
+                {"appointment_id": appt_id, "offset_minutes": offset} for appt_id, offset in due
+            ])
+            db.commit()
+            return due
+        except IntegrityError:
+            db.rollback()
+        won = []
+        for appt_id, offset in due:
+            try:
+                db.add(models.ReminderSent(appointment_id=appt_id, offset_minutes=offset))
+                db.commit()
+                won.append((appt_id, offset))
+            except IntegrityError:
+                db.rollback()
+        return won
+
+    def _send(self, due):
+        db = SessionLocal()
+        try:
+            appts = {a.id: a for a in db.query(models.Appointment).options(
+                joinedload(models.Appointment.slot).joinedload(models.Slot.doctor).joinedload(models.Doctor.user),
+                joinedload(models.Appointment.patient),
+            ).filter(models.Appointment.id.in_({appt_id for appt_id, _ in due}))}
+            now = datetime.now()
+
+            def still_due(appt_id, offset):
+                # Drop anything cancelled, moved or already started since it was queued
+                appt = appts.get(appt_id)
+                if not appt or appt.status != models.AppointmentStatus.booked:
+                    return False
+                starts = _starts_at(appt.slot.slot_date, appt.slot.start_time)
+                return starts > now and starts - timedelta(minutes=offset) <= now + timedelta(minutes=1)
+
+            due = [(appt_id, offset) for appt_id, offset in due if still_due(appt_id, offset)]
+            reminders = []
+            for appt_id, offset in self._claim(db, due):
+                appt = appts[appt_id]
+                reminders.append({
+                    "to_email": appt.patient.email,
+                    "patient_name": appt.patient.full_name,
+                    "doctor_name": appt.slot.doctor.user.full_name,
+                    "slot_date": appt.slot.slot_date,
+                    "start_time": appt.slot.start_time,
+                    "end_time": appt.slot.end_time,
+                })
+        finally:
+            db.close()
+        send_reminder_emails(reminders)
+
+    def _run(self):
+        while True:
+            try:
+                due = self._pop_due()
+                if due is None:
+                    self._load_window()
+                else:
+                    self._send(due)
+            except Exception as e:
+                logger.error(f"Reminder scheduler error: {e}")
+                time.sleep(30)
+
+    def start(self):
+        if self._started or not self.offsets:
+            return
+        self._started = True
+        self._loaded_until = datetime.now() - self.lookahead  # forces the first load
+        threading.Thread(target=self._run, daemon=True, name="reminders").start()
+
+
+def forget_sent(db, appointment_id: int):
+    """Allow the reminders of a rescheduled appointment to be sent again for the new time."""
+    db.query(models.ReminderSent).filter(
+        models.ReminderSent.appointment_id == appointment_id
+    ).delete(synchronize_session=False)
+
+
+scheduler = ReminderScheduler(_offsets(), settings.REMINDER_LOOKAHEAD_HOURS)
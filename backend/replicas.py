@@ -0,0 +1,160 @@
+"""Routing of read-only requests to read replicas.
+
+``get_read_db`` is a drop-in replacement for ``get_db`` on GET routes. It
+hands out sessions bound to the replicas in round-robin order, skipping any
+that failed their last health check, and falls back to the primary when no
+replica is configured or healthy.
+
+A user whose own request committed changes in the last
+READ_YOUR_WRITES_SECONDS keeps reading from the primary, so they never see a
+replica that has not caught up with their booking yet. The window travels
+with the client in a signed cookie set by ``read_your_writes_middleware``,
+so it holds whichever worker serves their next request.
+"""
+import contextvars
+import hashlib
+import hmac
+import itertools
+import logging
+import threading
+import time
+from fastapi import Request
+from sqlalchemy import event, text
+from auth import user_id_from_request
+from config import settings
+from database import SessionLocal, make_engine
+
+logger = logging.getLogger(__name__)
+
+
+class ReplicaSet:
+    def __init__(self, urls, check_interval: int):
+        self.urls = list(urls)
+        self.engines = [make_engine(url) for url in self.urls]
+        self.check_interval = check_interval
+        self._healthy = [True] * len(self.engines)
+        self._counter = itertools.count()
+        self._started = False
+        for i, engine in enumerate(self.engines):
+            event.listen(engine, "handle_error", self._on_error(i))
+
+    def _on_error(self, i: int):
+        def handler(ctx):
+            if ctx.is_disconnect:
+                self._mark(i, False)
+        return handler
+
+    def _mark(self, i: int, healthy: bool):
+        if self._healthy[i] != healthy:
+            logger.warning(f"Read replica {self.urls[i]} is {'back up' if healthy else 'down'}")
+        self._healthy[i] = healthy
+
+    def pick(self):
+        """Next healthy replica engine, or None to use the primary."""
+        healthy = [e for e, ok in zip(self.engines, self._healthy) if ok]
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    def check(self):
+        for i, engine in enumerate(self.engines):
+            try:
+                with engine.connect() as conn:
+                    conn.execute(text("SELECT 1"))
+                self._mark(i, True)
+            except Exception as e:
+                logger.debug(f"Replica health check failed for {self.urls[i]}: {e}")
+                self._mark(i, False)
+
+    def start(self):
+        if self._started or not self.engines or self.check_interval <= 0:
+            return
+        self._started = True
+
+        def loop():
+            while True:
+                self.check()
+                time.sleep(self.check_interval)
+
+        threading.Thread(target=loop, daemon=True, name="replica-health").start()
+
+
+replicas = ReplicaSet(
+    [u.strip() for u in settings.DB_REPLICA_URLS.split(",") if u.strip()],
+    settings.DB_REPLICA_CHECK_SECONDS,
+)
+
+COOKIE = "rw_until"
+
+# Set per request by the middleware; holds "wrote" once that request committed a write
+_request_writes = contextvars.ContextVar("request_writes", default=None)
+
+
+def _sign(user_id: int, until: int) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), f"rw:{user_id}:{until}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def wrote_recently(request: Request) -> bool:
+    user_id = user_id_from_request(request)
+    if not user_id:
+        return False
+    try:
+        uid, until, sig = request.cookies.get(COOKIE, "").split(":")
+        uid, until = int(uid), int(until)
+    except ValueError:
+        return False
+    return uid == user_id and time.time() < until and hmac.compare_digest(sig, _sign(uid, until))
+
+
+@event.listens_for(SessionLocal, "after_flush")
+def _flushed(session, flush_context):
+    if session.new or session.dirty or session.deleted:
+        session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _bulk_write(orm_execute_state):
+    # query.update()/.delete() and bulk inserts never go through a flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_commit")
+def _committed(session):
+    writes = _request_writes.get()
+    if session.info.pop("wrote", False) and writes is not None:
+        writes["wrote"] = True
+
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _rolled_back(session):
+    session.info.pop("wrote", None)
+
+
+async def read_your_writes_middleware(request: Request, call_next):
+    writes = {}
+    token = _request_writes.set(writes)
+    try:
+        response = await call_next(request)
+    finally:
+        _request_writes.reset(token)
+    user_id = user_id_from_request(request)
+    if writes and user_id:
+        until = int(time.time()) + settings.READ_YOUR_WRITES_SECONDS + 1
+        response.set_cookie(
+            COOKIE, f"{user_id}:{until}:{_sign(user_id, until)}",
+            max_age=settings.READ_YOUR_WRITES_SECONDS + 1, httponly=True, samesite="lax",
+        )
+    return response
+
+
+def get_read_db(request: Request):
+    """Session for a read-only route: a replica unless the caller wrote recently."""
+    engine = None
+    if replicas.engines and not wrote_recently(request):
+        engine = replicas.pick()
+    db = SessionLocal(bind=engine) if engine is not None else SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
@@ -0,0 +1,293 @@
+from datetime import date, datetime, timedelta
+from typing import List, Optional
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+from config import settings
+
+
+def parse_days(days: str) -> set:
+    return {int(d) for d in days.split(",") if d.strip()}
+
+
+def format_days(days: List[int]) -> str:
+    return ",".join(str(d) for d in sorted(set(days)))
+
+
+def _overlaps(start: str, end: str, other_start: Optional[str], other_end: Optional[str]) -> bool:
+    # Zero-padded "HH:MM" strings compare correctly as text
+    if other_start is None or other_end is None:
+        return True
+    return max(start, other_start) < min(end, other_end)
+
+
+def rule_times(rule: models.ScheduleRule, day: date) -> List[tuple]:
+    """(start, end) pairs the rule offers on ``day``."""
+    day_str = day.strftime("%Y-%m-%d")
+    if day_str < rule.valid_from or (rule.valid_until and day_str > rule.valid_until):
+        return []
+    if day.weekday() not in parse_days(rule.days_of_week):
+        return []
+
+    times = []
+    step = timedelta(minutes=rule.slot_duration)
+    curr = datetime.combine(day, datetime.strptime(rule.start_time, "%H:%M").time())
+    day_end = datetime.combine(day, datetime.strptime(rule.end_time, "%H:%M").time())
+    while curr + step <= day_end:
+        start = curr.strftime("%H:%M")
+        end = (curr + step).strftime("%H:%M")
+        if not (rule.lunch_start and rule.lunch_end and _overlaps(start, end, rule.lunch_start, rule.lunch_end)):
+            times.append((start, end))
+        curr += step
+    return times
+
+
+def _load_rules(db: Session, doctor_id: int, start: str, end: str):
+    return db.query(models.ScheduleRule).filter(
+        models.ScheduleRule.doctor_id == doctor_id,
+        models.ScheduleRule.valid_from <= end,
+        (models.ScheduleRule.valid_until == None) | (models.ScheduleRule.valid_until >= start),
+    ).all()
+
+
+def _load_exceptions(db: Session, doctor_id: int, start: str, end: str):
+    by_date = {}
+    for exc in db.query(models.ScheduleException).filter(
+        models.ScheduleException.doctor_id == doctor_id,
+        models.ScheduleException.exc_date >= start,
+        models.ScheduleException.exc_date <= end,
+    ):
+        by_date.setdefault(exc.exc_date, []).append(exc)
+    return by_date
+
+
+def _blocked(exceptions, start: str, end: str) -> bool:
+    return any(_overlaps(start, end, e.start_time, e.end_time) for e in exceptions)
+
+
+def is_blocked(db: Session, slot: models.Slot) -> bool:
+    """Whether a schedule exception covers a stored slot, which then can't be booked."""
+    exceptions = _load_exceptions(db, slot.doctor_id, slot.slot_date, slot.slot_date).get(slot.slot_date, [])
+    return _blocked(exceptions, slot.start_time, slot.end_time)
+
+
+def open_times(db: Session, doctor_id: int, start_date: date, end_date: date) -> List[dict]:
+    """Rule-generated slots between the two dates (inclusive), minus exceptions.
+
+    Nothing is written: these are returned as slot dicts without an ``id``.
+    """
+    start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+    rules = _load_rules(db, doctor_id, start, end)
+    if not rules:
+        return []
+    exceptions = _load_exceptions(db, doctor_id, start, end)
+
+    seen = set()
+    result = []
+    day = start_date
+    while day <= end_date:
+        day_str = day.strftime("%Y-%m-%d")
+        day_exceptions = exceptions.get(day_str, [])
+        for rule in rules:
+            for s, e in rule_times(rule, day):
+                if (day_str, s) in seen or _blocked(day_exceptions, s, e):
+                    continue
+                seen.add((day_str, s))
+                result.append({
+                    "id": None,
+                    "doctor_id": doctor_id,
+                    "slot_date": day_str,
+                    "start_time": s,
+                    "end_time": e,
+                    "is_booked": False,
+                })
+        day += timedelta(days=1)
+    return result
+
+
+def list_slots(db: Session, doctor_id: int, slot_date: Optional[str] = None, available_only: bool = False):
+    """Stored slot rows merged with the open slots generated from schedule rules."""
+    q = db.query(models.Slot).filter(models.Slot.doctor_id == doctor_id)
+    if slot_date:
+        q = q.filter(models.Slot.slot_date == slot_date)
+    if available_only:
+        q = q.filter(models.Slot.is_booked == False)
+    rows = q.order_by(models.Slot.slot_date, models.Slot.start_time).all()
+    if rows:
+        # Open stored slots inside a blocked range are hidden like generated ones
+        exceptions = _load_exceptions(db, doctor_id, rows[0].slot_date, rows[-1].slot_date)
+        if exceptions:
+            rows = [r for r in rows if r.is_booked or not _blocked(exceptions.get(r.slot_date, []), r.start_time, r.end_time)]
+
+    if slot_date:
+        try:
+            first = last = datetime.strptime(slot_date, "%Y-%m-%d").date()
+        except ValueError:
+            return rows
+    else:
+        first = datetime.now().date()
+        last = first + timedelta(days=settings.SCHEDULE_HORIZON_DAYS)
+
+    taken = {
+        (slot_date_, start)
+        for slot_date_, start in db.query(models.Slot.slot_date, models.Slot.start_time).filter(
+            models.Slot.doctor_id == doctor_id,
+            models.Slot.slot_date >= first.strftime("%Y-%m-%d"),
+            models.Slot.slot_date <= last.strftime("%Y-%m-%d"),
+        )
+    }
+    generated = [v for v in open_times(db, doctor_id, first, last) if (v["slot_date"], v["start_time"]) not in taken]
+    if not generated:
+        return rows
+
+    merged = [
+        {"id": r.id, "doctor_id": r.doctor_id, "slot_date": r.slot_date,
+         "start_time": r.start_time, "end_time": r.end_time, "is_booked": r.is_booked}
+        for r in rows
+    ] + generated
+    merged.sort(key=lambda s: (s["slot_date"], s["start_time"]))
+    return merged
+
+
+def offered_times(db: Session, doctor_id: int, start_date: date, end_date: date) -> set:
+    """(slot_date, start_time) pairs the doctor offered between the two dates (inclusive).
+
+    Stored slots, live or archived, plus the rule-generated ones, without the
+    open slots a schedule exception blocks. Booked slots always count.
+    """
+    start, end = start_date.strftime("%Y-%m-%d"), end_date.strftime("%Y-%m-%d")
+    exceptions = _load_exceptions(db, doctor_id, start, end)
+    offered = set()
+    for slot_model in (models.Slot, models.ArchivedSlot):
+        for slot_date, s, e, booked in db.query(
+            slot_model.slot_date, slot_model.start_time, slot_model.end_time, slot_model.is_booked
+        ).filter(slot_model.doctor_id == doctor_id, slot_model.slot_date >= start, slot_model.slot_date <= end):
+            if booked or not _blocked(exceptions.get(slot_date, []), s, e):
+                offered.add((slot_date, s))
+    offered.update((v["slot_date"], v["start_time"]) for v in open_times(db, doctor_id, start_date, end_date))
+    return offered
+
+
+def materialize_slot(db: Session, doctor_id: int, slot_date: str, start_time: str, lock: bool = True) -> Optional[models.Slot]:
+    """Return the ``Slot`` row for a time (locked unless ``lock=False``), creating it from the rules if needed.
+
+    Returns None when the date or time is malformed or in the past, or when no
+    stored slot or rule covers the time. Both are normalised to "YYYY-MM-DD"
+    and "HH:MM" first, so "2026-11-8" and "2026-11-08" find the same row. A
+    concurrent insert of the same slot only rolls back a savepoint, so locks
+    the caller already holds are kept.
+    """
+    try:
+        day = datetime.strptime(slot_date, "%Y-%m-%d").date()
+        start_time = datetime.strptime(start_time, "%H:%M").strftime("%H:%M")
+    except ValueError:
+        return None
+    if day < date.today():
+        return None
+    slot_date = day.strftime("%Y-%m-%d")
+
+    def find():
+        q = db.query(models.Slot).filter(
+            models.Slot.doctor_id == doctor_id,
+            models.Slot.slot_date == slot_date,
+            models.Slot.start_time == start_time,
+        )
+        return q.with_for_update().first() if lock else q.first()
+
+    slot = find()
+    if slot:
+        return slot
+
+    match = next((v for v in open_times(db, doctor_id, day, day) if v["start_time"] == start_time), None)
+    if not match:
+        return None
+
+    slot = models.Slot(doctor_id=doctor_id, slot_date=slot_date, start_time=start_time, end_time=match["end_time"])
+    try:
+        with db.begin_nested():
+            db.add(slot)
+    except IntegrityError:
+        # Someone else materialized the same slot concurrently
+        return find()
+    return slot
+
+
+# ── Range operations (leave, closures, public holidays) ──
+
+RANGE_ACTIONS = ("block", "unblock", "delete")
+MAX_RANGE_DAYS = 366
+
+
+def apply_range(db: Session, action: str, doctor_ids: Optional[List[int]], date_from: date, date_to: date,
+                start_time: Optional[str] = None, end_time: Optional[str] = None, reason: Optional[str] = None) -> int:
+    """Block, unblock or delete the open slots in a window with one statement. Returns rows affected.
+
+    ``doctor_ids`` None means every doctor. Without start/end time the window
+    covers whole days. Blocking stores schedule exceptions, so it hides both
+    stored and rule-generated open slots; unblocking removes the exceptions
+    inside the window. Deleting removes stored open slot rows. Booked slots are
+    never touched; see :func:`range_conflicts`.
+    """
+    start, end = date_from.strftime("%Y-%m-%d"), date_to.strftime("%Y-%m-%d")
+
+    if action == "block":
+        e = models.ScheduleException
+        if doctor_ids is None:
+            doctor_ids = [d for (d,) in db.query(models.Doctor.id)]
+        existing = set(db.query(e.doctor_id, e.exc_date).filter(
+            e.doctor_id.in_(doctor_ids), e.exc_date >= start, e.exc_date <= end,
+            e.start_time == start_time, e.end_time == end_time,
+        ))
+        days = [(date_from + timedelta(days=i)).strftime("%Y-%m-%d") for i in range((date_to - date_from).days + 1)]
+        rows = [
+            {"doctor_id": d, "exc_date": day, "start_time": start_time, "end_time": end_time, "reason": reason}
+            for d in doctor_ids for day in days if (d, day) not in existing
+        ]
+        if rows:
+            db.execute(insert(e), rows)
+        return len(rows)
+
+    if action == "unblock":
+        e = models.ScheduleException
+        q = db.query(e).filter(e.exc_date >= start, e.exc_date <= end)
+        if doctor_ids is not None:
+            q = q.filter(e.doctor_id.in_(doctor_ids))
+        if start_time:
+            q = q.filter(e.start_time >= start_time, e.end_time <= end_time)
+        return q.delete(synchronize_session=False)
+
+    q = db.query(models.Slot).filter(
+        models.Slot.is_booked == False,
+        models.Slot.slot_date >= start,
+        models.Slot.slot_date <= end,
+    )
+    if doctor_ids is not None:
+        q = q.filter(models.Slot.doctor_id.in_(doctor_ids))
+    if start_time:
+        q = q.filter(models.Slot.start_time < end_time, models.Slot.end_time > start_time)
+    return q.delete(synchronize_session=False)
+
+
+def range_conflicts(db: Session, doctor_ids: Optional[List[int]], date_from: date, date_to: date,
+                    start_time: Optional[str] = None, end_time: Optional[str] = None) -> List[dict]:
+    """Booked appointments inside a window, which range operations leave alone."""
+    q = db.query(
+        models.Appointment.id, models.Slot.doctor_id, models.Slot.slot_date,
+        models.Slot.start_time, models.Slot.end_time, models.User.full_name,
+    ).join(models.Slot, models.Appointment.slot_id == models.Slot.id).join(
+        models.User, models.Appointment.patient_id == models.User.id
+    ).filter(
+        models.Appointment.status == models.AppointmentStatus.booked,
+        models.Slot.slot_date >= date_from.strftime("%Y-%m-%d"),
+        models.Slot.slot_date <= date_to.strftime("%Y-%m-%d"),
+    )
+    if doctor_ids is not None:
+        q = q.filter(models.Slot.doctor_id.in_(doctor_ids))
+    if start_time:
+        q = q.filter(models.Slot.start_time < end_time, models.Slot.end_time > start_time)
+    return [
+        {"appointment_id": r[0], "doctor_id": r[1], "slot_date": r[2], "start_time": r[3],
+         "end_time": r[4], "patient_name": r[5]}
+        for r in q.order_by(models.Slot.slot_date, models.Slot.start_time, models.Slot.doctor_id)
+    ]
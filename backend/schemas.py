@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, field_validator
+from typing import Optional, List, Literal
 from datetime import datetime
 from models import UserRole, AppointmentStatus
 
@@ -73,6 +73,11 @@ class DoctorCreate(BaseModel):
     consultation_fee: int = 0
 
 
+class NotificationSettings(BaseModel):
+    # immediate = one email per booking event; hourly/daily = one digest per period
+    mode: Literal["immediate", "hourly", "daily"]
+
+
 class DoctorOut(BaseModel):
     id: int
     user_id: int
@@ -89,6 +94,13 @@ class DoctorOut(BaseModel):
         from_attributes = True
 
 
+class DoctorSearchResult(BaseModel):
+    total: int
+    page: int
+    page_size: int
+    results: List[DoctorOut]
+
+
 # ─── Slot ──────────────────────────────────────────────────────────────────────
 
 class SlotBulkCreate(BaseModel):
@@ -108,7 +120,7 @@ class SlotCreate(BaseModel):
 
 
 class SlotOut(BaseModel):
-    id: int
+    id: Optional[int]  # None for open slots generated from a schedule rule
     doctor_id: int
     slot_date: str
     start_time: str
@@ -119,12 +131,147 @@ class SlotOut(BaseModel):
         from_attributes = True
 
 
+class AgendaAppointment(BaseModel):
+    id: int
+    status: str
+    reason: Optional[str] = None
+    patient_id: int
+    patient_name: Optional[str] = None
+    patient_phone: Optional[str] = None
+
+
+class AgendaSlot(BaseModel):
+    slot_id: Optional[int]  # None for open slots generated from a schedule rule
+    start_time: str
+    end_time: str
+    is_booked: bool
+    appointment: Optional[AgendaAppointment] = None
+
+
+class AgendaDay(BaseModel):
+    date: str
+    slots: List[AgendaSlot]
+
+
+# ─── Schedule ──────────────────────────────────────────────────────────────────
+
+class ScheduleRuleCreate(BaseModel):
+    start_time: str  # "HH:MM"
+    end_time: str    # "HH:MM"
+    slot_duration: int = 30
+    lunch_start: Optional[str] = None
+    lunch_end: Optional[str] = None
+    days_of_week: List[int] = [0, 1, 2, 3, 4] # 0=Mon, 6=Sun
+    valid_from: Optional[str] = None   # "YYYY-MM-DD", defaults to today
+    valid_until: Optional[str] = None  # "YYYY-MM-DD", open-ended when omitted
+
+    @field_validator("lunch_start", "lunch_end", "valid_from", "valid_until", mode="before")
+    @classmethod
+    def blank_is_none(cls, v):
+        # Cleared form fields arrive as ""
+        return v or None
+
+
+class ScheduleRuleOut(BaseModel):
+    id: int
+    doctor_id: int
+    days_of_week: List[int]
+    start_time: str
+    end_time: str
+    slot_duration: int
+    lunch_start: Optional[str]
+    lunch_end: Optional[str]
+    valid_from: str
+    valid_until: Optional[str]
+
+    @field_validator("days_of_week", mode="before")
+    @classmethod
+    def split_days(cls, v):
+        return [int(d) for d in v.split(",") if d] if isinstance(v, str) else v
+
+    class Config:
+        from_attributes = True
+
+
+class ScheduleExceptionCreate(BaseModel):
+    exc_date: str                      # "YYYY-MM-DD"
+    start_time: Optional[str] = None   # whole day when omitted
+    end_time: Optional[str] = None
+    reason: Optional[str] = None
+
+
+class SlotRangeAction(BaseModel):
+    action: Literal["block", "unblock", "delete"]
+    date_from: str                     # "YYYY-MM-DD"
+    date_to: str
+    start_time: Optional[str] = None   # whole days when omitted
+    end_time: Optional[str] = None
+    reason: Optional[str] = None
+
+
+class SlotRangeConflict(BaseModel):
+    appointment_id: int
+    doctor_id: int
+    slot_date: str
+    start_time: str
+    end_time: str
+    patient_name: Optional[str] = None
+
+
+class SlotRangeResult(BaseModel):
+    affected: int
+    conflicts: List[SlotRangeConflict]
+
+
+class ScheduleExceptionOut(BaseModel):
+    id: int
+    doctor_id: int
+    exc_date: str
+    start_time: Optional[str]
+    end_time: Optional[str]
+    reason: Optional[str]
+
+    class Config:
+        from_attributes = True
+
+
 # ─── Appointment ───────────────────────────────────────────────────────────────
 
 class AppointmentCreate(BaseModel):
-    slot_id: int
+    # Either a stored slot id, or doctor/date/time of an open schedule slot
+    slot_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    slot_date: Optional[str] = None
+    start_time: Optional[str] = None
     reason: Optional[str] = None
 
+class AppointmentReschedule(BaseModel):
+    # Same target forms as AppointmentCreate
+    slot_id: Optional[int] = None
+    doctor_id: Optional[int] = None
+    slot_date: Optional[str] = None
+    start_time: Optional[str] = None
+
+class WaitlistCreate(BaseModel):
+    doctor_id: int
+    date_from: str
+    date_to: str
+    auto_book: bool = True
+
+class WaitlistOut(BaseModel):
+    id: int
+    doctor_id: int
+    date_from: str
+    date_to: str
+    auto_book: bool
+    status: str
+    appointment_id: Optional[int] = None
+    last_offered_at: Optional[datetime] = None
+    created_at: datetime
+
+    class Config:
+        from_attributes = True
+
 class AppointmentComplete(BaseModel):
     prescription_notes: str
     medications: str
@@ -145,6 +292,33 @@ class AppointmentOut(BaseModel):
     class Config:
         from_attributes = True
 
+class AppointmentListItem(BaseModel):
+    """Flat row for appointment lists; no nested slot or user objects."""
+    id: int
+    status: str
+    reason: Optional[str] = None
+    prescription_notes: Optional[str] = None
+    medications: Optional[str] = None
+    created_at: Optional[datetime] = None
+    slot_id: int
+    slot_date: str
+    start_time: str
+    end_time: str
+    doctor_id: int
+    doctor_name: str
+    specialization: Optional[str] = None
+    patient_id: int
+    patient_name: Optional[str] = None
+
+# ─── Admin ─────────────────────────────────────────────────────────────────────
+
+class ProfileRequest(BaseModel):
+    # Either sample the whole process for ``seconds``, or profile the next
+    # ``requests`` requests whose path starts with ``path``
+    seconds: Optional[float] = None
+    path: str = "/"
+    requests: int = 1
+
 # ─── Chat ──────────────────────────────────────────────────────────────────────
 
 class ChatRequest(BaseModel):
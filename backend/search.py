@@ -0,0 +1,203 @@
+import bisect
+import logging
+import math
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Optional
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.orm import Session, joinedload
+import models
+from config import settings
+from invalidation import cache_bus
+
+logger = logging.getLogger(__name__)
+
+TOKEN = re.compile(r"\w+", re.UNICODE)
+# Relative weight of a hit in each field
+FIELD_WEIGHTS = {"name": 3.0, "specialization": 2.0, "qualification": 1.5, "bio": 1.0}
+PREFIX_WEIGHT = 0.5
+
+
+def tokenize(text: Optional[str]):
+    return TOKEN.findall(text.lower()) if text else []
+
+
+class DoctorSearchIndex:
+    """In-memory inverted index over doctor name, specialization, qualification and bio.
+
+    Used when the database has no full-text support (e.g. SQLite). Rebuilt
+    lazily after ``invalidate()`` or once it is older than the TTL.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._built_at = None
+        # (postings, vocab, docs), swapped as one reference so a search never
+        # mixes two builds:
+        #   postings: term -> {doctor_id: weighted term frequency}
+        #   vocab:    sorted terms, for prefix lookups
+        #   docs:     doctor_id -> filter fields
+        self._snapshot = ({}, [], {})
+        self._dirty = True
+
+    def invalidate(self):
+        self._dirty = True
+
+    def _stale(self) -> bool:
+        return self._dirty or self._built_at is None or time.monotonic() - self._built_at > self.ttl
+
+    def _build(self, db: Session):
+        rows = db.query(
+            models.Doctor.id, models.Doctor.bio, models.Doctor.qualification,
+            models.Doctor.consultation_fee, models.Doctor.experience_years,
+            models.Doctor.specialization_id, models.User.full_name, models.Specialization.name,
+        ).join(models.User, models.Doctor.user_id == models.User.id).outerjoin(
+            models.Specialization, models.Doctor.specialization_id == models.Specialization.id
+        ).filter(models.Doctor.is_available == True).all()
+
+        postings = defaultdict(lambda: defaultdict(float))
+        docs = {}
+        for r in rows:
+            fields = {"name": r.full_name, "specialization": r.name, "qualification": r.qualification, "bio": r.bio}
+            for field, text in fields.items():
+                for term in tokenize(text):
+                    postings[term][r.id] += FIELD_WEIGHTS[field]
+            docs[r.id] = (r.specialization_id, r.consultation_fee or 0, r.experience_years or 0)
+
+        postings = {t: dict(p) for t, p in postings.items()}
+        self._snapshot = (postings, sorted(postings), docs)
+        self._built_at = time.monotonic()
+        self._dirty = False
+
+    def _ensure(self, db: Session):
+        if self._stale():
+            with self._lock:
+                if self._stale():
+                    self._build(db)
+
+    @staticmethod
+    def _prefix_terms(vocab, prefix: str):
+        i = bisect.bisect_left(vocab, prefix)
+        while i < len(vocab) and vocab[i].startswith(prefix):
+            yield vocab[i]
+            i += 1
+
+    def search(self, db: Session, q: str, specialization_id=None, min_fee=None, max_fee=None, min_experience=None):
+        """Return ``[(doctor_id, score)]`` best first."""
+        self._ensure(db)
+        postings, vocab, docs = self._snapshot
+        n = max(len(docs), 1)
+        scores = defaultdict(float)
+        for term in set(tokenize(q)):
+            hits = [(term, 1.0)] if term in postings else []
+            hits += [(t, PREFIX_WEIGHT) for t in self._prefix_terms(vocab, term) if t != term]
+            for t, weight in hits:
+                docs_for_term = postings[t]
+                idf = math.log(1 + n / len(docs_for_term))
+                for doc_id, tf in docs_for_term.items():
+                    scores[doc_id] += weight * idf * (1 + math.log(tf))
+
+        result = []
+        for doc_id, score in scores.items():
+            spec_id, fee, exp = docs[doc_id]
+            if specialization_id and spec_id != specialization_id:
+                continue
+            if min_fee is not None and fee < min_fee:
+                continue
+            if max_fee is not None and fee > max_fee:
+                continue
+            if min_experience is not None and exp < min_experience:
+                continue
+            result.append((doc_id, score))
+        result.sort(key=lambda x: (-x[1], x[0]))
+        return result
+
+
+doctor_index = DoctorSearchIndex(ttl=settings.SEARCH_INDEX_TTL_SECONDS)
+cache_bus.subscribe("doctors", lambda key: doctor_index.invalidate())
+
+
+def _doctor_query(db: Session):
+    return db.query(models.Doctor).options(
+        joinedload(models.Doctor.user),
+        joinedload(models.Doctor.specialization),
+    )
+
+
+def _filtered(q, specialization_id, min_fee, max_fee, min_experience):
+    q = q.filter(models.Doctor.is_available == True)
+    if specialization_id:
+        q = q.filter(models.Doctor.specialization_id == specialization_id)
+    if min_fee is not None:
+        q = q.filter(models.Doctor.consultation_fee >= min_fee)
+    if max_fee is not None:
+        q = q.filter(models.Doctor.consultation_fee <= max_fee)
+    if min_experience is not None:
+        q = q.filter(models.Doctor.experience_years >= min_experience)
+    return q
+
+
+def _mysql_search(db: Session, text: str, filters: dict, page: int, page_size: int):
+    from sqlalchemy.dialects.mysql import match
+
+    score = (
+        match(models.User.full_name, against=text).in_natural_language_mode() * FIELD_WEIGHTS["name"]
+        + match(models.Specialization.name, against=text).in_natural_language_mode() * FIELD_WEIGHTS["specialization"]
+        + match(models.Doctor.bio, models.Doctor.qualification, against=text).in_natural_language_mode()
+    ).label("score")
+    base = _filtered(
+        db.query(models.Doctor.id, score)
+        .join(models.User, models.Doctor.user_id == models.User.id)
+        .outerjoin(models.Specialization, models.Doctor.specialization_id == models.Specialization.id),
+        **filters,
+    )
+    ranked = base.subquery()
+    total = db.query(ranked.c.id).filter(ranked.c.score > 0).count()
+    ids = [r.id for r in db.query(ranked.c.id).filter(ranked.c.score > 0).order_by(
+        ranked.c.score.desc(), ranked.c.id
+    ).offset((page - 1) * page_size).limit(page_size)]
+    return total, ids
+
+
+def search_doctors(
+    db: Session,
+    text: Optional[str],
+    specialization_id: Optional[int] = None,
+    min_fee: Optional[int] = None,
+    max_fee: Optional[int] = None,
+    min_experience: Optional[int] = None,
+    page: int = 1,
+    page_size: int = 20,
+):
+    """Ranked, paginated doctor search. Returns ``(total, doctors)``."""
+    filters = dict(specialization_id=specialization_id, min_fee=min_fee, max_fee=max_fee, min_experience=min_experience)
+
+    if not text or not tokenize(text):
+        q = _filtered(_doctor_query(db), **filters)
+        total = q.count()
+        doctors = q.order_by(models.Doctor.experience_years.desc(), models.Doctor.id).offset(
+            (page - 1) * page_size
+        ).limit(page_size).all()
+        return total, doctors
+
+    ids = None
+    if db.bind.dialect.name == "mysql":
+        try:
+            total, ids = _mysql_search(db, text, filters, page, page_size)
+        except DBAPIError as e:
+            # Full-text indexes missing: fall back to the in-memory index
+            db.rollback()
+            logger.error(f"Full-text search failed, using in-memory index: {e}")
+    if ids is None:
+        ranked = doctor_index.search(db, text, **filters)
+        total = len(ranked)
+        start = (page - 1) * page_size
+        ids = [doc_id for doc_id, _ in ranked[start:start + page_size]]
+
+    if not ids:
+        return total, []
+    by_id = {d.id: d for d in _doctor_query(db).filter(models.Doctor.id.in_(ids))}
+    return total, [by_id[i] for i in ids if i in by_id]
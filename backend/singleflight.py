@@ -0,0 +1,130 @@
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class _Flight:
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.chunks = []
+        self.subscribers = 0
+        self.done = False
+        self.error = None
+        self.abort = None  # stops the upstream early once nobody reads it
+
+
+class SingleFlight:
+    """Share one upstream token stream between identical in-flight requests.
+
+    The first caller for a key creates the upstream generator with ``factory``
+    (in its own thread, so anything ``factory`` raises reaches that caller)
+    and drains it in a worker thread; every caller (including late joiners,
+    who get the chunks produced so far replayed first) reads from the same
+    buffer and, once it runs out, sees the upstream's exception if there was
+    one. Once the last subscriber goes away the upstream generator is closed,
+    and the flight's ``abort`` callable, if any, is called to stop it without
+    waiting for its next chunk.
+    """
+
+    # How often a reader waiting for chunks checks whether it was cancelled
+    CANCEL_POLL_SECONDS = 0.1
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._flights)
+
+    def _join(self, key, factory, abort):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                with flight.cond:
+                    # A flight everyone has left is being stopped; start afresh
+                    if not flight.done and flight.subscribers:
+                        flight.subscribers += 1
+                        return flight
+            flight = _Flight()
+            flight.subscribers = 1
+            flight.abort = abort
+            self._flights[key] = flight
+        try:
+            upstream = factory()
+        except Exception as e:
+            # Callers that joined meanwhile see the same failure
+            with flight.cond:
+                flight.error = e
+                flight.done = True
+                flight.cond.notify_all()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+            raise
+        threading.Thread(target=self._run, args=(key, flight, upstream), daemon=True).start()
+        return flight
+
+    def _run(self, key, flight, upstream):
+        try:
+            for chunk in upstream:
+                with flight.cond:
+                    if flight.subscribers == 0:
+                        break
+                    flight.chunks.append(chunk)
+                    flight.cond.notify_all()
+        except Exception as e:
+            logger.error(f"Upstream stream for flight failed: {e}")
+            with flight.cond:
+                flight.error = e
+        finally:
+            close = getattr(upstream, "close", None)
+            if close:
+                close()
+            with flight.cond:
+                flight.done = True
+                flight.cond.notify_all()
+            with self._lock:
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    def open(self, key, factory, cancelled: threading.Event = None, abort=None):
+        """Join the flight for ``key`` now, starting it via ``factory`` if needed,
+        and return a generator of its chunks.
+
+        The generator ends as soon as ``cancelled`` is set, even while waiting
+        for the next chunk. ``abort`` is kept only if this call starts the flight.
+        """
+        return self._read(self._join(key, factory, abort), cancelled)
+
+    def stream(self, key, factory):
+        """Yield the chunks of the flight for ``key``, starting it via ``factory`` if needed."""
+        yield from self.open(key, factory)
+
+    def _read(self, flight, cancelled=None):
+        pos = 0
+        try:
+            while True:
+                with flight.cond:
+                    while pos >= len(flight.chunks) and not flight.done:
+                        if cancelled is None:
+                            flight.cond.wait()
+                        elif cancelled.is_set():
+                            return
+                        else:
+                            flight.cond.wait(self.CANCEL_POLL_SECONDS)
+                    pending = flight.chunks[pos:]
+                    done = flight.done
+                pos += len(pending)
+                yield from pending
+                if done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            with flight.cond:
+                flight.subscribers -= 1
+                idle = flight.subscribers == 0 and not flight.done
+            if idle and flight.abort:
+                flight.abort()
@@ -0,0 +1,52 @@
+import asyncio
+import json
+from sqlalchemy.orm import Session
+import models
+import schemas
+from pubsub import bus
+
+HEARTBEAT_SECONDS = 15
+
+
+def doctor_channel(doctor_id: int) -> str:
+    return f"slots:doctor:{doctor_id}"
+
+
+def specialization_channel(spec_id: int) -> str:
+    return f"slots:spec:{spec_id}"
+
+
+def _publish(db: Session, doctor_id: int, message: dict):
+    spec_id = db.query(models.Doctor.specialization_id).filter(models.Doctor.id == doctor_id).scalar()
+    bus.publish(doctor_channel(doctor_id), message)
+    if spec_id:
+        bus.publish(specialization_channel(spec_id), message)
+
+
+def publish_slot_change(db: Session, slot: models.Slot, action: str):
+    """Notify listeners that ``slot`` was created, booked, freed or deleted."""
+    _publish(db, slot.doctor_id, {
+        "type": "slot",
+        "action": action,
+        "slot": schemas.SlotOut.model_validate(slot).model_dump(),
+    })
+
+
+def publish_slots_refresh(db: Session, doctor_id: int):
+    """Tell listeners that many of a doctor's slots changed and they should re-fetch."""
+    _publish(db, doctor_id, {"type": "refresh", "doctor_id": doctor_id})
+
+
+async def slot_event_stream(request, channels):
+    sub = bus.subscribe(channels)
+    try:
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            try:
+                _, message = await sub.get(timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": keep-alive\n\n"
+                continue
+            yield f"event: {message['type']}\ndata: {json.dumps(message)}\n\n"
+    finally:
+        sub.close()
@@ -0,0 +1,145 @@
+import asyncio
+import json
+import threading
+import time
+
+BOOK_NOW_TAG = "[BOOK_NOW]"
+# How often a streaming response checks whether the client is still there
+DISCONNECT_POLL_SECONDS = 0.1
+
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class TagFilter:
+    """Removes ``BOOK_NOW_TAG`` from streamed text, even when it is split
+    across chunks, and remembers whether it was seen."""
+
+    def __init__(self, tag: str = BOOK_NOW_TAG):
+        self.tag = tag
+        self.found = False
+        self._held = ""
+
+    def feed(self, text: str) -> str:
+        text = self._held + text
+        if self.tag in text:
+            self.found = True
+            text = text.replace(self.tag, "")
+        # Hold back a trailing partial tag until the next chunk decides it
+        for n in range(min(len(self.tag) - 1, len(text)), 0, -1):
+            if self.tag.startswith(text[-n:]):
+                self._held = text[-n:]
+                return text[:-n]
+        self._held = ""
+        return text
+
+    def flush(self) -> str:
+        held, self._held = self._held, ""
+        return held
+
+
+async def chat_events(request, stream, window: float = 0.05, max_chars: int = 256, abort: threading.Event = None):
+    """Turn a sync token generator into batched Server-Sent Events.
+
+    Tokens are pumped from a worker thread and flushed as one ``token`` event
+    every ``window`` seconds or ``max_chars`` characters, whichever comes
+    first. A client disconnect is watched alongside the tokens; when it
+    happens the stream ends and ``abort`` is set, which should make
+    ``stream`` stop generating. The ``usage`` event reports how many token
+    events were sent.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+    cancelled = abort or threading.Event()
+    started = time.monotonic()
+
+    def pump():
+        try:
+            for chunk in stream:
+                if cancelled.is_set():
+                    break
+                loop.call_soon_threadsafe(queue.put_nowait, ("chunk", chunk))
+            loop.call_soon_threadsafe(queue.put_nowait, ("done", None))
+        except Exception:
+            # The details are logged upstream; they may contain provider URLs or keys
+            loop.call_soon_threadsafe(queue.put_nowait, ("error", "The assistant failed to answer"))
+        finally:
+            stream.close()
+
+    async def watch_disconnect():
+        while not await request.is_disconnected():
+            await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+    def elapsed_ms():
+        return round((time.monotonic() - started) * 1000, 1)
+
+    loop.run_in_executor(None, pump)
+    disconnected = asyncio.ensure_future(watch_disconnect())
+    getter = None
+
+    async def next_item(timeout=None):
+        """The next queue item, ("disconnect", None), or None after ``timeout``."""
+        nonlocal getter
+        if getter is None:
+            getter = asyncio.ensure_future(queue.get())
+        done, _ = await asyncio.wait({getter, disconnected}, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        if disconnected in done:
+            return "disconnect", None
+        if getter in done:
+            item, getter = getter.result(), None
+            return item
+        return None
+
+    tags = TagFilter()
+    first_token_ms = None
+    chunks = chars = events = 0
+    try:
+        finished = False
+        while not finished:
+            kind, value = await next_item()
+            if kind == "disconnect":
+                break
+            batch = []
+            deadline = loop.time() + window
+            while True:
+                if kind == "chunk":
+                    chunks += 1
+                    chars += len(value)
+                    batch.append(tags.feed(value))
+                else:
+                    finished = True
+                    break
+                remaining = deadline - loop.time()
+                if sum(map(len, batch)) >= max_chars or remaining <= 0:
+                    break
+                item = await next_item(remaining)
+                if item is None:
+                    break
+                kind, value = item
+            if kind == "disconnect":
+                break
+
+            if kind == "done":
+                batch.append(tags.flush())
+            text = "".join(batch)
+            if text:
+                if first_token_ms is None:
+                    first_token_ms = elapsed_ms()
+                yield sse_event("token", {"text": text, "t_ms": elapsed_ms()})
+                events += 1
+            if kind == "error":
+                yield sse_event("error", {"message": value, "t_ms": elapsed_ms()})
+            if kind == "done":
+                yield sse_event("usage", {"chunks": chunks, "chars": chars, "events": events})
+                yield sse_event("done", {
+                    "book_now": tags.found,
+                    "ttft_ms": first_token_ms,
+                    "total_ms": elapsed_ms(),
+                })
+    finally:
+        # Stops the upstream request now rather than at its next chunk
+        cancelled.set()
+        disconnected.cancel()
+        if getter is not None:
+            getter.cancel()
@@ -0,0 +1,99 @@
+"""Booking open schedule slots: materializing the row and refusing double bookings.
+
+    cd backend && python -m pytest test_booking.py
+"""
+import models
+import schedules
+from conftest import auth, register
+from database import SessionLocal
+
+
+def _book(client, token, doctor_id, day, start_time="09:00", **extra):
+    return client.post("/appointments", json={
+        "doctor_id": doctor_id, "slot_date": day, "start_time": start_time, **extra,
+    }, headers=auth(token))
+
+
+def _slots(doctor_id, day):
+    db = SessionLocal()
+    try:
+        return db.query(models.Slot).filter(models.Slot.doctor_id == doctor_id, models.Slot.slot_date == day).all()
+    finally:
+        db.close()
+
+
+def test_booking_an_open_slot_stores_it(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    assert _slots(doctor_id, day) == []
+
+    r = _book(client, patient["access_token"], doctor_id, day, reason="Checkup")
+    assert r.status_code == 201, r.text
+    assert r.json()["slot"]["start_time"] == "09:00"
+
+    [slot] = _slots(doctor_id, day)
+    assert slot.is_booked and slot.end_time == "09:30"
+    listed = client.get(f"/doctors/{doctor_id}/slots", params={"date": day}).json()
+    assert [s["is_booked"] for s in listed if s["start_time"] == "09:00"] == [True]
+
+
+def test_second_booking_of_a_slot_is_refused(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    assert _book(client, patient["access_token"], doctor_id, day).status_code == 201
+
+    other = register(client)
+    r = _book(client, other["access_token"], doctor_id, day)
+    assert r.status_code == 409
+    # The stored slot's id is refused the same way
+    slot_id = _slots(doctor_id, day)[0].id
+    r = client.post("/appointments", json={"slot_id": slot_id}, headers=auth(other["access_token"]))
+    assert r.status_code == 409
+    assert len(_slots(doctor_id, day)) == 1
+
+
+def test_unpadded_date_and_time_find_the_same_slot(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    assert _book(client, patient["access_token"], doctor_id, day).status_code == 201
+
+    y, m, d = day.split("-")
+    db = SessionLocal()
+    try:
+        slot = schedules.materialize_slot(db, doctor_id, f"{y}-{int(m)}-{int(d)}", "9:00")
+        assert slot.is_booked and slot.slot_date == day and slot.start_time == "09:00"
+    finally:
+        db.close()
+    assert len(_slots(doctor_id, day)) == 1
+
+
+def test_time_outside_the_schedule_is_not_found(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    assert _book(client, patient["access_token"], doctor_id, day, "09:10").status_code == 404
+    assert _book(client, patient["access_token"], doctor_id, day, "13:00").status_code == 404
+    assert _slots(doctor_id, day) == []
+
+
+def test_concurrent_materialize_reuses_the_other_row(doctor, day, monkeypatch):
+    # Another request stores the slot between our lookup and our insert
+    doctor_id, _ = doctor
+    open_times = schedules.open_times
+
+    def racing_open_times(db, *args, **kwargs):
+        other = SessionLocal()
+        try:
+            other.add(models.Slot(doctor_id=doctor_id, slot_date=day, start_time="10:00", end_time="10:30"))
+            other.commit()
+        finally:
+            other.close()
+        return open_times(db, *args, **kwargs)
+
+    monkeypatch.setattr(schedules, "open_times", racing_open_times)
+    db = SessionLocal()
+    try:
+        slot = schedules.materialize_slot(db, doctor_id, day, "10:00")
+        assert slot is not None and slot.id is not None
+        # Only the savepoint was rolled back; the session carries on
+        slot.is_booked = True
+        db.commit()
+    finally:
+        db.close()
+    [stored] = _slots(doctor_id, day)
+    assert stored.start_time == "10:00" and stored.is_booked
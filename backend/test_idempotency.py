@@ -0,0 +1,123 @@
+"""Replaying retried requests that carry an Idempotency-Key.
+
+    cd backend && python -m pytest test_idempotency.py
+"""
+import uuid
+from datetime import datetime, timedelta
+import models
+from conftest import auth, register
+from database import SessionLocal
+from idempotency import HEADER
+
+
+def _book(client, token, doctor_id, day, key, start_time="09:00"):
+    return client.post(
+        "/appointments",
+        json={"doctor_id": doctor_id, "slot_date": day, "start_time": start_time},
+        headers={**auth(token), HEADER: key},
+    )
+
+
+def _appointments(patient_id):
+    db = SessionLocal()
+    try:
+        return db.query(models.Appointment).filter(models.Appointment.patient_id == patient_id).count()
+    finally:
+        db.close()
+
+
+def _set_record(user_id, key, **values):
+    db = SessionLocal()
+    try:
+        db.query(models.IdempotencyRecord).filter(
+            models.IdempotencyRecord.user_id == user_id,
+            models.IdempotencyRecord.key == key,
+        ).update(values)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_retry_replays_the_first_response(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    key = str(uuid.uuid4())
+    first = _book(client, patient["access_token"], doctor_id, day, key)
+    assert first.status_code == 201, first.text
+    assert "Idempotent-Replayed" not in first.headers
+
+    again = _book(client, patient["access_token"], doctor_id, day, key)
+    assert again.status_code == 201
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert again.json() == first.json()
+    assert _appointments(patient["user_id"]) == 1
+
+
+def test_error_responses_are_replayed_too(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    key = str(uuid.uuid4())
+    first = _book(client, patient["access_token"], doctor_id, day, key, "13:00")
+    assert first.status_code == 404
+    again = _book(client, patient["access_token"], doctor_id, day, key, "13:00")
+    assert again.status_code == 404 and again.headers["Idempotent-Replayed"] == "true"
+
+
+def test_key_reused_for_another_request(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    key = str(uuid.uuid4())
+    assert _book(client, patient["access_token"], doctor_id, day, key).status_code == 201
+    r = _book(client, patient["access_token"], doctor_id, day, key, "09:30")
+    assert r.status_code == 422
+    assert _appointments(patient["user_id"]) == 1
+
+
+def test_keys_are_per_user(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    key = str(uuid.uuid4())
+    assert _book(client, patient["access_token"], doctor_id, day, key).status_code == 201
+    other = register(client)
+    r = _book(client, other["access_token"], doctor_id, day, key)
+    # Not a replay of someone else's booking: a fresh attempt, refused on its own merits
+    assert r.status_code == 409 and "Idempotent-Replayed" not in r.headers
+
+
+def test_in_progress_key_asks_to_retry_later(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    key = str(uuid.uuid4())
+    assert _book(client, patient["access_token"], doctor_id, day, key).status_code == 201
+    # As if the first request were still running
+    _set_record(
+        patient["user_id"], key, status_code=None, response_body=None,
+        expires_at=datetime.utcnow() + timedelta(seconds=20),
+    )
+    r = _book(client, patient["access_token"], doctor_id, day, key)
+    assert r.status_code == 409
+    assert 1 <= int(r.headers["Retry-After"]) <= 21
+
+
+def test_abandoned_lease_can_be_claimed_again(client, doctor, patient, day):
+    doctor_id, _ = doctor
+    key = str(uuid.uuid4())
+    assert _book(client, patient["access_token"], doctor_id, day, key).status_code == 201
+    # The first request died before finishing and its lease ran out
+    _set_record(
+        patient["user_id"], key, status_code=None, response_body=None,
+        expires_at=datetime.utcnow() - timedelta(seconds=1),
+    )
+    r = _book(client, patient["access_token"], doctor_id, day, key)
+    # Runs for real this time: the slot it booked before is taken
+    assert r.status_code == 409 and "Idempotent-Replayed" not in r.headers
+
+
+def test_auth_routes_are_not_stored(client):
+    key = str(uuid.uuid4())
+    name = f"idem-{key[:8]}"
+    body = {"full_name": "Idem", "username": name, "email": f"{name}@example.com", "password": "pw123456"}
+    assert client.post("/auth/register", json=body, headers={HEADER: key}).status_code == 201
+    r = client.post("/auth/register", json=body, headers={HEADER: key})
+    assert r.status_code == 400 and "Idempotent-Replayed" not in r.headers
+
+    db = SessionLocal()
+    try:
+        assert db.query(models.IdempotencyRecord).filter(models.IdempotencyRecord.key == key).count() == 0
+    finally:
+        db.close()
@@ -0,0 +1,194 @@
+"""Streaming and hedging of the LLM providers against a local fake server.
+
+One threaded HTTP server speaks just enough of the Ollama, OpenAI and Gemini
+APIs. Each test sets how long a path waits before its first token and
+whether it fails; the server notes when a client hangs up during the wait.
+
+    cd backend && python -m pytest test_llm_providers.py
+"""
+import json
+import select
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+import pytest
+from llm_providers import (
+    GeminiProvider, HedgedProvider, LLMProvider, OllamaProvider, OpenAIProvider, build_provider,
+)
+
+TOKENS = ["Hello", " there", "!"]
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hi"}]
+
+OLLAMA = "/api/chat"
+OPENAI = "/v1/chat/completions"
+GEMINI = "/v1beta/models/fake:streamGenerateContent"
+
+
+class FakeLLM:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.delay = {}     # path -> seconds before the first token
+        self.fail = set()   # paths answering 500
+        self.requests = []  # (path, query, headers, payload)
+        self.hung_up = threading.Event()  # a client closed its connection before the first token
+
+    def count(self, path):
+        return sum(1 for r in self.requests if r[0] == path)
+
+
+def _chunks(path, tokens):
+    """Wire format of one streamed token per path."""
+    for text in tokens:
+        if path == OLLAMA:
+            yield json.dumps({"message": {"role": "assistant", "content": text}, "done": False}).encode() + b"\n"
+        elif path == OPENAI:
+            yield b"data: " + json.dumps({"choices": [{"delta": {"content": text}}]}).encode() + b"\n\n"
+        else:
+            yield b"data: " + json.dumps({"candidates": [{"content": {"parts": [{"text": text}]}}]}).encode() + b"\n\n"
+    if path == OLLAMA:
+        yield json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}).encode() + b"\n"
+    elif path == OPENAI:
+        yield b"data: [DONE]\n\n"
+
+
+@pytest.fixture(scope="module")
+def server():
+    fake = FakeLLM()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.0"
+
+        def do_POST(self):
+            url = urlparse(self.path)
+            payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            fake.requests.append((url.path, url.query, dict(self.headers), payload))
+            delay = fake.delay.get(url.path, 0)
+            if url.path in fake.fail:
+                time.sleep(delay)
+                self.send_response(500)
+                self.end_headers()
+                return
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.flush()
+            if select.select([self.connection], [], [], delay)[0] and not self.connection.recv(1):
+                fake.hung_up.set()
+                return
+            for chunk in _chunks(url.path, TOKENS):
+                self.wfile.write(chunk)
+                self.wfile.flush()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    fake.url = f"http://127.0.0.1:{httpd.server_port}"
+    yield fake
+    httpd.shutdown()
+
+
+@pytest.fixture
+def fake(server):
+    server.reset()
+    return server
+
+
+def ollama(fake):
+    return OllamaProvider(fake.url, "fake", "30m", timeout=(1, 5))
+
+
+def openai(fake):
+    return OpenAIProvider(fake.url + "/v1", "fake", "sk-test", timeout=(1, 5))
+
+
+def gemini(fake):
+    return GeminiProvider(fake.url, "fake", "g-test", timeout=(1, 5))
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        LLMProvider("fake")
+
+
+def test_unknown_provider_name():
+    with pytest.raises(ValueError):
+        build_provider("anthropic")
+
+
+def test_ollama_stream(fake):
+    assert list(ollama(fake).stream(MESSAGES)) == TOKENS
+    path, _, _, payload = fake.requests[0]
+    assert path == OLLAMA
+    assert payload["stream"] is True
+    assert payload["keep_alive"] == "30m"
+    assert payload["messages"] == MESSAGES
+
+
+def test_openai_stream(fake):
+    assert list(openai(fake).stream(MESSAGES)) == TOKENS
+    path, _, headers, payload = fake.requests[0]
+    assert path == OPENAI
+    assert headers["Authorization"] == "Bearer sk-test"
+    assert payload["stream"] is True
+
+
+def test_gemini_stream(fake):
+    assert list(gemini(fake).stream(MESSAGES)) == TOKENS
+    path, query, headers, payload = fake.requests[0]
+    assert path == GEMINI
+    assert query == "alt=sse"
+    assert headers["x-goog-api-key"] == "g-test"
+    assert payload["systemInstruction"] == {"parts": [{"text": "Be brief."}]}
+    assert payload["contents"] == [{"role": "user", "parts": [{"text": "Hi"}]}]
+
+
+def test_stream_raises_on_http_error(fake):
+    fake.fail.add(OLLAMA)
+    with pytest.raises(Exception):
+        list(ollama(fake).stream(MESSAGES))
+
+
+def test_hedge_keeps_a_fast_primary(fake):
+    provider = HedgedProvider(ollama(fake), openai(fake), hedge_after=1.0)
+    assert list(provider.stream(MESSAGES)) == TOKENS
+    assert fake.count(OLLAMA) == 1
+    assert fake.count(OPENAI) == 0
+
+
+def test_hedge_starts_fallback_when_primary_is_slow(fake):
+    fake.delay[OLLAMA] = 1.0
+    provider = HedgedProvider(ollama(fake), gemini(fake), hedge_after=0.05)
+    t0 = time.perf_counter()
+    assert list(provider.stream(MESSAGES)) == TOKENS
+    assert time.perf_counter() - t0 < 0.9
+    assert fake.count(GEMINI) == 1
+
+
+def test_hedge_falls_back_at_once_when_primary_fails(fake):
+    fake.fail.add(OPENAI)
+    provider = HedgedProvider(openai(fake), ollama(fake), hedge_after=5.0)
+    t0 = time.perf_counter()
+    assert list(provider.stream(MESSAGES)) == TOKENS
+    assert time.perf_counter() - t0 < 2.0
+    assert fake.count(OLLAMA) == 1
+
+
+def test_hedge_raises_when_both_fail(fake):
+    fake.fail.update({OLLAMA, GEMINI})
+    provider = HedgedProvider(ollama(fake), gemini(fake), hedge_after=0.05)
+    with pytest.raises(Exception):
+        list(provider.stream(MESSAGES))
+
+
+def test_hedge_closes_the_losing_response(fake):
+    fake.delay[OLLAMA] = 3.0
+    provider = HedgedProvider(ollama(fake), gemini(fake), hedge_after=0.05)
+    assert provider.timeout == (1, 5)
+    assert list(provider.stream(MESSAGES)) == TOKENS
+    # Long before the primary's first token would have come
+    assert fake.hung_up.wait(1.0)
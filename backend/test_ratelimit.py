@@ -0,0 +1,69 @@
+"""Token buckets: all-or-nothing spending across keys, and the login throttle.
+
+    cd backend && python -m pytest test_ratelimit.py
+"""
+import time
+import pytest
+from fastapi import HTTPException
+import ratelimit
+from config import settings
+from conftest import register
+from ratelimit import MemoryBuckets, SqliteBuckets
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def buckets(request, tmp_path):
+    if request.param == "memory":
+        return MemoryBuckets()
+    return SqliteBuckets(str(tmp_path / "buckets.db"))
+
+
+def test_take_until_empty(buckets):
+    results = [buckets.take(["a"], 3, 0.001) for _ in range(4)]
+    assert [r[0] for r in results] == [True, True, True, False]
+    assert [r[1] for r in results[:3]] == [2, 1, 0]
+    # One token back at 0.001 per second
+    assert results[3][2] == pytest.approx(1000, rel=0.01)
+
+
+def test_refused_take_spends_nothing(buckets):
+    assert buckets.take(["a"], 1, 0.001)[0]
+    # "a" is empty, so "b" must keep its token
+    assert not buckets.take(["b", "a"], 1, 0.001)[0]
+    assert buckets.take(["b"], 1, 0.001)[0]
+
+
+def test_refill(buckets):
+    assert buckets.take(["a"], 1, 100)[0]
+    time.sleep(0.02)
+    allowed, remaining, _ = buckets.take(["a"], 1, 100)
+    # Refilled, but never beyond capacity
+    assert allowed and remaining == 0
+
+
+def test_enforce_raises_429_with_headers(monkeypatch):
+    monkeypatch.setattr(ratelimit, "store", MemoryBuckets())
+    ratelimit.enforce("route", 1, "user:1")
+    with pytest.raises(HTTPException) as e:
+        ratelimit.enforce("route", 1, "user:1", "ip:1.2.3.4")
+    assert e.value.status_code == 429
+    assert e.value.headers["RateLimit-Limit"] == "1"
+    assert int(e.value.headers["Retry-After"]) >= 1
+    # The IP bucket was not charged for the refused request
+    ratelimit.enforce("route", 1, "ip:1.2.3.4")
+    # Zero or less turns the limit off
+    ratelimit.enforce("route", 0, "user:1")
+
+
+def test_login_throttle_is_per_account_and_client(client, monkeypatch):
+    monkeypatch.setattr(ratelimit, "store", MemoryBuckets())
+    monkeypatch.setattr(settings, "RATE_LIMIT_LOGIN_PER_MINUTE", 3)
+    user = register(client)
+    name = user["full_name"].lower()
+
+    for _ in range(2):
+        assert client.post("/auth/login", json={"username": "nobody", "password": "x"}).status_code == 401
+    # A failed attempt on another account leaves this one a token from the shared IP bucket
+    assert client.post("/auth/login", json={"username": name, "password": "pw123456"}).status_code == 200
+    r = client.post("/auth/login", json={"username": name, "password": "pw123456"})
+    assert r.status_code == 429 and "Retry-After" in r.headers
@@ -0,0 +1,175 @@
+"""Sharing one upstream stream between identical chats, and LLM admission control.
+
+    cd backend && python -m pytest test_singleflight.py
+"""
+import threading
+import time
+import pytest
+from conftest import auth, register
+from llm_queue import AdmissionController, QueueFull, QueueTimeout, PRIORITY_PATIENT, PRIORITY_STAFF
+from singleflight import SingleFlight
+
+
+class Upstream:
+    """A token generator that hands out one token each time ``step`` is released."""
+
+    def __init__(self, tokens, fail=None):
+        self.tokens = tokens
+        self.fail = fail
+        self.step = threading.Semaphore(0)
+        self.closed = threading.Event()
+        self.calls = 0
+
+    def factory(self):
+        self.calls += 1
+        return self._gen()
+
+    def _gen(self):
+        try:
+            for token in self.tokens:
+                self.step.acquire()
+                yield token
+            if self.fail:
+                raise self.fail
+        finally:
+            self.closed.set()
+
+    def release_all(self):
+        for _ in self.tokens:
+            self.step.release()
+
+
+def _collect(gen, out):
+    try:
+        out.extend(gen)
+    except Exception as e:
+        out.append(e)
+
+
+def test_identical_requests_share_one_upstream():
+    flights, up = SingleFlight(), Upstream(["a", "b", "c"])
+    first, second = flights.open("k", up.factory), flights.open("k", up.factory)
+    results = [[], []]
+    threads = [threading.Thread(target=_collect, args=(g, r)) for g, r in zip((first, second), results)]
+    for t in threads:
+        t.start()
+    up.release_all()
+    for t in threads:
+        t.join(2)
+    assert results == [["a", "b", "c"], ["a", "b", "c"]]
+    assert up.calls == 1
+    assert flights.in_flight() == 0
+
+
+def test_late_joiner_gets_earlier_chunks_replayed():
+    flights, up = SingleFlight(), Upstream(["a", "b", "c"])
+    first = flights.open("k", up.factory)
+    up.step.release()
+    assert next(first) == "a"
+    late = flights.open("k", up.factory)
+    up.step.release()
+    up.step.release()
+    assert list(first) == ["b", "c"]
+    assert list(late) == ["a", "b", "c"]
+    assert up.calls == 1
+
+
+def test_upstream_error_reaches_every_reader():
+    flights, up = SingleFlight(), Upstream(["a"], fail=RuntimeError("boom"))
+    readers = [flights.open("k", up.factory) for _ in range(2)]
+    up.release_all()
+    for reader in readers:
+        assert next(reader) == "a"
+        with pytest.raises(RuntimeError):
+            next(reader)
+
+
+def test_different_keys_do_not_share():
+    flights, up = SingleFlight(), Upstream(["a"])
+    flights.open("k1", up.factory)
+    flights.open("k2", up.factory)
+    assert up.calls == 2
+
+
+def test_last_reader_leaving_aborts_the_upstream():
+    flights, up = SingleFlight(), Upstream(["a", "b"])
+    aborted = threading.Event()
+    cancelled = threading.Event()
+    reader = flights.open("k", up.factory, cancelled=cancelled, abort=aborted.set)
+    out = []
+    t = threading.Thread(target=_collect, args=(reader, out))
+    t.start()
+    # The reader is waiting for a token that never comes; cancelling ends it anyway
+    cancelled.set()
+    t.join(1)
+    assert not t.is_alive() and out == []
+    assert aborted.is_set()
+
+    # The next identical request starts a fresh flight instead of joining the dying one
+    flights.open("k", up.factory)
+    assert up.calls == 2
+    up.release_all()
+    up.release_all()
+
+
+def test_admission_queues_then_rejects():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, timeout=2)
+    running = admission.acquire()
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(admission.acquire()))
+    waiter.start()
+    while admission.metrics()["queue_depth"] < 1:
+        time.sleep(0.01)
+
+    with pytest.raises(QueueFull):
+        admission.acquire()
+    running.release()
+    waiter.join(1)
+    assert len(admitted) == 1
+    admitted[0].release()
+    assert admission.metrics()["rejected"] == 1 and admission.metrics()["active"] == 0
+
+
+def test_admission_times_out():
+    admission = AdmissionController(max_concurrency=1, max_queue=1, timeout=0.05)
+    with admission.acquire():
+        with pytest.raises(QueueTimeout):
+            admission.acquire()
+    assert admission.metrics()["timed_out"] == 1
+    admission.acquire().release()
+
+
+def test_patients_are_admitted_before_staff():
+    admission = AdmissionController(max_concurrency=1, max_queue=5, timeout=2)
+    running = admission.acquire()
+    order = []
+
+    def wait(priority, name):
+        with admission.acquire(priority):
+            order.append(name)
+
+    staff = threading.Thread(target=wait, args=(PRIORITY_STAFF, "staff"))
+    staff.start()
+    while admission.metrics()["queue_depth"] < 1:
+        time.sleep(0.01)
+    patient = threading.Thread(target=wait, args=(PRIORITY_PATIENT, "patient"))
+    patient.start()
+    while admission.metrics()["queue_depth"] < 2:
+        time.sleep(0.01)
+    running.release()
+    staff.join(1)
+    patient.join(1)
+    assert order == ["patient", "staff"]
+
+
+def test_full_queue_answers_503(client, monkeypatch):
+    import main
+
+    def full(priority):
+        raise QueueFull()
+
+    monkeypatch.setattr(main.llm_admission, "acquire", full)
+    user = register(client)
+    r = client.post("/chat", json={"message": "Hi"}, headers=auth(user["access_token"]))
+    assert r.status_code == 503
+    assert int(r.headers["Retry-After"]) >= 1
@@ -0,0 +1,114 @@
+"""Framing of the chat Server-Sent Events stream.
+
+    cd backend && python -m pytest test_sse.py
+"""
+import asyncio
+import json
+import threading
+import time
+from sse import BOOK_NOW_TAG, TagFilter, chat_events, sse_event
+
+
+class FakeRequest:
+    def __init__(self, disconnect_after: float = None):
+        self.started = time.monotonic()
+        self.disconnect_after = disconnect_after
+
+    async def is_disconnected(self):
+        return self.disconnect_after is not None and time.monotonic() - self.started > self.disconnect_after
+
+
+def _parse(raw: str):
+    """``[(event, data), ...]`` from the wire format."""
+    events = []
+    for block in raw.split("\n\n"):
+        if block:
+            lines = dict(line.split(": ", 1) for line in block.split("\n"))
+            events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def _run(stream, request=None, **kwargs):
+    async def collect():
+        return "".join([e async for e in chat_events(request or FakeRequest(), stream, **kwargs)])
+
+    raw = asyncio.run(collect())
+    assert raw.endswith("\n\n")
+    return _parse(raw)
+
+
+def _tokens(chunks, delay=0.0, fail=None):
+    for chunk in chunks:
+        time.sleep(delay)
+        yield chunk
+    if fail:
+        raise fail
+
+
+def test_sse_event_format():
+    assert sse_event("token", {"text": "hi"}) == 'event: token\ndata: {"text": "hi"}\n\n'
+    # Newlines in the text stay inside the JSON string, so they can't break the frame
+    assert sse_event("token", {"text": "a\n\nb"}).count("\n\n") == 1
+
+
+def test_fast_tokens_are_batched_into_one_event():
+    events = _run(_tokens(["Hel", "lo", " there"]), window=1.0)
+    kinds = [k for k, _ in events]
+    assert kinds == ["token", "usage", "done"]
+    assert events[0][1]["text"] == "Hello there"
+    assert events[1][1] == {"chunks": 3, "chars": 11, "events": 1}
+    assert events[2][1]["book_now"] is False
+
+
+def test_slow_tokens_each_get_an_event():
+    events = _run(_tokens(["a", "b", "c"], delay=0.05), window=0.01)
+    assert [d["text"] for k, d in events if k == "token"] == ["a", "b", "c"]
+    assert events[-2] == ("usage", {"chunks": 3, "chars": 3, "events": 3})
+
+
+def test_max_chars_flushes_early():
+    events = _run(_tokens(["abcd"] * 4), window=5.0, max_chars=8)
+    assert [d["text"] for k, d in events if k == "token"] == ["abcdabcd", "abcdabcd"]
+
+
+def test_book_now_tag_split_across_chunks_is_removed():
+    half = len(BOOK_NOW_TAG) // 2
+    events = _run(_tokens(["Please ", BOOK_NOW_TAG[:half], BOOK_NOW_TAG[half:], " now"], delay=0.02), window=0.001)
+    text = "".join(d["text"] for k, d in events if k == "token")
+    assert text == "Please  now"
+    assert events[-1][0] == "done" and events[-1][1]["book_now"] is True
+
+
+def test_tag_filter_releases_a_partial_match_at_the_end():
+    tags = TagFilter()
+    assert tags.feed("ok [BOOK") == "ok "
+    assert tags.flush() == "[BOOK"
+    assert not tags.found
+
+
+def test_upstream_error_becomes_an_error_event():
+    events = _run(_tokens(["partial"], fail=RuntimeError("http://secret-host failed")), window=1.0)
+    kinds = [k for k, _ in events]
+    assert kinds == ["token", "error"]
+    # Provider details stay in the logs
+    assert "secret-host" not in events[1][1]["message"]
+
+
+def test_disconnect_ends_the_stream_and_sets_abort():
+    abort = threading.Event()
+    closed = threading.Event()
+
+    def endless():
+        try:
+            while not abort.is_set():
+                time.sleep(0.01)
+                yield "x"
+        finally:
+            closed.set()
+
+    started = time.monotonic()
+    events = _run(endless(), request=FakeRequest(disconnect_after=0.2), window=0.05, abort=abort)
+    assert time.monotonic() - started < 2
+    assert abort.is_set()
+    assert closed.wait(1)
+    assert events and all(k == "token" for k, _ in events)
@@ -0,0 +1,254 @@
+"""Lightweight request tracing.
+
+A sampled request gets a trace keyed by its request id, generated here and
+returned in the ``X-Request-ID`` response header (a client-sent one is only
+recorded as an attribute). Code wraps work in
+``with span("name", key=value):``, and each finished span is exported right
+away. So spans from background tasks that finish after the response (emails)
+still land in their request's trace.
+
+Unsampled requests only pay for one contextvar lookup per span. Finished
+spans are kept in memory for GET /admin/traces and, when TRACE_FILE is set,
+appended to that file as JSON lines; it is rotated to ``TRACE_FILE.1`` once
+it reaches TRACE_FILE_MAX_BYTES.
+"""
+import contextvars
+import itertools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Optional
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+REQUEST_ID_HEADER = "X-Request-ID"
+FORCE_HEADER = "X-Trace"  # "1" from an admin traces the request regardless of the sample rate
+
+_trace_id = contextvars.ContextVar("trace_id", default=None)
+_parent_id = contextvars.ContextVar("span_parent_id", default=None)
+_span_ids = itertools.count(1)
+
+
+class SpanExporter:
+    """Keeps the spans of the last ``max_traces`` traces, optionally mirroring them to a file."""
+
+    def __init__(self, max_traces: int, path: str = "", max_bytes: int = 0):
+        self.max_traces = max_traces
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._traces = OrderedDict()  # trace_id -> [span dict]
+        self._file_lock = threading.Lock()
+        self._file = None
+
+    def export(self, span: dict):
+        with self._lock:
+            spans = self._traces.get(span["trace_id"])
+            if spans is None:
+                spans = self._traces[span["trace_id"]] = []
+                while len(self._traces) > self.max_traces:
+                    self._traces.popitem(last=False)
+            spans.append(span)
+        if self.path:
+            self._write(json.dumps(span, default=str) + "\n")
+
+    def _write(self, line: str):
+        with self._file_lock:
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a")
+                self._file.write(line)
+                self._file.flush()
+                if self.max_bytes and self._file.tell() >= self.max_bytes:
+                    self._rotate()
+            except OSError as e:
+                logger.error(f"Could not write trace file {self.path}: {e}")
+
+    def _rotate(self):
+        ours = os.fstat(self._file.fileno()).st_ino
+        self._file.close()
+        self._file = None
+        try:
+            current = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            return
+        # Another worker sharing the file may have rotated it already
+        if current == ours:
+            os.replace(self.path, self.path + ".1")
+
+    def get(self, trace_id: str):
+        with self._lock:
+            spans = list(self._traces.get(trace_id, []))
+        if not spans and self.path:
+            # Another worker may have handled the request
+            for path in (self.path + ".1", self.path):
+                try:
+                    with open(path) as f:
+                        spans += [s for s in map(json.loads, f) if s["trace_id"] == trace_id]
+                except (OSError, ValueError):
+                    pass
+        return sorted(spans, key=lambda s: s["start"])
+
+    def recent(self, limit: int = 50):
+        """Root span of the newest traces in this worker."""
+        with self._lock:
+            traces = list(self._traces.items())[-limit:]
+        result = []
+        for trace_id, spans in reversed(traces):
+            root = next((s for s in spans if s["parent_id"] is None), spans[0])
+            result.append({"trace_id": trace_id, "name": root["name"], "start": root["start"],
+                           "duration_ms": root["duration_ms"], "spans": len(spans)})
+        return result
+
+
+exporter = SpanExporter(settings.TRACE_MAX_TRACES, settings.TRACE_FILE, settings.TRACE_FILE_MAX_BYTES)
+
+
+def current_trace_id() -> Optional[str]:
+    return _trace_id.get()
+
+
+@contextmanager
+def span(name: str, **attrs):
+    """Time a block as a child of the current span. Yields the attrs dict (or None when not tracing)."""
+    trace_id = _trace_id.get()
+    if trace_id is None:
+        yield None
+        return
+    span_id = next(_span_ids)
+    token = _parent_id.set(span_id)
+    start = time.time()
+    t0 = time.perf_counter()
+    try:
+        yield attrs
+    except Exception as e:
+        attrs["error"] = repr(e)
+        raise
+    finally:
+        _parent_id.reset(token)
+        finish(trace_id, span_id, token.old_value, name, start, t0, attrs)
+
+
+def start(name: str, **attrs):
+    """Open a span that is ended later with :func:`end` (for callbacks that can't use ``with``)."""
+    trace_id = _trace_id.get()
+    if trace_id is None:
+        return None
+    return (trace_id, next(_span_ids), _parent_id.get(), name, time.time(), time.perf_counter(), attrs)
+
+
+def end(handle, **attrs):
+    if handle is not None:
+        trace_id, span_id, parent_id, name, start_, t0, base = handle
+        finish(trace_id, span_id, parent_id, name, start_, t0, {**base, **attrs})
+
+
+def finish(trace_id, span_id, parent_id, name, start_, t0, attrs):
+    exporter.export({
+        "trace_id": trace_id,
+        "span_id": span_id,
+        "parent_id": parent_id if parent_id is not contextvars.Token.MISSING else None,
+        "name": name,
+        "start": start_,
+        "duration_ms": round((time.perf_counter() - t0) * 1000, 3),
+        "attrs": attrs,
+    })
+
+
+def traced_stream(name: str, stream, **attrs):
+    """Wrap a token generator in a span recording time to first token and total time."""
+    trace_id = _trace_id.get()
+    if trace_id is None:
+        yield from stream
+        return
+    handle = start(name, **attrs)
+    chunks = 0
+    try:
+        for chunk in stream:
+            if chunks == 0:
+                attrs["ttft_ms"] = round((time.perf_counter() - handle[5]) * 1000, 3)
+            chunks += 1
+            yield chunk
+    except Exception as e:
+        attrs["error"] = repr(e)
+        raise
+    finally:
+        end(handle, chunks=chunks, **attrs)
+
+
+async def _sampled(request: Request) -> bool:
+    if request.headers.get(FORCE_HEADER) == "1":
+        from auth import is_admin_request  # auth imports this module
+        if await run_in_threadpool(is_admin_request, request):
+            return True
+    rate = settings.TRACE_SAMPLE_RATE
+    return rate > 0 and random.random() < rate
+
+
+async def tracing_middleware(request: Request, call_next):
+    # Always our own id: a client-chosen one could collide with or pollute other traces
+    request_id = uuid.uuid4().hex
+    if not await _sampled(request):
+        response = await call_next(request)
+        response.headers[REQUEST_ID_HEADER] = request_id
+        return response
+
+    trace_token = _trace_id.set(request_id)
+    attrs = {"method": request.method, "path": request.url.path}
+    if request.headers.get(REQUEST_ID_HEADER):
+        attrs["client_request_id"] = request.headers[REQUEST_ID_HEADER][:64]
+    root = start(f"{request.method} {request.url.path}", **attrs)
+    parent_token = _parent_id.set(root[1])
+    try:
+        response = await call_next(request)
+    except Exception as e:
+        end(root, error=repr(e))
+        raise
+    finally:
+        _parent_id.reset(parent_token)
+        _trace_id.reset(trace_token)
+    response.headers[REQUEST_ID_HEADER] = request_id
+
+    # End the root span once the body is sent, so streamed responses are timed in full
+    body = response.body_iterator
+
+    async def traced_body():
+        try:
+            async for chunk in body:
+                yield chunk
+        finally:
+            end(root, status=response.status_code)
+
+    response.body_iterator = traced_body()
+    return response
+
+
+def instrument_engine(engine):
+    """Record a span for every SQL statement executed on ``engine``."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        handle = start("db.execute", statement=statement[:300])
+        if handle is not None:
+            conn.info.setdefault("trace_spans", []).append(handle)
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        if _trace_id.get() is not None and conn.info.get("trace_spans"):
+            end(conn.info["trace_spans"].pop(), rows=cursor.rowcount)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(ctx):
+        spans = ctx.connection.info.get("trace_spans") if ctx.connection is not None else None
+        if spans:
+            end(spans.pop(), error=repr(ctx.original_exception))
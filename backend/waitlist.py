@@ -0,0 +1,83 @@
+import itertools
+from datetime import datetime
+from sqlalchemy.orm import Session
+import models
+import analytics
+import schedules
+from config import settings
+
+
+def match_freed_slot(db: Session, slot: models.Slot, exclude_patient_id=None):
+    """Hand a slot freed by a cancellation to the waitlist, inside the caller's transaction.
+
+    Entries are served oldest first. If the head of the queue asked for
+    auto-booking the slot is booked for that patient; otherwise the run of
+    notify-only entries at the head (up to WAITLIST_OFFER_BATCH) is offered the
+    slot and the first one to book it wins. Returns ``(appointment, offers)``.
+    """
+    if slot.slot_date < datetime.now().strftime("%Y-%m-%d") or schedules.is_blocked(db, slot):
+        return None, []
+    e = models.WaitlistEntry
+    q = db.query(e).filter(
+        e.doctor_id == slot.doctor_id,
+        e.status == models.WaitlistStatus.waiting,
+        e.date_from <= slot.slot_date,
+        e.date_to >= slot.slot_date,
+    )
+    if exclude_patient_id is not None:
+        q = q.filter(e.patient_id != exclude_patient_id)
+    entries = q.order_by(e.created_at, e.id).limit(settings.WAITLIST_OFFER_BATCH).with_for_update().all()
+    if not entries:
+        return None, []
+
+    head = entries[0]
+    if head.auto_book:
+        appointment = models.Appointment(slot_id=slot.id, patient_id=head.patient_id, reason="Booked from waitlist")
+        db.add(appointment)
+        db.flush()
+        slot.is_booked = True
+        head.status = models.WaitlistStatus.fulfilled
+        head.appointment_id = appointment.id
+        analytics.record(db, slot, booked=1)
+        return appointment, []
+
+    offers = list(itertools.takewhile(lambda entry: not entry.auto_book, entries))
+    now = datetime.utcnow()
+    for entry in offers:
+        entry.last_offered_at = now
+    return None, offers
+
+
+def fulfil(db: Session, patient_id: int, slot: models.Slot, appointment_id: int):
+    """Close the patient's waiting entries that this booking satisfies."""
+    e = models.WaitlistEntry
+    db.query(e).filter(
+        e.patient_id == patient_id,
+        e.doctor_id == slot.doctor_id,
+        e.status == models.WaitlistStatus.waiting,
+        e.date_from <= slot.slot_date,
+        e.date_to >= slot.slot_date,
+    ).update({e.status: models.WaitlistStatus.fulfilled, e.appointment_id: appointment_id}, synchronize_session=False)
+
+
+def notices(db: Session, slot: models.Slot, appointment, offers):
+    """Email parameters for everyone the freed slot went to, for ``send_waitlist_emails``."""
+    patient_ids = [appointment.patient_id] if appointment else [entry.patient_id for entry in offers]
+    if not patient_ids:
+        return []
+    patients = {u.id: u for u in db.query(models.User).filter(models.User.id.in_(patient_ids))}
+    doctor_name = db.query(models.User.full_name).join(
+        models.Doctor, models.Doctor.user_id == models.User.id
+    ).filter(models.Doctor.id == slot.doctor_id).scalar()
+    return [
+        {
+            "to_email": patients[pid].email,
+            "patient_name": patients[pid].full_name,
+            "doctor_name": doctor_name or "",
+            "slot_date": slot.slot_date,
+            "start_time": slot.start_time,
+            "end_time": slot.end_time,
+            "assigned": appointment is not None,
+        }
+        for pid in patient_ids if pid in patients
+    ]
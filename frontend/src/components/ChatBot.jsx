@@ -47,7 +47,7 @@ export default function ChatBot() {
 
     try {
       const token = JSON.parse(localStorage.getItem('doctorbook_user') || '{}').access_token
-      const response = await fetch('/api/chat/stream', {
+      const response = await fetch('/api/chat/sse', {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -55,23 +55,39 @@ export default function ChatBot() {
         },
         body: JSON.stringify({ message: userMsg })
       })
+      if (!response.ok) throw new Error(`Chat failed: ${response.status}`)
 
       const reader = response.body.getReader()
       const decoder = new TextDecoder()
       let botText = ''
+      let bookNow = false
+      let buffer = ''
 
-      while (true) {
-        const { done, value } = await reader.read()
-        if (done) break
-        const chunk = decoder.decode(value, { stream: true })
-        botText += chunk
-        
+      const updateBotMessage = () => {
         setMessages(prev => {
           const newMsgs = [...prev]
-          newMsgs[newMsgs.length - 1].text = botText
+          newMsgs[newMsgs.length - 1] = { role: 'bot', text: botText, bookNow }
           return newMsgs
         })
       }
+
+      while (true) {
+        const { done, value } = await reader.read()
+        if (done) break
+        buffer += decoder.decode(value, { stream: true })
+
+        // Events are separated by a blank line: "event: <type>\ndata: <json>"
+        const events = buffer.split('\n\n')
+        buffer = events.pop()
+        for (const raw of events) {
+          const type = raw.match(/^event: (.*)$/m)?.[1]
+          const data = JSON.parse(raw.match(/^data: (.*)$/m)?.[1] || '{}')
+          if (type === 'token') botText += data.text
+          else if (type === 'done') bookNow = data.book_now
+          else if (type === 'error') throw new Error(data.message)
+        }
+        updateBotMessage()
+      }
     } catch (err) {
       setMessages(prev => {
         const newMsgs = [...prev]
@@ -121,7 +137,7 @@ export default function ChatBot() {
           {/* Messages */}
           <div style={{ flex: 1, overflowY: 'auto', padding: 16, display: 'flex', flexDirection: 'column', gap: 12, backgroundColor: '#f9fafb' }}>
             {messages.map((msg, idx) => {
-              const hasButton = msg.text.includes('[BOOK_NOW]')
+              const hasButton = msg.bookNow || msg.text.includes('[BOOK_NOW]')
               const displayText = msg.text.replace('[BOOK_NOW]', '')
               // Only show the booking button to patients (or guests who need to login)
               const showButton = hasButton && (!user || user.role === 'patient')
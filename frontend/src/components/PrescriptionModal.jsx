@@ -22,7 +22,7 @@ export default function PrescriptionModal({ appointment, onClose, onSubmit }) {
       <div style={{ backgroundColor: 'white', padding: 24, borderRadius: 8, width: '100%', maxWidth: 500, boxShadow: '0 4px 6px rgba(0,0,0,0.1)' }}>
         <h3 style={{ marginTop: 0, marginBottom: 16, color: 'var(--navy)' }}>Complete Visit</h3>
         <p style={{ color: '#666', fontSize: 14, marginBottom: 20 }}>
-          Patient: <strong>{appointment.patient?.full_name}</strong>
+          Patient: <strong>{appointment.patient_name}</strong>
         </p>
         
         <form onSubmit={handleSubmit} style={{ display: 'flex', flexDirection: 'column', gap: 16 }}>
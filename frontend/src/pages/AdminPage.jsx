@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import { doctorAPI, specAPI, userAPI, appointmentAPI } from '../services/api'
+import { doctorAPI, specAPI, userAPI, appointmentAPI, analyticsAPI } from '../services/api'
 import toast from 'react-hot-toast'
 
 function AddSpecModal({ onClose }) {
@@ -133,19 +133,22 @@ export default function AdminPage() {
   const [specs, setSpecs] = useState([])
   const [users, setUsers] = useState([])
   const [appointments, setAppointments] = useState([])
+  const [stats, setStats] = useState([])
   const [loading, setLoading] = useState(true)
   const [modal, setModal] = useState(null)
 
   const load = async () => {
     setLoading(true)
     try {
-      const [d, s, u, a] = await Promise.all([
+      const [d, s, u, a, st] = await Promise.all([
         doctorAPI.list(), specAPI.list(), userAPI.list(), appointmentAPI.all(),
+        analyticsAPI.summary({ group_by: 'specialization' }),
       ])
       setDoctors(d.data)
       setSpecs(s.data)
       setUsers(u.data)
       setAppointments(a.data)
+      setStats(st.data.rows)
     } catch { toast.error('Load error') }
     finally { setLoading(false) }
   }
@@ -164,7 +167,10 @@ export default function AdminPage() {
   if (loading) return <div className="main-content"><div className="loading-center"><div className="spinner"></div></div></div>
 
   const bookedCount = appointments.filter(a => a.status === 'booked').length
-  const cancelledCount = appointments.filter(a => a.status === 'cancelled').length
+  // Last 30 days, from the server-side daily rollups
+  const bookings30d = stats.reduce((n, r) => n + r.booked, 0)
+  const cancelled30d = stats.reduce((n, r) => n + r.cancelled, 0)
+  const cancellationRate = bookings30d ? Math.round((cancelled30d / bookings30d) * 100) : 0
 
   return (
     <div className="main-content">
@@ -190,6 +196,10 @@ export default function AdminPage() {
           <div className="stat-value" style={{ color: 'var(--teal)' }}>{bookedCount}</div>
           <div className="stat-label">Active Bookings</div>
         </div>
+        <div className="stat-card">
+          <div className="stat-value">{cancellationRate}%</div>
+          <div className="stat-label">Cancellation Rate (30d)</div>
+        </div>
       </div>
 
       <div className="tabs">
@@ -270,8 +280,8 @@ export default function AdminPage() {
               <div key={a.id} className="card">
                 <div className="card-body" style={{ padding: '14px 18px', display: 'flex', justifyContent: 'space-between', alignItems: 'center', gap: 12 }}>
                   <div>
-                    <div style={{ fontWeight: 600, color: 'var(--navy)' }}>{a.patient?.full_name} → Dr. {a.slot?.doctor?.user?.full_name}</div>
-                    <div style={{ fontSize: 13, color: 'var(--gray-400)' }}>{a.slot?.slot_date} at {a.slot?.start_time}</div>
+                    <div style={{ fontWeight: 600, color: 'var(--navy)' }}>{a.patient_name} → Dr. {a.doctor_name}</div>
+                    <div style={{ fontSize: 13, color: 'var(--gray-400)' }}>{a.slot_date} at {a.start_time}</div>
                     {a.reason && <div style={{ fontSize: 13, color: 'var(--gray-400)', fontStyle: 'italic' }}>{a.reason}</div>}
                   </div>
                   <span className={`appt-status status-${a.status}`}>{a.status}</span>
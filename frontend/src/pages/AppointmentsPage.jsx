@@ -48,11 +48,42 @@ export default function MyAppointmentsPage() {
     }
   }
 
+  const copyCalendarFeed = async () => {
+    try {
+      const { data } = await appointmentAPI.calendarFeed()
+      await navigator.clipboard.writeText(data.url)
+      toast.success('Calendar feed link copied, add it to your calendar app')
+    } catch (err) {
+      toast.error('Failed to get calendar link')
+    }
+  }
+
+  const resetCalendarFeed = async () => {
+    if (!window.confirm('Calendar apps using the old link will stop updating. Continue?')) return
+    try {
+      const { data } = await appointmentAPI.resetCalendarFeed()
+      await navigator.clipboard.writeText(data.url)
+      toast.success('Old calendar link revoked, new link copied')
+    } catch (err) {
+      toast.error('Failed to reset calendar link')
+    }
+  }
+
   if (loading) return <div className="main-content"><div className="loading-center"><div className="spinner"></div></div></div>
 
   return (
     <div className="main-content">
-      <h1 className="page-title">My Appointments</h1>
+      <div style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center' }}>
+        <h1 className="page-title">My Appointments</h1>
+        <div style={{ display: 'flex', gap: 8 }}>
+          <button className="btn" onClick={copyCalendarFeed} style={{ fontSize: 13, padding: '8px 16px' }}>
+            Copy calendar link
+          </button>
+          <button className="btn" onClick={resetCalendarFeed} style={{ fontSize: 13, padding: '8px 16px' }}>
+            Reset link
+          </button>
+        </div>
+      </div>
       
       <div style={{ display: 'flex', flexDirection: 'column', gap: 16 }}>
         {appointments.length === 0 ? (
@@ -65,13 +96,13 @@ export default function MyAppointmentsPage() {
               <div className="card-body" style={{ display: 'flex', justifyContent: 'space-between', alignItems: 'center', flexWrap: 'wrap', gap: 16 }}>
                 <div>
                   <div style={{ fontWeight: 600, fontSize: 16, marginBottom: 4, color: 'var(--navy)' }}>
-                    {new Date(appt.slot.slot_date).toLocaleDateString('en-US', { weekday: 'short', month: 'short', day: 'numeric' })} at {appt.slot.start_time}
+                    {new Date(appt.slot_date).toLocaleDateString('en-US', { weekday: 'short', month: 'short', day: 'numeric' })} at {appt.start_time}
                   </div>
                   <div style={{ color: '#666', fontSize: 14 }}>
                     {user.role === 'doctor' ? (
-                      <>Patient: <strong>{appt.patient?.full_name}</strong></>
+                      <>Patient: <strong>{appt.patient_name}</strong></>
                     ) : (
-                      <>Doctor: <strong>Dr. {appt.slot.doctor?.user?.full_name}</strong></>
+                      <>Doctor: <strong>Dr. {appt.doctor_name}</strong></>
                     )}
                   </div>
                   <div style={{ fontSize: 14, marginTop: 4, color: '#555' }}>Reason: {appt.reason}</div>
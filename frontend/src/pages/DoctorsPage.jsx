@@ -1,7 +1,10 @@
-import { useState, useEffect } from 'react'
-import { doctorAPI, specAPI, slotAPI, appointmentAPI } from '../services/api'
+import { useState, useEffect, useRef } from 'react'
+import { doctorAPI, specAPI, slotAPI, appointmentAPI, waitlistAPI } from '../services/api'
 import toast from 'react-hot-toast'
 
+// Open slots generated from a schedule rule have no id until booked
+const slotKey = (slot) => `${slot.slot_date} ${slot.start_time}`
+
 function groupSlotsByDate(slots) {
   return slots.reduce((acc, slot) => {
     if (!acc[slot.slot_date]) acc[slot.slot_date] = []
@@ -16,11 +19,34 @@ function BookingModal({ doctor, onClose }) {
   const [selectedSlot, setSelectedSlot] = useState(null)
   const [reason, setReason] = useState('')
   const [booking, setBooking] = useState(false)
+  // Clicking Book again after a failure retries the same booking
+  const bookKey = useRef(null)
+
+  useEffect(() => { bookKey.current = null }, [selectedSlot, reason])
+
+  const loadSlots = () => slotAPI.list(doctor.id, {}).then(({ data }) => {
+    setSlots(data)
+  }).catch(() => toast.error('Could not load slots')).finally(() => setLoadingSlots(false))
 
   useEffect(() => {
-    slotAPI.list(doctor.id, {}).then(({ data }) => {
-      setSlots(data)
-    }).catch(() => toast.error('Could not load slots')).finally(() => setLoadingSlots(false))
+    loadSlots()
+
+    // Live slot updates instead of re-fetching
+    const source = slotAPI.events(doctor.id)
+    source.addEventListener('slot', (e) => {
+      const { action, slot } = JSON.parse(e.data)
+      setSlots(prev => {
+        const rest = prev.filter(s => slotKey(s) !== slotKey(slot))
+        if (action === 'deleted') return rest
+        return [...rest, slot].sort((a, b) =>
+          (a.slot_date + a.start_time).localeCompare(b.slot_date + b.start_time))
+      })
+      if (action !== 'freed') {
+        setSelectedSlot(sel => (sel && slotKey(sel) === slotKey(slot) ? null : sel))
+      }
+    })
+    source.addEventListener('refresh', () => loadSlots())
+    return () => source.close()
   }, [doctor.id])
 
   const grouped = groupSlotsByDate(slots)
@@ -28,8 +54,12 @@ function BookingModal({ doctor, onClose }) {
   const handleBook = async () => {
     if (!selectedSlot) return toast.error('Select a time slot first')
     setBooking(true)
+    bookKey.current ??= crypto.randomUUID()
     try {
-      await appointmentAPI.book({ slot_id: selectedSlot.id, reason })
+      await appointmentAPI.book(selectedSlot.id
+        ? { slot_id: selectedSlot.id, reason }
+        : { doctor_id: doctor.id, slot_date: selectedSlot.slot_date, start_time: selectedSlot.start_time, reason },
+        bookKey.current)
       toast.success('🎉 Appointment booked! Check your email.')
       onClose(true)
     } catch (err) {
@@ -39,6 +69,22 @@ function BookingModal({ doctor, onClose }) {
     }
   }
 
+  // Book automatically when a slot in the next two weeks is cancelled
+  const handleWaitlist = async () => {
+    const today = new Date()
+    const until = new Date(today.getTime() + 14 * 24 * 60 * 60 * 1000)
+    try {
+      await waitlistAPI.join({
+        doctor_id: doctor.id,
+        date_from: today.toISOString().slice(0, 10),
+        date_to: until.toISOString().slice(0, 10),
+      })
+      toast.success("You're on the waitlist. We'll book the first free slot for you.")
+    } catch (err) {
+      toast.error(err.response?.data?.detail || 'Could not join the waitlist')
+    }
+  }
+
   const formatDate = (d) => {
     const dt = new Date(d)
     return dt.toLocaleDateString('en-US', { weekday: 'long', month: 'long', day: 'numeric' })
@@ -63,6 +109,9 @@ function BookingModal({ doctor, onClose }) {
             <div className="empty-state">
               <div className="empty-state-icon">📅</div>
               <div className="empty-state-text">No available slots at the moment</div>
+              <button className="btn" style={{ marginTop: 12 }} onClick={handleWaitlist}>
+                Join waitlist
+              </button>
             </div>
           ) : (
             <div className="slots-container">
@@ -72,8 +121,8 @@ function BookingModal({ doctor, onClose }) {
                   <div className="slots-grid">
                     {dateSlots.map((slot) => (
                       <button
-                        key={slot.id}
-                        className={`slot-pill ${slot.is_booked ? 'booked' : ''} ${selectedSlot?.id === slot.id ? 'selected' : ''}`}
+                        key={slotKey(slot)}
+                        className={`slot-pill ${slot.is_booked ? 'booked' : ''} ${selectedSlot && slotKey(selectedSlot) === slotKey(slot) ? 'selected' : ''}`}
                         onClick={() => !slot.is_booked && setSelectedSlot(slot)}
                         disabled={slot.is_booked}
                       >
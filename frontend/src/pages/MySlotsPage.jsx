@@ -1,5 +1,5 @@
 import { useState, useEffect } from 'react'
-import { slotAPI, doctorAPI } from '../services/api'
+import { slotAPI, doctorAPI, scheduleAPI } from '../services/api'
 import { useAuth } from '../context/AuthContext'
 import toast from 'react-hot-toast'
 
@@ -43,6 +43,7 @@ export default function MySlotsPage() {
   })
   const [adding, setAdding] = useState(false)
   const [showForm, setShowForm] = useState(false)
+  const [notifyMode, setNotifyMode] = useState('immediate')
 
   useEffect(() => {
     async function init() {
@@ -52,12 +53,21 @@ export default function MySlotsPage() {
         if (!mine) return toast.error('Doctor profile not found. Contact admin.')
         setDoctor(mine)
         fetchSlots(mine.id)
+        doctorAPI.getNotifications(mine.id).then(({ data }) => setNotifyMode(data.mode)).catch(() => {})
       } catch { toast.error('Failed to load data') }
       finally { setLoading(false) }
     }
     init()
   }, [user.user_id])
 
+  const handleNotifyMode = async (mode) => {
+    try {
+      await doctorAPI.setNotifications(doctor.id, mode)
+      setNotifyMode(mode)
+      toast.success('Email preference saved')
+    } catch { toast.error('Failed to save preference') }
+  }
+
   const fetchSlots = async (doctorId) => {
     const { data } = await slotAPI.list(doctorId)
     setSlots(data)
@@ -68,8 +78,17 @@ export default function MySlotsPage() {
     if (!doctor) return
     setAdding(true)
     try {
-      await slotAPI.createBulk(doctor.id, bulkForm)
-      toast.success('Slots generated successfully!')
+      const { weeks, ...rule } = bulkForm
+      const until = new Date()
+      until.setDate(until.getDate() + weeks * 7)
+      await scheduleAPI.createRule(doctor.id, {
+        ...rule,
+        // "None" in the lunch pickers means no lunch break
+        lunch_start: rule.lunch_start || null,
+        lunch_end: rule.lunch_end || null,
+        valid_until: until.toISOString().split('T')[0],
+      })
+      toast.success('Schedule saved!')
       fetchSlots(doctor.id)
       setShowForm(false)
     } catch (err) {
@@ -79,11 +98,18 @@ export default function MySlotsPage() {
     }
   }
 
-  const handleDelete = async (slotId) => {
+  const handleDelete = async (slot) => {
     if (!confirm('Delete this slot?')) return
     try {
-      await slotAPI.delete(doctor.id, slotId)
-      setSlots(prev => prev.filter(s => s.id !== slotId))
+      if (slot.id) {
+        await slotAPI.delete(doctor.id, slot.id)
+      } else {
+        // Generated from the schedule: block that time instead
+        await scheduleAPI.addException(doctor.id, {
+          exc_date: slot.slot_date, start_time: slot.start_time, end_time: slot.end_time,
+        })
+      }
+      setSlots(prev => prev.filter(s => s !== slot))
       toast.success('Slot deleted')
     } catch (err) {
       toast.error(err.response?.data?.detail || 'Cannot delete booked slot')
@@ -116,6 +142,17 @@ export default function MySlotsPage() {
           <p className="page-subtitle">Manage your available appointment slots (30 min each)</p>
         </div>
         <div style={{ display: 'flex', gap: 12 }}>
+          <select
+            className="form-control"
+            style={{ width: 'auto' }}
+            value={notifyMode}
+            onChange={e => handleNotifyMode(e.target.value)}
+            title="How booking emails reach you"
+          >
+            <option value="immediate">Email me every booking</option>
+            <option value="hourly">Hourly digest</option>
+            <option value="daily">Daily digest</option>
+          </select>
           <button className="btn btn-danger btn-outline" onClick={handleClearFuture} title="Clear all future unbooked slots">
             🗑️ Clear Future
           </button>
@@ -240,7 +277,7 @@ export default function MySlotsPage() {
               <div style={{ display: 'flex', flexWrap: 'wrap', gap: 10 }}>
                 {dateSlots.map(slot => (
                   <div
-                    key={slot.id}
+                    key={`${slot.slot_date} ${slot.start_time}`}
                     style={{
                       display: 'flex', alignItems: 'center', gap: 8,
                       padding: '9px 16px',
@@ -256,7 +293,7 @@ export default function MySlotsPage() {
                       <span style={{ fontSize: 11, background: 'var(--teal)', color: '#fff', padding: '2px 7px', borderRadius: 10, fontWeight: 600 }}>BOOKED</span>
                     ) : (
                       <button
-                        onClick={() => handleDelete(slot.id)}
+                        onClick={() => handleDelete(slot)}
                         style={{ background: 'none', border: 'none', cursor: 'pointer', color: 'var(--red)', fontSize: 16, lineHeight: 1, padding: '0 2px' }}
                         title="Delete slot"
                       >×</button>
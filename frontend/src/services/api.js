@@ -24,6 +24,20 @@ api.interceptors.response.use(
   }
 )
 
+// Sends one user action under a single Idempotency-Key. Network failures are
+// retried with the same key, so the server replays the first outcome instead
+// of booking or cancelling twice.
+const idempotent = async (send, key = crypto.randomUUID(), retries = 2) => {
+  for (let attempt = 0; ; attempt++) {
+    try {
+      return await send({ headers: { 'Idempotency-Key': key } })
+    } catch (err) {
+      if (err.response || attempt >= retries) throw err
+      await new Promise(resolve => setTimeout(resolve, 500 * 2 ** attempt))
+    }
+  }
+}
+
 // ── Auth ──
 export const authAPI = {
   register: (data) => api.post('/auth/register', data),
@@ -44,6 +58,9 @@ export const doctorAPI = {
   get: (id) => api.get(`/doctors/${id}`),
   create: (data) => api.post('/doctors', data),
   update: (id, data) => api.put(`/doctors/${id}`, data),
+  agenda: (id, params) => api.get(`/doctors/${id}/agenda`, { params }),
+  getNotifications: (id) => api.get(`/doctors/${id}/notifications`),
+  setNotifications: (id, mode) => api.put(`/doctors/${id}/notifications`, { mode }),
 }
 
 // ── Slots ──
@@ -53,15 +70,37 @@ export const slotAPI = {
   createBulk: (doctorId, data) => api.post(`/doctors/${doctorId}/slots/bulk`, data),
   delete: (doctorId, slotId) => api.delete(`/doctors/${doctorId}/slots/${slotId}`),
   clearFuture: (doctorId) => api.delete(`/doctors/${doctorId}/slots/future`),
+  events: (doctorId) => new EventSource(`/api/doctors/${doctorId}/slots/events`),
+}
+
+// ── Schedule rules ──
+export const scheduleAPI = {
+  listRules: (doctorId) => api.get(`/doctors/${doctorId}/schedule`),
+  createRule: (doctorId, data) => api.post(`/doctors/${doctorId}/schedule`, data),
+  deleteRule: (doctorId, ruleId) => api.delete(`/doctors/${doctorId}/schedule/${ruleId}`),
+  listExceptions: (doctorId) => api.get(`/doctors/${doctorId}/schedule/exceptions`),
+  addException: (doctorId, data) => api.post(`/doctors/${doctorId}/schedule/exceptions`, data),
+  deleteException: (doctorId, excId) => api.delete(`/doctors/${doctorId}/schedule/exceptions/${excId}`),
 }
 
 // ── Appointments ──
 export const appointmentAPI = {
-  book: (data) => api.post('/appointments', data),
+  // Pass the same key when the user retries so the server replays instead of repeating
+  book: (data, key) => idempotent((config) => api.post('/appointments', data, config), key),
   my: () => api.get('/appointments/my'),
   all: () => api.get('/appointments/all'),
-  cancel: (id) => api.put(`/appointments/${id}/cancel`),
+  cancel: (id, key) => idempotent((config) => api.put(`/appointments/${id}/cancel`, null, config), key),
+  reschedule: (id, data, key) => idempotent((config) => api.put(`/appointments/${id}/reschedule`, data, config), key),
   complete: (id, data) => api.put(`/appointments/${id}/complete`, data),
+  calendarFeed: () => api.get('/calendar/feed'),
+  resetCalendarFeed: () => api.post('/calendar/feed/reset'),
+}
+
+// ── Waitlist ──
+export const waitlistAPI = {
+  join: (data) => api.post('/waitlist', data),
+  my: () => api.get('/waitlist/my'),
+  leave: (id) => api.delete(`/waitlist/${id}`),
 }
 
 // ── Users ──
@@ -69,6 +108,12 @@ export const userAPI = {
   list: () => api.get('/users'),
 }
 
+// ── Analytics (admin) ──
+export const analyticsAPI = {
+  summary: (params) => api.get('/admin/analytics', { params }),
+  rebuild: (params) => api.post('/admin/analytics/rebuild', null, { params }),
+}
+
 // ── Chat ──
 export const chatAPI = {
   ask: (message) => api.post('/chat', { message }),